@@ -0,0 +1,67 @@
+import json
+import random
+from typing import Iterator
+
+from winter_supplement_engine.rules import MAX_CHILDREN
+
+def valid_inputs(count: int, seed: int = 0) -> Iterator[dict]:
+    """Generate valid WinterSupplementInput dicts"""
+    rng = random.Random(seed)
+    for index in range(count):
+        yield {
+            "id": f"{seed}-{index}",
+            "numberOfChildren": rng.randint(0, 6) if rng.random() < 0.95 else rng.randint(0, MAX_CHILDREN),
+            "familyComposition": rng.choice(("single", "couple")),
+            "familyUnitInPayForDecember": rng.random() < 0.8
+        }
+
+def invalid_inputs(count: int, seed: int = 0) -> Iterator[dict]:
+    """Generate well-formed JSON objects that fail validation"""
+    rng = random.Random(seed)
+    for data in valid_inputs(count, seed):
+        problem = rng.randrange(5)
+        if problem == 0:
+            del data[rng.choice(list(data))]
+        elif problem == 1:
+            data["numberOfChildren"] = rng.choice((-1, MAX_CHILDREN + 1, "2", 1.5))
+        elif problem == 2:
+            data["familyComposition"] = rng.choice(("invalid", "", 1))
+        elif problem == 3:
+            data["familyUnitInPayForDecember"] = rng.choice(("true", 1, None))
+        else:
+            data["id"] = rng.randint(0, 1000)
+        yield data
+
+def malformed_payloads(count: int, seed: int = 0) -> Iterator[bytes]:
+    """Generate payloads that aren't valid JSON"""
+    rng = random.Random(seed)
+    for payload in payloads(valid_inputs(count, seed)):
+        cut = rng.randrange(1, len(payload))
+        yield rng.choice((payload[:cut], payload.replace(b'"', b"'"), b"{ invalid json }", b"\xff\xfe"))
+
+def payloads(inputs) -> Iterator[bytes]:
+    """Serialize input dicts the way an MQTT client would send them"""
+    for data in inputs:
+        yield json.dumps(data).encode()
+
+def duplicated_payloads(count: int, duplicates: float = 0.5, seed: int = 0) -> list[bytes]:
+    """Valid payloads where a share are repeats of earlier ones, like client retries"""
+    rng = random.Random(seed)
+    mix = []
+    for payload in payloads(valid_inputs(count, seed)):
+        mix.append(rng.choice(mix) if mix and rng.random() < duplicates else payload)
+    return mix
+
+def mixed_payloads(count: int, valid: float = 0.7, invalid: float = 0.2, seed: int = 0) -> list[bytes]:
+    """Shuffle valid, invalid and malformed payloads in the given proportions"""
+    valid_count = int(count * valid)
+    invalid_count = int(count * invalid)
+    malformed_count = count - valid_count - invalid_count
+
+    mix = [
+        *payloads(valid_inputs(valid_count, seed)),
+        *payloads(invalid_inputs(invalid_count, seed + 1)),
+        *malformed_payloads(malformed_count, seed + 2),
+    ]
+    random.Random(seed).shuffle(mix)
+    return mix
@@ -0,0 +1,272 @@
+"""Throughput and latency benchmarks for the rules and engine hot paths.
+
+Run with `poetry run python -m benchmarks.run`, results are written as JSON so
+runs from different commits can be compared with `--compare`.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import paho.mqtt.client as mqtt
+
+from benchmarks.payloads import duplicated_payloads, invalid_inputs, mixed_payloads, payloads, valid_inputs
+
+# engine settings used when the environment doesn't provide them
+BENCHMARK_ENV = {
+    "MQTT_BROKER": "localhost",
+    "MQTT_BROKER_PORT": "1883",
+    "MQTT_INPUT_TOPIC_PREFIX": "BRE/calculateWinterSupplementInput",
+    "MQTT_OUTPUT_TOPIC_PREFIX": "BRE/calculateWinterSupplementOutput",
+}
+
+BENCHMARKS = {}
+
+def benchmark(name):
+    """Register a setup function returning the callable to measure and its inputs"""
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+class FakeClient:
+    """Stand-in for paho's client that only counts publishes"""
+
+    def __init__(self):
+        self.published = 0
+        # the engine checks every publish was accepted, one shared info keeps that cheap
+        self.info = mqtt.MQTTMessageInfo(0)
+        self.info.rc = mqtt.MQTT_ERR_SUCCESS
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        self.published += 1
+        return self.info
+
+class FakeMessage:
+    """Stand-in for paho's MQTTMessage"""
+
+    __slots__ = ("topic", "payload", "properties")
+
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+        self.properties = None
+
+def make_engine():
+    for name, value in BENCHMARK_ENV.items():
+        os.environ.setdefault(name, value)
+    from winter_supplement_engine.engine import WinterSupplementEngine
+    return WinterSupplementEngine()
+
+@benchmark("validate_input/valid")
+def bench_validate_valid(count, seed):
+    from winter_supplement_engine.rules import validate_input
+    return validate_input, list(valid_inputs(count, seed))
+
+@benchmark("validate_input/invalid")
+def bench_validate_invalid(count, seed):
+    from winter_supplement_engine.rules import validate_input
+    return validate_input, list(invalid_inputs(count, seed))
+
+@benchmark("calculate_supplement")
+def bench_calculate(count, seed):
+    from winter_supplement_engine.rules import calculate_supplement
+    return calculate_supplement, list(valid_inputs(count, seed))
+
+@benchmark("process_supplement_request/valid")
+def bench_process_valid(count, seed):
+    from winter_supplement_engine.rules import process_supplement_request
+    return process_supplement_request, list(payloads(valid_inputs(count, seed)))
+
+@benchmark("process_supplement_request/mixed")
+def bench_process_mixed(count, seed):
+    from winter_supplement_engine.rules import process_supplement_request
+    return process_supplement_request, mixed_payloads(count, seed=seed)
+
+@benchmark("process_supplement_request/table+codec")
+def bench_process_table_codec(count, seed):
+    from winter_supplement_engine.codec import get_codec
+    from winter_supplement_engine.rules import process_supplement_request
+    from winter_supplement_engine.table import SupplementTable
+    table = SupplementTable()
+    codec = get_codec()
+    return (
+        lambda payload: process_supplement_request(payload, table=table, codec=codec),
+        mixed_payloads(count, seed=seed)
+    )
+
+@benchmark("on_message/valid")
+def bench_on_message_valid(count, seed):
+    engine = make_engine()
+    client = FakeClient()
+    messages = [
+        FakeMessage(f"{engine.mqtt_input_topic_prefix}/{index % 100}", payload)
+        for index, payload in enumerate(payloads(valid_inputs(count, seed)))
+    ]
+    return lambda message: engine.on_message(client, None, message), messages
+
+@benchmark("on_message/mixed")
+def bench_on_message_mixed(count, seed):
+    engine = make_engine()
+    client = FakeClient()
+    messages = [
+        FakeMessage(f"{engine.mqtt_input_topic_prefix}/{index % 100}", payload)
+        for index, payload in enumerate(mixed_payloads(count, seed=seed))
+    ]
+    return lambda message: engine.on_message(client, None, message), messages
+
+@benchmark("on_message/duplicates+cache")
+def bench_on_message_duplicates(count, seed):
+    from winter_supplement_engine.cache import ResultCache
+    engine = make_engine()
+    engine.result_cache = ResultCache(10000)
+    client = FakeClient()
+    messages = [
+        FakeMessage(f"{engine.mqtt_input_topic_prefix}/{index % 100}", payload)
+        for index, payload in enumerate(duplicated_payloads(count, seed=seed))
+    ]
+    return lambda message: engine.on_message(client, None, message), messages
+
+@benchmark("on_message/valid+admission")
+def bench_on_message_admission(count, seed):
+    from winter_supplement_engine.admission import RateLimiter
+    engine = make_engine()
+    # high enough that nothing is limited, this measures the cost of the check
+    engine.rate_limiter = RateLimiter(rate=1e9)
+    client = FakeClient()
+    messages = [
+        FakeMessage(f"{engine.mqtt_input_topic_prefix}/{index % 100}", payload)
+        for index, payload in enumerate(payloads(valid_inputs(count, seed)))
+    ]
+    return lambda message: engine.on_message(client, None, message), messages
+
+@benchmark("on_message/binary")
+def bench_on_message_binary(count, seed):
+    from winter_supplement_engine import wire
+    engine = make_engine()
+    client = FakeClient()
+    messages = []
+    for index, data in enumerate(valid_inputs(count, seed)):
+        message = FakeMessage(f"{engine.mqtt_input_topic_prefix}/{index % 100}", wire.encode_inputs([data]))
+        message.properties = wire.REPLY_PROPERTIES
+        messages.append(message)
+    return lambda message: engine.on_message(client, None, message), messages
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+def measure(fn, items, repeat):
+    """Measure throughput over tight loops, then per-call latency in a separate pass"""
+    # warm up caches and lazy initialization
+    for item in items[:100]:
+        fn(item)
+
+    rates = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            fn(item)
+        rates.append(len(items) / (time.perf_counter() - start))
+
+    latencies = []
+    clock = time.perf_counter_ns
+    for item in items:
+        start = clock()
+        fn(item)
+        latencies.append(clock() - start)
+    latencies.sort()
+
+    return {
+        "count": len(items),
+        "repeat": repeat,
+        "ops_per_sec": max(rates),
+        "ops_per_sec_median": statistics.median(rates),
+        "latency_us": {
+            "mean": statistics.fmean(latencies) / 1000,
+            "p50": percentile(latencies, 0.50) / 1000,
+            "p90": percentile(latencies, 0.90) / 1000,
+            "p99": percentile(latencies, 0.99) / 1000,
+            "max": latencies[-1] / 1000,
+        },
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(count, seed, repeat, only=None):
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if only and not any(pattern in name for pattern in only):
+            continue
+        fn, items = setup(count, seed)
+        results[name] = measure(fn, items, repeat)
+        print(f"{name}: {results[name]['ops_per_sec']:,.0f} ops/s", file=sys.stderr)
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "count": count,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+def compare(report, baseline, threshold):
+    """Print throughput changes against a baseline report, return the regressed benchmarks"""
+    regressions = []
+    for name, result in report["results"].items():
+        previous = baseline["results"].get(name)
+        if previous is None:
+            continue
+        change = result["ops_per_sec"] / previous["ops_per_sec"] - 1
+        flag = ""
+        if change < -threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name}: {change:+.1%} ops/s{flag}", file=sys.stderr)
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=20000, help="payloads per benchmark")
+    parser.add_argument("--repeat", type=int, default=3, help="throughput passes per benchmark")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the payload generators")
+    parser.add_argument("--only", action="append", help="only run benchmarks whose name contains this")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--compare", help="baseline JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="throughput drop that counts as a regression")
+    args = parser.parse_args(argv)
+
+    report = run(args.count, args.seed, args.repeat, args.only)
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(report, json.load(baseline_file), args.threshold)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
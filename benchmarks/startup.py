@@ -0,0 +1,146 @@
+"""Import-time and startup benchmarks for short-lived engine processes.
+
+Run with `poetry run python -m benchmarks.startup`, every sample is a fresh
+interpreter so nothing is cached between runs. Results are written as JSON and
+can be compared with `--compare` like the throughput benchmarks.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+from benchmarks.run import BENCHMARK_ENV, git_commit
+
+# code run in the child, it prints how long the measured part took in milliseconds
+STARTUP_BENCHMARKS = {
+    "import/engine": "import winter_supplement_engine.engine",
+    "import/async_engine": "import winter_supplement_engine.async_engine",
+    "import/rules": "import winter_supplement_engine.rules",
+    "engine/init": (
+        "from winter_supplement_engine.engine import WinterSupplementEngine\n"
+        "WinterSupplementEngine()"
+    ),
+}
+
+CHILD = """\
+import time
+start = time.perf_counter()
+{code}
+print((time.perf_counter() - start) * 1000)
+"""
+
+def child_env():
+    env = dict(os.environ)
+    for name, value in BENCHMARK_ENV.items():
+        env.setdefault(name, value)
+    # import from this checkout even when the package isn't installed
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [root, env.get("PYTHONPATH")]))
+    return env
+
+def sample(code, env):
+    """Run code in a fresh interpreter, return (in-process ms, whole process ms)"""
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD.format(code=code)],
+        capture_output=True, text=True, check=True, env=env
+    ).stdout
+    elapsed = (time.perf_counter() - start) * 1000
+    return float(output.strip().splitlines()[-1]), elapsed
+
+def measure(code, repeat, env):
+    # the first run writes bytecode caches, keep it out of the results
+    sample(code, env)
+    inside, process = zip(*(sample(code, env) for _ in range(repeat)))
+    return {
+        "repeat": repeat,
+        "ms": statistics.median(inside),
+        "ms_min": min(inside),
+        "process_ms": statistics.median(process),
+    }
+
+def import_profile(module, env, top):
+    """Return the modules with the largest cumulative import time, in microseconds"""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True, env=env
+    ).stderr
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules.append((int(cumulative), name.strip()))
+    modules.sort(reverse=True)
+    return {name: cumulative for cumulative, name in modules[:top]}
+
+def run(repeat, only=None):
+    env = child_env()
+    results = {"interpreter": measure("pass", repeat, env)}
+    print(f"interpreter: {results['interpreter']['process_ms']:.1f} ms", file=sys.stderr)
+    for name, code in STARTUP_BENCHMARKS.items():
+        if only and not any(pattern in name for pattern in only):
+            continue
+        results[name] = measure(code, repeat, env)
+        print(f"{name}: {results[name]['ms']:.1f} ms", file=sys.stderr)
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": repeat,
+        },
+        "results": results,
+        "imports": import_profile("winter_supplement_engine.engine", env, top=15),
+    }
+
+def compare(report, baseline, threshold):
+    """Print startup time changes against a baseline report, return the regressed benchmarks"""
+    regressions = []
+    for name, result in report["results"].items():
+        previous = baseline["results"].get(name)
+        if previous is None:
+            continue
+        change = result["ms"] / previous["ms"] - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name}: {change:+.1%} ms{flag}", file=sys.stderr)
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10, help="fresh interpreters per benchmark")
+    parser.add_argument("--only", action="append", help="only run benchmarks whose name contains this")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--compare", help="baseline JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="startup time increase that counts as a regression")
+    args = parser.parse_args(argv)
+
+    report = run(args.repeat, args.only)
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(report, json.load(baseline_file), args.threshold)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+import json
+import os
+import pytest
+import sys
+import threading
+from unittest.mock import Mock, patch
+from winter_supplement_engine import metrics
+from winter_supplement_engine.admission import FairQueue, RateLimiter, topic_tenant
+from winter_supplement_engine.engine import WinterSupplementEngine
+
+PAYLOAD = json.dumps({
+    "id": "1",
+    "numberOfChildren": 0,
+    "familyComposition": "single",
+    "familyUnitInPayForDecember": True
+})
+
+@pytest.fixture()
+def mock_env_vars():
+    """
+    Mock environment variables with a rate limit of 2 messages a second per tenant
+    """
+    env_vars = {
+        "MQTT_BROKER": "test.mosquitto.org",
+        "MQTT_BROKER_PORT": "1883",
+        "MQTT_INPUT_TOPIC_PREFIX": "BRE/calculateWinterSupplementInput",
+        "MQTT_OUTPUT_TOPIC_PREFIX": "BRE/calculateWinterSupplementOutput",
+        "ADMISSION_RATE": "2",
+    }
+    with patch.dict(os.environ, env_vars, clear=True), \
+         patch('winter_supplement_engine.engine.load_dotenv'):
+        yield env_vars
+
+def make_message(tenant):
+    message = Mock()
+    message.topic = f"BRE/calculateWinterSupplementInput/{tenant}"
+    message.payload = PAYLOAD.encode()
+    return message
+
+def test_topic_tenant():
+    """
+    Test that the tenant is the topic id at the end of the topic
+    """
+    assert topic_tenant("BRE/calculateWinterSupplementInput/abc") == "abc"
+
+def test_rate_limiter_allows_burst_then_refills():
+    """
+    Test that a tenant can use its burst, is limited after it and gets tokens back over time
+    """
+    limiter = RateLimiter(rate=2, burst=3)
+    assert [limiter.allow("a", now=0) for _ in range(4)] == [True, True, True, False]
+    # other tenants have their own bucket
+    assert limiter.allow("b", now=0)
+    assert not limiter.allow("a", now=0.4)
+    assert limiter.allow("a", now=0.5)
+    assert not limiter.allow("a", now=0.5)
+
+def test_rate_limiter_drops_idle_buckets():
+    """
+    Test that buckets that refilled completely are dropped once max_tenants is reached
+    """
+    limiter = RateLimiter(rate=1, burst=1, max_tenants=2)
+    limiter.allow("idle", now=0)
+    limiter.allow("busy", now=0)
+    limiter.allow("busy", now=1)
+    limiter.allow("new", now=1.5)
+    assert len(limiter) == 2
+    assert not limiter.allow("busy", now=1.5)
+
+def test_fair_queue_takes_turns():
+    """
+    Test that a tenant with a backlog doesn't hold up messages from other tenants
+    """
+    queue = FairQueue(capacity=10)
+    for index in range(4):
+        queue.put("noisy", index)
+    queue.put("quiet", "q")
+    taken = [queue.get() for _ in range(5)]
+    assert taken == [("noisy", 0), ("quiet", "q"), ("noisy", 1), ("noisy", 2), ("noisy", 3)]
+
+def test_fair_queue_sheds_newest():
+    """
+    Test that the newest policy drops the incoming message when the queue is full
+    """
+    queue = FairQueue(capacity=2, policy="newest")
+    queue.put("a", 1)
+    queue.put("a", 2)
+    assert queue.put("b", 3) == ("b", 3)
+    assert len(queue) == 2
+
+def test_fair_queue_sheds_from_largest_tenant():
+    """
+    Test that the largest policy makes room by dropping the oldest message of the biggest backlog
+    """
+    queue = FairQueue(capacity=3, policy="largest")
+    queue.put("noisy", 1)
+    queue.put("noisy", 2)
+    queue.put("quiet", 3)
+    assert queue.put("quiet", 4) == ("noisy", 1)
+    assert [queue.get() for _ in range(3)] == [("noisy", 2), ("quiet", 3), ("quiet", 4)]
+
+def test_fair_queue_get_returns_none_when_closed():
+    """
+    Test that get drains the queue after close and then returns None
+    """
+    queue = FairQueue(capacity=2)
+    queue.put("a", 1)
+    queue.close()
+    assert queue.get() == ("a", 1)
+    assert queue.get() is None
+
+def test_fair_queue_rejects_invalid_settings():
+    """
+    Test that invalid capacities and policies raise ValueError
+    """
+    with pytest.raises(ValueError):
+        FairQueue(capacity=0)
+    with pytest.raises(ValueError):
+        FairQueue(capacity=1, policy="random")
+
+def test_engine_drops_messages_over_rate(mock_env_vars):
+    """
+    Test that a tenant over its rate is dropped without affecting other tenants
+    """
+    engine = WinterSupplementEngine()
+    client = Mock()
+    limited = metrics.RATE_LIMITED.value
+
+    for _ in range(5):
+        engine.on_message(client, None, make_message("noisy"))
+    engine.on_message(client, None, make_message("quiet"))
+
+    published = [call.args[0] for call in client.publish.call_args_list]
+    assert published.count("BRE/calculateWinterSupplementOutput/noisy") == 2
+    assert published.count("BRE/calculateWinterSupplementOutput/quiet") == 1
+    assert metrics.RATE_LIMITED.value - limited == 3
+
+def test_engine_admission_queue_feeds_worker_pool(mock_env_vars):
+    """
+    Test that queued messages are processed by the worker pool once the dispatcher runs
+    """
+    with patch.dict(os.environ, {"ENGINE_WORKER_MODE": "thread", "ADMISSION_QUEUE_SIZE": "10", "ADMISSION_RATE": "100"}):
+        engine = WinterSupplementEngine()
+    client = Mock()
+    published = threading.Event()
+    client.publish.side_effect = lambda *args, **kwargs: published.set()
+
+    engine.on_message(client, None, make_message("a"))
+    assert len(engine.admission_queue) == 1
+
+    engine.start_admission()
+    assert published.wait(5)
+    engine.admission_queue.close()
+    engine.admission_thread.join(5)
+    engine.worker_pool.shutdown()
+    assert client.publish.call_args.args[0] == "BRE/calculateWinterSupplementOutput/a"
+
+def test_engine_admission_queue_needs_worker_pool(mock_env_vars):
+    """
+    Test that an admission queue without a worker pool is rejected
+    """
+    with patch.dict(os.environ, {"ADMISSION_QUEUE_SIZE": "10"}):
+        with pytest.raises(ValueError):
+            WinterSupplementEngine()
+
+def test_rate_limiter_is_safe_across_threads():
+    """
+    Test that connections of a pool can share the limiter while buckets are created and evicted
+    """
+    limiter = RateLimiter(rate=1000, burst=1, max_tenants=50)
+    errors = []
+
+    def allow_many(thread_index):
+        try:
+            for index in range(2000):
+                limiter.allow(f"{thread_index}-{index}")
+        except Exception as e:
+            errors.append(e)
+
+    # switch threads as often as possible so eviction overlaps other threads' inserts
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=allow_many, args=(index,)) for index in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+    assert errors == []
+    assert len(limiter) <= 50
@@ -0,0 +1,124 @@
+import asyncio
+import json
+import os
+import pytest
+import threading
+from unittest.mock import Mock, patch
+from winter_supplement_engine.async_engine import AsyncWinterSupplementEngine
+
+@pytest.fixture()
+def mock_env_vars():
+    """
+    Mock environment variables without a TOPIC ID
+    """
+    env_vars = {
+        "MQTT_BROKER": "test.mosquitto.org",
+        "MQTT_BROKER_PORT": "1883",
+        "MQTT_INPUT_TOPIC_PREFIX": "BRE/calculateWinterSupplementInput",
+        "MQTT_OUTPUT_TOPIC_PREFIX": "BRE/calculateWinterSupplementOutput",
+    }
+    with patch.dict(os.environ, env_vars, clear=True), \
+         patch('winter_supplement_engine.engine.load_dotenv'):
+        yield env_vars
+
+@pytest.fixture
+def mock_mqtt_client():
+    """
+    Mock the MQTT client
+    """
+    with patch('paho.mqtt.client.Client', autospec=True) as mock_client:
+        client_instance = Mock()
+        client_instance.socket.return_value = None
+        mock_client.return_value = client_instance
+        yield client_instance
+
+def make_message(topic_id, number_of_children=1):
+    message = Mock()
+    message.topic = f"BRE/calculateWinterSupplementInput/{topic_id}"
+    message.payload = json.dumps({
+        "id": topic_id,
+        "numberOfChildren": number_of_children,
+        "familyComposition": "couple",
+        "familyUnitInPayForDecember": True
+    }).encode()
+    return message
+
+def test_async_engine_concurrency_from_env(mock_env_vars, mock_mqtt_client):
+    """
+    Test that the concurrency limit is read from the environment
+    """
+    with patch.dict(os.environ, {"ENGINE_CONCURRENCY": "8"}):
+        assert AsyncWinterSupplementEngine().concurrency == 8
+    assert AsyncWinterSupplementEngine(concurrency=2).concurrency == 2
+    with pytest.raises(ValueError):
+        AsyncWinterSupplementEngine(concurrency=0)
+
+def test_async_engine_publishes_results(mock_env_vars, mock_mqtt_client):
+    """
+    Test that messages are processed on the event loop and published to their output topics
+    """
+    engine = AsyncWinterSupplementEngine()
+
+    async def scenario():
+        async with engine:
+            for topic_id in ("a", "b", "c"):
+                engine.on_message(mock_mqtt_client, None, make_message(topic_id))
+
+    asyncio.run(scenario())
+
+    mock_mqtt_client.connect.assert_called_once_with("test.mosquitto.org", 1883)
+    mock_mqtt_client.disconnect.assert_called_once()
+    published = {call[0][0]: json.loads(call[0][1]) for call in mock_mqtt_client.publish.call_args_list}
+    assert set(published) == {f"BRE/calculateWinterSupplementOutput/{topic_id}" for topic_id in ("a", "b", "c")}
+    assert all(result["supplementAmount"] == 140.0 for result in published.values())
+
+def test_async_engine_connects_off_the_event_loop(mock_env_vars, mock_mqtt_client):
+    """
+    Test that the blocking connect runs on another thread and its socket callbacks come back to the event loop
+    """
+    engine = AsyncWinterSupplementEngine()
+    threads = {}
+
+    def socket_callback():
+        threads["callback"] = threading.get_ident()
+
+    def connect(host, port):
+        threads["connect"] = threading.get_ident()
+        engine.on_loop(socket_callback)()
+
+    mock_mqtt_client.connect.side_effect = connect
+
+    async def scenario():
+        threads["loop"] = threading.get_ident()
+        async with engine:
+            await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+
+    assert threads["connect"] != threads["loop"]
+    assert threads["callback"] == threads["loop"]
+
+def test_async_engine_pauses_reading_at_concurrency_limit(mock_env_vars, mock_mqtt_client):
+    """
+    Test that reading stops when the concurrency limit is reached and resumes after
+    """
+    engine = AsyncWinterSupplementEngine(concurrency=2)
+    sock = Mock()
+    mock_mqtt_client.socket.return_value = sock
+
+    async def scenario():
+        engine.loop = asyncio.get_running_loop()
+        with patch.object(engine.loop, 'add_reader') as add_reader, \
+             patch.object(engine.loop, 'remove_reader') as remove_reader:
+            engine.on_message(mock_mqtt_client, None, make_message("a"))
+            assert not engine.reading_paused
+            engine.on_message(mock_mqtt_client, None, make_message("b"))
+            assert engine.reading_paused
+            remove_reader.assert_called_once_with(sock)
+
+            await asyncio.gather(*engine.tasks)
+            assert not engine.reading_paused
+            add_reader.assert_called_once_with(sock, mock_mqtt_client.loop_read)
+
+    asyncio.run(scenario())
+    assert mock_mqtt_client.publish.call_count == 2
@@ -0,0 +1,55 @@
+import json
+from benchmarks.payloads import invalid_inputs, malformed_payloads, mixed_payloads, valid_inputs
+from benchmarks.run import BENCHMARKS, compare, run
+from winter_supplement_engine import metrics
+from winter_supplement_engine.rules import check_input, process_supplement_request
+
+def test_payload_generators():
+    """
+    Test that the generators produce valid, invalid and malformed payloads
+    """
+    assert all(check_input(data) == [] for data in valid_inputs(200))
+    assert all(check_input(data) != [] for data in invalid_inputs(200))
+    for payload in malformed_payloads(200):
+        try:
+            json.loads(payload)
+        except ValueError:
+            continue
+        raise AssertionError(f"payload should be malformed: {payload!r}")
+
+def test_mixed_payloads_proportions():
+    """
+    Test that mixed payloads have the requested size and are reproducible
+    """
+    mix = mixed_payloads(100, valid=0.5, invalid=0.3)
+    assert len(mix) == 100
+    assert mix == mixed_payloads(100, valid=0.5, invalid=0.3)
+
+def test_benchmark_report():
+    """
+    Test that every benchmark runs and the report is JSON serializable
+    """
+    report = run(count=200, seed=0, repeat=1)
+    assert "on_message/mixed" in report["results"]
+    assert all(result["ops_per_sec"] > 0 for result in report["results"].values())
+    json.dumps(report)
+
+    # a report compared with itself has no regressions
+    assert compare(report, report, threshold=0.1) == []
+
+def test_on_message_benchmarks_publish_every_result():
+    """
+    Test that the on_message benchmarks time messages that are answered, not the error path
+    """
+    for name in [name for name in BENCHMARKS if name.startswith("on_message/")]:
+        fn, messages = BENCHMARKS[name](200, 0)
+        if name == "on_message/mixed":
+            expected = sum(process_supplement_request(message.payload) is not None for message in messages)
+        else:
+            expected = len(messages)
+        failed = metrics.FAILED_ERROR.value
+        published = metrics.MESSAGES_PUBLISHED.value
+        for message in messages:
+            fn(message)
+        assert metrics.FAILED_ERROR.value == failed, name
+        assert metrics.MESSAGES_PUBLISHED.value - published == expected, name
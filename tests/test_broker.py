@@ -0,0 +1,346 @@
+import asyncio
+import json
+import os
+import socket
+import threading
+import time
+import pytest
+import paho.mqtt.client as mqtt
+from paho.mqtt.enums import CallbackAPIVersion
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+from unittest.mock import patch
+from winter_supplement_engine import metrics, wire
+from winter_supplement_engine.async_engine import AsyncWinterSupplementEngine
+from winter_supplement_engine.broker import LocalBroker, strip_topic_alias, topic_matches
+from winter_supplement_engine.engine import WinterSupplementEngine
+
+VALID_PAYLOAD = json.dumps({
+    "id": "e2e",
+    "numberOfChildren": 2,
+    "familyComposition": "single",
+    "familyUnitInPayForDecember": True
+})
+
+@pytest.fixture
+def broker():
+    """
+    Start a local broker on an ephemeral port
+    """
+    with LocalBroker() as local_broker:
+        yield local_broker
+
+@pytest.fixture
+def engine_env(broker):
+    """
+    Point the engine at the local broker
+    """
+    env_vars = {
+        "MQTT_BROKER": broker.host,
+        "MQTT_BROKER_PORT": str(broker.port),
+        "MQTT_INPUT_TOPIC_PREFIX": "BRE/calculateWinterSupplementInput",
+        "MQTT_OUTPUT_TOPIC_PREFIX": "BRE/calculateWinterSupplementOutput",
+    }
+    with patch.dict(os.environ, env_vars, clear=True), \
+         patch('winter_supplement_engine.engine.load_dotenv'):
+        yield env_vars
+
+class Collector:
+    """
+    Client that records every message on the topics it subscribes to
+    """
+    def __init__(self, broker, topic, protocol=mqtt.MQTTv5, qos=0):
+        self.messages = []
+        self.received = threading.Event()
+        self.subscribed = threading.Event()
+        self.client = mqtt.Client(protocol=protocol, callback_api_version=CallbackAPIVersion.VERSION2)
+        self.client.on_connect = lambda client, userdata, flags, rc, properties=None: client.subscribe(topic, qos=qos)
+        self.client.on_subscribe = lambda *args: self.subscribed.set()
+        self.client.on_message = self.on_message
+        self.client.connect(broker.host, broker.port)
+        self.client.loop_start()
+        assert self.subscribed.wait(5)
+
+    def on_message(self, client, userdata, message):
+        self.messages.append(message)
+        self.received.set()
+
+    def close(self):
+        self.client.disconnect()
+        self.client.loop_stop()
+
+def make_publisher(broker):
+    client = mqtt.Client(protocol=mqtt.MQTTv5, callback_api_version=CallbackAPIVersion.VERSION2)
+    client.connect(broker.host, broker.port)
+    client.loop_start()
+    return client
+
+def test_topic_matches():
+    """
+    Test subscription filter matching with wildcards
+    """
+    assert topic_matches("a/+", "a/b")
+    assert not topic_matches("a/+", "a/b/c")
+    assert topic_matches("a/#", "a/b/c")
+    assert topic_matches("a/#", "a")
+    assert topic_matches("#", "a/b")
+    assert not topic_matches("#", "$SYS/uptime")
+    assert not topic_matches("a/b", "a/c")
+
+def test_strip_topic_alias():
+    """
+    Test that the topic alias is removed from publish properties and the rest is kept
+    """
+    content_type = b"\x03\x00\x04test"
+    assert strip_topic_alias(b"\x23\x00\x01" + content_type) == content_type
+    assert strip_topic_alias(content_type) == content_type
+
+@pytest.mark.parametrize("protocol", [mqtt.MQTTv5, mqtt.MQTTv311])
+def test_broker_publish_subscribe(broker, protocol):
+    """
+    Test that published messages reach wildcard subscribers at QoS 0 and 1
+    """
+    collector = Collector(broker, "a/+", protocol=protocol, qos=1)
+    publisher = make_publisher(broker)
+
+    properties = Properties(PacketTypes.PUBLISH)
+    properties.ContentType = "application/json"
+    publisher.publish("a/b", b"hello", qos=1, properties=properties).wait_for_publish(5)
+    assert collector.received.wait(5)
+
+    message = collector.messages[0]
+    assert (message.topic, message.payload, message.qos) == ("a/b", b"hello", 1)
+    if protocol == mqtt.MQTTv5:
+        assert message.properties.ContentType == "application/json"
+
+    publisher.disconnect()
+    publisher.loop_stop()
+    collector.close()
+
+def test_broker_shared_subscription(broker):
+    """
+    Test that a shared subscription group gets one copy per message, spread over its members
+    """
+    members = [Collector(broker, "$share/group/a/+") for _ in range(2)]
+    publisher = make_publisher(broker)
+    for index in range(10):
+        publisher.publish(f"a/{index}", b"x", qos=1).wait_for_publish(5)
+
+    for _ in range(50):
+        if sum(len(member.messages) for member in members) == 10:
+            break
+        threading.Event().wait(0.05)
+
+    assert [len(member.messages) for member in members] == [5, 5]
+    publisher.disconnect()
+    publisher.loop_stop()
+    for member in members:
+        member.close()
+
+def test_engine_end_to_end(broker, engine_env):
+    """
+    Test a request going through the broker, the engine and back
+    """
+    collector = Collector(broker, "BRE/calculateWinterSupplementOutput/+")
+    engine = WinterSupplementEngine()
+    thread = threading.Thread(target=engine.start)
+    thread.start()
+
+    publisher = make_publisher(broker)
+    # the engine may still be subscribing, retry until it answers
+    for _ in range(50):
+        publisher.publish("BRE/calculateWinterSupplementInput/tenant1", VALID_PAYLOAD)
+        if collector.received.wait(0.1):
+            break
+
+    engine.stop()
+    thread.join(5)
+    publisher.disconnect()
+    publisher.loop_stop()
+    collector.close()
+
+    message = collector.messages[0]
+    assert message.topic == "BRE/calculateWinterSupplementOutput/tenant1"
+    assert json.loads(message.payload)["supplementAmount"] == 160.0
+
+def test_engine_stop_publishes_results_in_progress(broker, engine_env):
+    """
+    Test that stopping the engine publishes the results of requests the workers are still on
+    """
+    collector = Collector(broker, "BRE/calculateWinterSupplementOutput/+")
+    with patch.dict(os.environ, {"ENGINE_WORKER_MODE": "thread", "ENGINE_WORKERS": "2", "ENGINE_QUEUE_SIZE": "100"}):
+        engine = WinterSupplementEngine()
+    processor = engine.request_processor
+
+    def slow_processor(properties, table, trace=None):
+        process = processor(properties, table, trace)
+        return lambda payload: time.sleep(0.05) or process(payload)
+
+    engine.request_processor = slow_processor
+    thread = threading.Thread(target=engine.start)
+    thread.start()
+
+    publisher = make_publisher(broker)
+    for _ in range(50):
+        publisher.publish("BRE/calculateWinterSupplementInput/warmup", VALID_PAYLOAD)
+        if collector.received.wait(0.1):
+            break
+    received = metrics.MESSAGES_RECEIVED.value
+    for index in range(40):
+        publisher.publish(f"BRE/calculateWinterSupplementInput/tenant{index}", VALID_PAYLOAD)
+    deadline = time.monotonic() + 5
+    while metrics.MESSAGES_RECEIVED.value < received + 40 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    engine.stop()
+    thread.join(10)
+    publisher.disconnect()
+    publisher.loop_stop()
+    # the last results may still be on their way from the broker
+    deadline = time.monotonic() + 5
+    while len({message.topic for message in collector.messages if "tenant" in message.topic}) < 40 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    collector.close()
+
+    assert not thread.is_alive()
+    assert {message.topic for message in collector.messages if "tenant" in message.topic} == {
+        f"BRE/calculateWinterSupplementOutput/tenant{index}" for index in range(40)
+    }
+
+def test_engine_end_to_end_with_batching(broker, engine_env):
+    """
+    Test that batched results reach the broker and are flushed when the engine stops
+    """
+    collector = Collector(broker, "BRE/calculateWinterSupplementOutput/+")
+    with patch.dict(os.environ, {"PUBLISH_BATCH_SIZE": "10", "PUBLISH_BATCH_DELAY_MS": "20"}):
+        engine = WinterSupplementEngine()
+    thread = threading.Thread(target=engine.start)
+    thread.start()
+
+    publisher = make_publisher(broker)
+    for _ in range(50):
+        publisher.publish("BRE/calculateWinterSupplementInput/tenant3", VALID_PAYLOAD)
+        if collector.received.wait(0.1):
+            break
+
+    engine.stop()
+    thread.join(5)
+    publisher.disconnect()
+    publisher.loop_stop()
+    collector.close()
+
+    assert collector.messages[0].topic == "BRE/calculateWinterSupplementOutput/tenant3"
+    assert engine.publisher.flushes >= 1
+
+def test_engine_replays_spool_on_connect(broker, engine_env, tmp_path):
+    """
+    Test that results spooled while disconnected are published once the engine connects
+    """
+    collector = Collector(broker, "BRE/calculateWinterSupplementOutput/+")
+    with patch.dict(os.environ, {"SPOOL_DIR": str(tmp_path)}):
+        engine = WinterSupplementEngine()
+    for index in range(100):
+        engine.publish_result(engine.client, f"BRE/calculateWinterSupplementOutput/tenant{index}", VALID_PAYLOAD)
+    assert len(engine.spool) == 100
+
+    thread = threading.Thread(target=engine.start)
+    thread.start()
+    deadline = time.monotonic() + 5
+    while len(collector.messages) < 100 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    engine.stop()
+    thread.join(5)
+    collector.close()
+
+    assert [message.topic for message in collector.messages] == [
+        f"BRE/calculateWinterSupplementOutput/tenant{index}" for index in range(100)
+    ]
+    assert len(engine.spool) == 0
+
+def test_engine_end_to_end_binary(broker, engine_env):
+    """
+    Test that a binary batch goes through the broker and comes back in binary
+    """
+    collector = Collector(broker, "BRE/calculateWinterSupplementOutput/+")
+    engine = WinterSupplementEngine()
+    thread = threading.Thread(target=engine.start)
+    thread.start()
+
+    properties = Properties(PacketTypes.PUBLISH)
+    properties.ContentType = wire.CONTENT_TYPE
+    inputs = [dict(json.loads(VALID_PAYLOAD), id=str(index)) for index in range(10)]
+    publisher = make_publisher(broker)
+    for _ in range(50):
+        publisher.publish("BRE/calculateWinterSupplementInput/tenant4", wire.encode_inputs(inputs), properties=properties)
+        if collector.received.wait(0.1):
+            break
+
+    engine.stop()
+    thread.join(5)
+    publisher.disconnect()
+    publisher.loop_stop()
+    collector.close()
+
+    message = collector.messages[0]
+    assert message.properties.ContentType == wire.CONTENT_TYPE
+    outputs = wire.decode_outputs(message.payload)
+    assert [output["id"] for output in outputs] == [str(index) for index in range(10)]
+    assert all(output["supplementAmount"] == 160.0 for output in outputs)
+
+def test_async_engine_end_to_end(broker, engine_env):
+    """
+    Test a request going through the broker, the asyncio engine and back
+    """
+    collector = Collector(broker, "BRE/calculateWinterSupplementOutput/+")
+    publisher = make_publisher(broker)
+
+    async def scenario():
+        async with AsyncWinterSupplementEngine():
+            for _ in range(50):
+                publisher.publish("BRE/calculateWinterSupplementInput/tenant2", VALID_PAYLOAD)
+                await asyncio.sleep(0.1)
+                if collector.messages:
+                    break
+
+    asyncio.run(asyncio.wait_for(scenario(), 10))
+    publisher.disconnect()
+    publisher.loop_stop()
+    collector.close()
+
+    assert collector.messages[0].topic == "BRE/calculateWinterSupplementOutput/tenant2"
+
+def test_async_engine_reconnects(broker, engine_env):
+    """
+    Test that the asyncio engine reconnects after losing its connection and keeps running until stopped
+    """
+    collector = Collector(broker, "BRE/calculateWinterSupplementOutput/+")
+    publisher = make_publisher(broker)
+    with patch.dict(os.environ, {"RECONNECT_MIN_DELAY": "0"}):
+        engine = AsyncWinterSupplementEngine()
+
+    async def request(tenant):
+        for _ in range(50):
+            publisher.publish(f"BRE/calculateWinterSupplementInput/{tenant}", VALID_PAYLOAD)
+            await asyncio.sleep(0.1)
+            if any(message.topic.endswith(tenant) for message in collector.messages):
+                return
+
+    async def scenario():
+        run = asyncio.create_task(engine.run())
+        await request("before")
+        engine.client.socket().shutdown(socket.SHUT_RDWR)
+        await asyncio.sleep(0.1)
+        assert not run.done()
+        await request("after")
+        engine.stop()
+        await run
+
+    asyncio.run(asyncio.wait_for(scenario(), 10))
+    publisher.disconnect()
+    publisher.loop_stop()
+    collector.close()
+
+    topics = [message.topic for message in collector.messages]
+    assert "BRE/calculateWinterSupplementOutput/before" in topics
+    assert "BRE/calculateWinterSupplementOutput/after" in topics
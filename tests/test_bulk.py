@@ -0,0 +1,106 @@
+import io
+import json
+import pytest
+from winter_supplement_engine.bulk import main, process_file
+from winter_supplement_engine.rules import process_supplement_request
+
+def make_record(index):
+    return {
+        "id": f"id-{index}",
+        "numberOfChildren": index % 4,
+        "familyComposition": ("single", "couple")[index % 2],
+        "familyUnitInPayForDecember": index % 3 != 0
+    }
+
+@pytest.fixture
+def jsonl_file(tmp_path):
+    """
+    Write a JSONL file with valid records, a malformed line, an invalid record and a blank line
+    """
+    lines = [json.dumps(make_record(index)) for index in range(50)]
+    lines[10] = "{not json"
+    lines[20] = json.dumps({**make_record(20), "numberOfChildren": -1})
+    lines.insert(30, "")
+    path = tmp_path / "input.jsonl"
+    path.write_text("\n".join(lines) + "\n")
+    return path
+
+def test_process_jsonl_file(jsonl_file):
+    """
+    Test that outputs match single requests, in order, and rejects carry their line number
+    """
+    output, rejects = io.StringIO(), io.StringIO()
+    counts = process_file(jsonl_file, output, rejects)
+
+    lines = jsonl_file.read_text().splitlines()
+    expected = [process_supplement_request(line) for line in lines if line]
+    assert output.getvalue().splitlines() == [result for result in expected if result is not None]
+
+    rejected = [json.loads(line) for line in rejects.getvalue().splitlines()]
+    assert [reject["line"] for reject in rejected] == [11, 21]
+    assert rejected[0]["error"] == "Invalid JSON input"
+    assert rejected[0]["input"] == "{not json"
+    assert counts == {"lines": 51, "outputs": 48, "rejects": 2}
+
+def test_process_file_in_parallel_chunks(jsonl_file):
+    """
+    Test that small chunks spread over several processes give the same output as one pass
+    """
+    output, rejects = io.StringIO(), io.StringIO()
+    process_file(jsonl_file, output, rejects)
+
+    parallel_output, parallel_rejects = io.StringIO(), io.StringIO()
+    process_file(jsonl_file, parallel_output, parallel_rejects, workers=2, chunk_size=200)
+
+    assert parallel_output.getvalue() == output.getvalue()
+    assert parallel_rejects.getvalue() == rejects.getvalue()
+
+def test_process_csv_file(tmp_path):
+    """
+    Test that CSV columns are converted to the input types before validation
+    """
+    path = tmp_path / "input.csv"
+    path.write_text(
+        "id,numberOfChildren,familyComposition,familyUnitInPayForDecember\r\n"
+        "a,2,couple,true\r\n"
+        "b,0,single,FALSE\r\n"
+        "c,two,single,true\r\n"
+        "d,0,single,maybe\r\n"
+    )
+    output, rejects = io.StringIO(), io.StringIO()
+    counts = process_file(path, output, rejects)
+
+    results = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [result["id"] for result in results] == ["a", "b"]
+    assert results[0]["supplementAmount"] == 160.0
+    assert results[1]["isEligible"] is False
+    assert [json.loads(line)["line"] for line in rejects.getvalue().splitlines()] == [4, 5]
+    assert counts["outputs"] == 2 and counts["rejects"] == 2
+
+def test_process_csv_file_with_stray_quote(tmp_path):
+    """
+    Test that an unterminated quote only rejects its own line instead of swallowing the lines after it
+    """
+    path = tmp_path / "input.csv"
+    path.write_text(
+        "id,numberOfChildren,familyComposition,familyUnitInPayForDecember\n"
+        '"bad,1,single,true\n'
+        "a,1,single,true\n"
+        '"b",1,"single",true\n'
+        "c,1,single,true\n"
+    )
+    output, rejects = io.StringIO(), io.StringIO()
+    counts = process_file(path, output, rejects)
+
+    assert [json.loads(line)["id"] for line in output.getvalue().splitlines()] == ["a", "b", "c"]
+    assert [json.loads(line)["line"] for line in rejects.getvalue().splitlines()] == [2]
+    assert counts["outputs"] == 3 and counts["rejects"] == 1
+
+def test_bulk_cli(jsonl_file, tmp_path):
+    """
+    Test that the CLI writes outputs and rejects next to each other by default
+    """
+    output_path = tmp_path / "output.jsonl"
+    assert main([str(jsonl_file), "--output", str(output_path), "--workers", "1"]) == 0
+    assert len(output_path.read_text().splitlines()) == 48
+    assert len((tmp_path / "output.jsonl.rejects.jsonl").read_text().splitlines()) == 2
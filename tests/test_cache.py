@@ -0,0 +1,91 @@
+import json
+import os
+import time
+import pytest
+from unittest.mock import Mock, patch
+from winter_supplement_engine.cache import ResultCache
+from winter_supplement_engine.engine import WinterSupplementEngine
+
+PAYLOAD = json.dumps({
+    "id": "dup",
+    "numberOfChildren": 1,
+    "familyComposition": "single",
+    "familyUnitInPayForDecember": True
+})
+
+@pytest.fixture()
+def mock_env_vars():
+    """
+    Mock environment variables with the result cache enabled
+    """
+    env_vars = {
+        "MQTT_BROKER": "test.mosquitto.org",
+        "MQTT_BROKER_PORT": "1883",
+        "MQTT_INPUT_TOPIC_PREFIX": "BRE/calculateWinterSupplementInput",
+        "MQTT_OUTPUT_TOPIC_PREFIX": "BRE/calculateWinterSupplementOutput",
+        "DEDUP_CACHE_SIZE": "100",
+    }
+    with patch.dict(os.environ, env_vars, clear=True), \
+         patch('winter_supplement_engine.engine.load_dotenv'):
+        yield env_vars
+
+def test_cache_evicts_least_recently_used():
+    """
+    Test that the cache stays within capacity by evicting the least recently used result
+    """
+    table = object()
+    cache = ResultCache(2)
+    cache.put(b"a", table, "A")
+    cache.put(b"b", table, "B")
+    assert cache.get(b"a", table) == "A"
+    cache.put(b"c", table, "C")
+
+    assert cache.get(b"b", table) is None
+    assert cache.get(b"a", table) == "A"
+    assert cache.get(b"c", table) == "C"
+    assert cache.stats() == {"size": 2, "capacity": 2, "hits": 3, "misses": 1, "evictions": 1}
+
+def test_cache_entries_expire():
+    """
+    Test that entries older than the ttl are treated as misses
+    """
+    table = object()
+    cache = ResultCache(10, ttl=0.01)
+    cache.put(b"a", table, "A")
+    time.sleep(0.02)
+    assert cache.get(b"a", table) is None
+    assert len(cache) == 0
+
+def test_cache_ignores_results_from_other_tables():
+    """
+    Test that results calculated with a previous rate table are not reused
+    """
+    cache = ResultCache(10)
+    cache.put(b"a", object(), "A")
+    assert cache.get(b"a", object()) is None
+
+def test_cache_key():
+    """
+    Test that text and bytes payloads with the same content share a key
+    """
+    assert ResultCache.key(PAYLOAD) == ResultCache.key(PAYLOAD.encode())
+    assert ResultCache.key(PAYLOAD) != ResultCache.key(PAYLOAD.replace("dup", "other"))
+
+def test_engine_answers_duplicates_from_cache(mock_env_vars):
+    """
+    Test that a repeated request is published again without being processed again
+    """
+    engine = WinterSupplementEngine()
+    client = Mock()
+    message = Mock()
+    message.topic = "BRE/calculateWinterSupplementInput/tenant"
+    message.payload = PAYLOAD.encode()
+
+    with patch('winter_supplement_engine.engine.process_supplement_request', return_value=b'{"id": "dup"}') as mock_process:
+        for _ in range(3):
+            engine.on_message(client, None, message)
+
+    mock_process.assert_called_once()
+    assert client.publish.call_count == 3
+    assert {call.args[1] for call in client.publish.call_args_list} == {b'{"id": "dup"}'}
+    assert engine.result_cache.stats()["hits"] == 2
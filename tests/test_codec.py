@@ -0,0 +1,58 @@
+import json
+import pickle
+import pytest
+from winter_supplement_engine.codec import get_codec, JsonCodec, CODECS
+from winter_supplement_engine.rules import process_supplement_request
+from winter_supplement_engine.table import SupplementTable
+
+VALID_PAYLOAD = b'{"id": "test1", "numberOfChildren": 2, "familyComposition": "couple", "familyUnitInPayForDecember": true}'
+
+INSTALLED_CODECS = [name for name, (_, available) in CODECS.items() if available]
+
+def test_get_codec_unknown():
+    """
+    Test that an unknown codec name raises ValueError
+    """
+    with pytest.raises(ValueError) as exc_info:
+        get_codec("yaml")
+    assert "Unknown codec" in str(exc_info.value)
+
+def test_get_codec_default_is_installed():
+    """
+    Test that the default codec is the fastest installed backend
+    """
+    assert get_codec().name == INSTALLED_CODECS[0]
+    assert isinstance(get_codec("json"), JsonCodec)
+
+@pytest.mark.parametrize("name", INSTALLED_CODECS)
+def test_codec_round_trip(name):
+    """
+    Test that every installed codec decodes bytes and encodes to bytes
+    """
+    codec = get_codec(name)
+    data = codec.decode(VALID_PAYLOAD)
+    assert data["numberOfChildren"] == 2
+    encoded = codec.encode(data)
+    assert isinstance(encoded, bytes)
+    assert json.loads(encoded) == data
+    # codecs are sent to worker processes
+    assert pickle.loads(pickle.dumps(codec)).decode(VALID_PAYLOAD) == data
+
+@pytest.mark.parametrize("name", INSTALLED_CODECS)
+def test_codec_invalid_payload(name):
+    """
+    Test that every installed codec raises ValueError on invalid payloads
+    """
+    with pytest.raises(ValueError):
+        get_codec(name).decode(b"{ invalid json }")
+
+@pytest.mark.parametrize("name", INSTALLED_CODECS)
+def test_process_request_with_codec(name):
+    """
+    Test that processing with a codec returns bytes with the same output
+    """
+    codec = get_codec(name)
+    expected = json.loads(process_supplement_request(VALID_PAYLOAD))
+    assert json.loads(process_supplement_request(VALID_PAYLOAD, codec=codec)) == expected
+    assert json.loads(process_supplement_request(VALID_PAYLOAD, table=SupplementTable(), codec=codec)) == expected
+    assert process_supplement_request(b"{ invalid json }", codec=codec) is None
@@ -0,0 +1,216 @@
+import json
+import os
+import threading
+import time
+import pytest
+import paho.mqtt.client as mqtt
+from paho.mqtt.enums import CallbackAPIVersion
+from unittest.mock import Mock, patch
+from winter_supplement_engine import metrics
+from winter_supplement_engine.async_engine import AsyncWinterSupplementEngine
+from winter_supplement_engine.broker import LocalBroker
+from winter_supplement_engine.connections import DEFAULT_SHARED_GROUP, Connection, ConnectionPool, parse_brokers
+from winter_supplement_engine.engine import WinterSupplementEngine
+
+PAYLOAD = json.dumps({
+    "id": "pool",
+    "numberOfChildren": 1,
+    "familyComposition": "couple",
+    "familyUnitInPayForDecember": True
+})
+
+@pytest.fixture()
+def mock_env_vars():
+    """
+    Mock environment variables for two connections to each of two brokers
+    """
+    env_vars = {
+        "MQTT_BROKER": "broker-a",
+        "MQTT_BROKER_PORT": "1883",
+        "MQTT_BROKERS": "broker-b:1884",
+        "MQTT_CONNECTIONS": "2",
+        "MQTT_INPUT_TOPIC_PREFIX": "BRE/calculateWinterSupplementInput",
+        "MQTT_OUTPUT_TOPIC_PREFIX": "BRE/calculateWinterSupplementOutput",
+    }
+    with patch.dict(os.environ, env_vars, clear=True), \
+         patch('winter_supplement_engine.engine.load_dotenv'):
+        yield env_vars
+
+@pytest.fixture()
+def mock_clients():
+    """
+    Create every engine client as a separate mock
+    """
+    with patch('paho.mqtt.client.Client', side_effect=lambda *args, **kwargs: Mock()):
+        yield
+
+def make_pool(*brokers):
+    pool = ConnectionPool()
+    for host, port, index in brokers:
+        connection = Connection(host, port, index)
+        connection.client = Mock()
+        pool.add(connection)
+    return pool
+
+def test_parse_brokers():
+    """
+    Test that brokers are parsed into (host, port) pairs without duplicates
+    """
+    assert parse_brokers("a:1883, b:1884,,a:1883") == [("a", 1883), ("b", 1884)]
+    with pytest.raises(ValueError):
+        parse_brokers("a")
+    with pytest.raises(ValueError):
+        parse_brokers("a:port")
+
+def test_connection_tracks_health():
+    """
+    Test that connects, disconnects and the last error are counted
+    """
+    connection = Connection("a", 1883)
+    connection.up()
+    connection.down("keepalive timeout")
+    # a failed reconnect isn't another disconnect
+    connection.down()
+    health = connection.health()
+    assert health["connection"] == "a:1883/0"
+    assert not health["connected"]
+    assert (health["connects"], health["disconnects"]) == (1, 1)
+    assert health["last_error"] == "keepalive timeout"
+
+def test_fallback_takes_turns_on_the_same_broker():
+    """
+    Test that a connection that is down falls back to the connections to its broker that are up
+    """
+    pool = make_pool(("a", 1, 0), ("a", 1, 1), ("a", 1, 2), ("b", 2, 0))
+    down, first, second, other_broker = pool.connections
+    first.up()
+    second.up()
+    other_broker.up()
+    assert [pool.fallback(down) for _ in range(3)] == [first, second, first]
+
+    first.down()
+    second.down()
+    assert pool.fallback(down) is None
+    assert pool.fallback(other_broker) is None
+
+def test_engine_creates_a_connection_per_broker(mock_env_vars):
+    """
+    Test that MQTT_CONNECTIONS clients are created for each broker and share a subscription group
+    """
+    engine = WinterSupplementEngine()
+    assert [connection.name for connection in engine.pool] == [
+        "broker-a:1883/0", "broker-a:1883/1", "broker-b:1884/0", "broker-b:1884/1"
+    ]
+    assert engine.client is engine.pool.primary.client
+    assert len({connection.client for connection in engine.pool}) == 4
+    assert engine.subscription_topic == f"$share/{DEFAULT_SHARED_GROUP}/BRE/calculateWinterSupplementInput/+"
+    assert metrics.CONNECTIONS.value == 4
+
+def test_engine_rejects_an_empty_pool(mock_env_vars):
+    """
+    Test that fewer than one connection per broker is rejected
+    """
+    with patch.dict(os.environ, {"MQTT_CONNECTIONS": "0"}):
+        with pytest.raises(ValueError):
+            WinterSupplementEngine()
+
+def test_engine_publishes_on_the_connection_of_the_request(mock_env_vars, mock_clients):
+    """
+    Test that a result goes out on the connection its request came in on
+    """
+    engine = WinterSupplementEngine()
+    connection = engine.pool.connections[3]
+    client = connection.client
+    message = Mock()
+    message.topic = "BRE/calculateWinterSupplementInput/tenant"
+    message.payload = PAYLOAD.encode()
+
+    engine.on_message(client, connection, message)
+
+    assert client.publish.call_args.args[0] == "BRE/calculateWinterSupplementOutput/tenant"
+    assert all(not other.client.publish.called for other in engine.pool if other is not connection)
+    assert connection.messages == 1
+
+def test_engine_reroutes_results_of_a_lost_connection(mock_env_vars, mock_clients):
+    """
+    Test that results for a connection that is down are published on another connection to its broker
+    """
+    engine = WinterSupplementEngine()
+    lost, healthy = engine.pool.connections[:2]
+    lost.client.is_connected.return_value = False
+    healthy.up()
+    rerouted = metrics.PUBLISHES_REROUTED.value
+
+    engine.publish_result(lost.client, "BRE/calculateWinterSupplementOutput/a", b"1")
+
+    lost.client.publish.assert_not_called()
+    healthy.client.publish.assert_called_once_with("BRE/calculateWinterSupplementOutput/a", b"1", qos=0, properties=None)
+    assert metrics.PUBLISHES_REROUTED.value == rerouted + 1
+
+def test_engine_spools_per_broker(mock_env_vars, tmp_path):
+    """
+    Test that every broker gets its own spool directory, shared by its connections
+    """
+    with patch.dict(os.environ, {"SPOOL_DIR": str(tmp_path)}):
+        engine = WinterSupplementEngine()
+    spools = [connection.spool for connection in engine.pool]
+    assert spools[0] is spools[1] and spools[2] is spools[3] and spools[0] is not spools[2]
+    assert {str(spool.directory) for spool in engine.spools} == {
+        str(tmp_path / "broker-a-1883"), str(tmp_path / "broker-b-1884")
+    }
+
+def test_async_engine_rejects_a_pool(mock_env_vars):
+    """
+    Test that the asyncio engine refuses more than one connection
+    """
+    with pytest.raises(ValueError):
+        AsyncWinterSupplementEngine()
+
+def test_engine_pool_end_to_end():
+    """
+    Test requests sent to two brokers being answered on the broker they were sent to
+    """
+    with LocalBroker() as first, LocalBroker() as second:
+        env_vars = {
+            "MQTT_BROKER": first.host,
+            "MQTT_BROKER_PORT": str(first.port),
+            "MQTT_BROKERS": f"{second.host}:{second.port}",
+            "MQTT_CONNECTIONS": "2",
+            "MQTT_INPUT_TOPIC_PREFIX": "BRE/calculateWinterSupplementInput",
+            "MQTT_OUTPUT_TOPIC_PREFIX": "BRE/calculateWinterSupplementOutput",
+            "ENGINE_WORKER_MODE": "thread",
+        }
+        with patch.dict(os.environ, env_vars, clear=True), \
+             patch('winter_supplement_engine.engine.load_dotenv'):
+            engine = WinterSupplementEngine()
+        thread = threading.Thread(target=engine.start)
+        thread.start()
+
+        received = {first.port: [], second.port: []}
+        clients = []
+        for broker in (first, second):
+            client = mqtt.Client(protocol=mqtt.MQTTv5, callback_api_version=CallbackAPIVersion.VERSION2)
+            client.on_message = lambda client, userdata, message, port=broker.port: received[port].append(message.topic)
+            client.connect(broker.host, broker.port)
+            client.subscribe("BRE/calculateWinterSupplementOutput/+")
+            client.loop_start()
+            clients.append(client)
+
+        # the engine may still be connecting, retry until both brokers are answered
+        deadline = time.monotonic() + 5
+        while not all(received.values()) and time.monotonic() < deadline:
+            clients[0].publish("BRE/calculateWinterSupplementInput/east", PAYLOAD)
+            clients[1].publish("BRE/calculateWinterSupplementInput/west", PAYLOAD)
+            time.sleep(0.1)
+
+        health = engine.pool.health()
+        engine.stop()
+        thread.join(5)
+        for client in clients:
+            client.disconnect()
+            client.loop_stop()
+
+    assert set(received[first.port]) == {"BRE/calculateWinterSupplementOutput/east"}
+    assert set(received[second.port]) == {"BRE/calculateWinterSupplementOutput/west"}
+    assert all(connection["connected"] for connection in health)
+    assert not thread.is_alive()
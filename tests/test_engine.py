@@ -1,7 +1,11 @@
+import json
 import pytest
 from unittest.mock import Mock, patch
 import os
-from winter_supplement_engine.config import get_env_variable
+import subprocess
+import sys
+from winter_supplement_engine import config
+from winter_supplement_engine.config import EngineConfig, get_env_variable, parse_bool
 from winter_supplement_engine.engine import WinterSupplementEngine
 
 @pytest.fixture()
@@ -101,7 +105,9 @@ def test_on_message_with_topic_id(mock_env_vars_with_topic_id, mock_mqtt_client)
         engine.on_message(mock_mqtt_client, None, message)
         mock_mqtt_client.publish.assert_called_once_with(
             "BRE/calculateWinterSupplementOutput/test123",
-            '{"test": "123"}'
+            '{"test": "123"}',
+            qos=0,
+            properties=None
         )
 
 def test_engine_initialization_without_topic_id(mock_env_vars_without_topic_id):
@@ -127,7 +133,7 @@ def test_start_successful_connection(mock_mqtt_client, mock_env_vars_with_topic_
         engine.use_specific_topic = True
         engine.input_topic = f"{mock_env_vars_with_topic_id['MQTT_INPUT_TOPIC_PREFIX']}/{mock_env_vars_with_topic_id['MQTT_TOPIC_ID']}"
         # avoid infinite loop
-        mock_mqtt_client.loop_forever.side_effect = KeyboardInterrupt()
+        mock_mqtt_client.loop_start.side_effect = KeyboardInterrupt()
 
         try:
             engine.on_connect(mock_mqtt_client, None, None, 0)
@@ -145,7 +151,7 @@ def test_start_successful_connection(mock_mqtt_client, mock_env_vars_with_topic_
         expected_topic = f"{mock_env_vars_with_topic_id['MQTT_INPUT_TOPIC_PREFIX']}/{mock_env_vars_with_topic_id['MQTT_TOPIC_ID']}"
         mock_mqtt_client.subscribe.assert_called_once_with(expected_topic)
 
-def test_start_connection_failure(mock_mqtt_client, mock_env_vars_with_topic_id):
+def test_start_connection_failure(mock_mqtt_client, mock_env_vars_with_topic_id, caplog):
     """
     Test MQTT client connection failure handling
     """
@@ -154,7 +160,6 @@ def test_start_connection_failure(mock_mqtt_client, mock_env_vars_with_topic_id)
 
     with patch.dict(os.environ, mock_env_vars_with_topic_id, clear=True), \
          patch('winter_supplement_engine.engine.load_dotenv'), \
-         patch('builtins.print') as mock_print, \
          patch('winter_supplement_engine.engine.exit') as mock_exit:
 
         engine = WinterSupplementEngine()
@@ -163,5 +168,122 @@ def test_start_connection_failure(mock_mqtt_client, mock_env_vars_with_topic_id)
         engine.start()
 
         mock_exit.assert_called_once_with(1)
-        # make sure error message is printed
-        mock_print.assert_called_with("An error occurred: Connection failed")
\ No newline at end of file
+        # make sure error message is logged
+        assert caplog.records[-1].getMessage() == "An error occurred: Connection failed"
+        assert caplog.records[-1].levelname == "ERROR"
+
+def test_on_message_with_worker_pool(mock_env_vars_without_topic_id, mock_mqtt_client):
+    """
+    Test that the worker pool mode publishes results back through the client
+    """
+    env_vars = {**mock_env_vars_without_topic_id, "ENGINE_WORKER_MODE": "thread", "ENGINE_WORKERS": "2"}
+    with patch.dict(os.environ, env_vars, clear=True), \
+         patch('winter_supplement_engine.engine.load_dotenv'):
+
+        engine = WinterSupplementEngine()
+        assert engine.worker_pool is not None
+        message = Mock()
+        message.topic = "BRE/calculateWinterSupplementInput/abc"
+        message.payload = b'{"id": "abc", "numberOfChildren": 0, "familyComposition": "couple", "familyUnitInPayForDecember": true}'
+
+        engine.on_message(mock_mqtt_client, None, message)
+        engine.worker_pool.shutdown()
+
+        mock_mqtt_client.publish.assert_called_once()
+        topic, result = mock_mqtt_client.publish.call_args[0]
+        assert topic == "BRE/calculateWinterSupplementOutput/abc"
+        assert json.loads(result)["supplementAmount"] == 120.0
+
+def test_parse_bool_environment_variable():
+    """
+    Test that boolean environment variables are parsed and invalid ones raise ValueError
+    """
+    with patch.dict(os.environ, {"FLAG_ON": "Yes", "FLAG_OFF": "0", "FLAG_BAD": "maybe"}):
+        assert get_env_variable("FLAG_ON", parse_bool) is True
+        assert get_env_variable("FLAG_OFF", parse_bool) is False
+        assert get_env_variable("FLAG_MISSING", parse_bool, default="true") is True
+        with pytest.raises(ValueError) as exc_info:
+            get_env_variable("FLAG_BAD", parse_bool)
+        assert "Invalid value" in str(exc_info.value)
+
+def test_engine_config_reports_every_invalid_setting():
+    """
+    Test that the config lists every missing or invalid variable in one error
+    """
+    with patch.dict(os.environ, {"MQTT_BROKER_PORT": "abc", "PUBLISH_QOS": "high"}, clear=True):
+        with pytest.raises(ValueError) as exc_info:
+            EngineConfig.from_env()
+    message = str(exc_info.value)
+    for name in ("MQTT_BROKER", "MQTT_BROKER_PORT", "MQTT_INPUT_TOPIC_PREFIX", "PUBLISH_QOS"):
+        assert name in message
+
+def test_engine_config_checks_values():
+    """
+    Test that settings of the right type but out of range fail when the config is read
+    """
+    env_vars = {
+        "MQTT_BROKER": "test.mosquitto.org",
+        "MQTT_BROKER_PORT": "1883",
+        "MQTT_INPUT_TOPIC_PREFIX": "BRE/calculateWinterSupplementInput",
+        "MQTT_OUTPUT_TOPIC_PREFIX": "BRE/calculateWinterSupplementOutput",
+        "PUBLISH_QOS": "5",
+        "ENGINE_WORKER_MODE": "fiber",
+        "PUBLISH_BATCH_SIZE": "0",
+        "RECONNECT_MIN_DELAY": "120",
+    }
+    with patch.dict(os.environ, env_vars, clear=True):
+        with pytest.raises(ValueError) as exc_info:
+            EngineConfig.from_env()
+    message = str(exc_info.value)
+    for name in ("PUBLISH_QOS", "ENGINE_WORKER_MODE", "PUBLISH_BATCH_SIZE", "RECONNECT_MAX_DELAY"):
+        assert name in message
+
+    # values inside their ranges are accepted
+    with patch.dict(os.environ, {**env_vars, "PUBLISH_QOS": "2", "ENGINE_WORKER_MODE": "thread",
+                                 "PUBLISH_BATCH_SIZE": "1", "RECONNECT_MIN_DELAY": "1"}, clear=True):
+        assert EngineConfig.from_env().publish_qos == 2
+
+def test_engine_uses_given_config(mock_env_vars_without_topic_id):
+    """
+    Test that an engine built from a config doesn't read the environment and exposes its settings
+    """
+    settings = EngineConfig.from_env()
+    with patch.dict(os.environ, {}, clear=True):
+        engine = WinterSupplementEngine(settings)
+    assert engine.config is settings
+    assert engine.mqtt_broker == "test.mosquitto.org"
+    assert engine.mqtt_broker_port == 1883
+    assert engine.publish_batch_delay == 5.0
+
+def test_load_dotenv_skips_import_without_env_file(tmp_path):
+    """
+    Test that python-dotenv is only imported when there is a .env file to load
+    """
+    with patch.object(config, "__file__", str(tmp_path / "package" / "config.py")), \
+         patch.dict(sys.modules, {"dotenv": None}):
+        assert config.load_dotenv() is False
+
+        (tmp_path / ".env").write_text("WINTER_SUPPLEMENT_TEST=1\n")
+        with pytest.raises(ImportError):
+            config.load_dotenv()
+
+def test_optional_subsystems_are_imported_when_enabled():
+    """
+    Test that an engine with the default settings doesn't import the subsystems it doesn't use
+    """
+    optional = ["admission", "cache", "profiling", "publisher", "spool"]
+    code = (
+        "import sys\n"
+        "from winter_supplement_engine.engine import WinterSupplementEngine\n"
+        "WinterSupplementEngine()\n"
+        f"print([name for name in {optional!r} if f'winter_supplement_engine.{{name}}' in sys.modules])\n"
+    )
+    env = {
+        **os.environ,
+        "MQTT_BROKER": "test.mosquitto.org",
+        "MQTT_BROKER_PORT": "1883",
+        "MQTT_INPUT_TOPIC_PREFIX": "BRE/calculateWinterSupplementInput",
+        "MQTT_OUTPUT_TOPIC_PREFIX": "BRE/calculateWinterSupplementOutput",
+    }
+    result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
@@ -0,0 +1,41 @@
+import os
+import threading
+from unittest.mock import patch
+from winter_supplement_engine.broker import LocalBroker
+from winter_supplement_engine.engine import WinterSupplementEngine
+from winter_supplement_engine.loadtest import LoadGenerator, is_saturated
+
+def test_load_generator_step():
+    """
+    Test that a rate step against a local broker and engine reports latencies for every request
+    """
+    with LocalBroker() as broker:
+        env_vars = {
+            "MQTT_BROKER": broker.host,
+            "MQTT_BROKER_PORT": str(broker.port),
+            "MQTT_INPUT_TOPIC_PREFIX": "BRE/calculateWinterSupplementInput",
+            "MQTT_OUTPUT_TOPIC_PREFIX": "BRE/calculateWinterSupplementOutput",
+        }
+        with patch.dict(os.environ, env_vars, clear=True), \
+             patch('winter_supplement_engine.engine.load_dotenv'), \
+             patch('builtins.print'):
+            engine = WinterSupplementEngine()
+            thread = threading.Thread(target=engine.start)
+            thread.start()
+
+            generator = LoadGenerator(broker.host, broker.port, tenants=5)
+            try:
+                generator.connect()
+                generator.wait_for_engine(10)
+                step = generator.run_step(rate=200, duration=0.5)
+            finally:
+                generator.close()
+                engine.stop()
+                thread.join(5)
+
+    assert step["sent"] == 100
+    assert step["received"] == 100
+    assert step["lost"] == 0
+    assert step["latency_ms"]["p50"] <= step["latency_ms"]["p99"]
+    assert not is_saturated({**step, "throughput": step["offered_rate"]})
+    assert is_saturated({**step, "lost": 1})
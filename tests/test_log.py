@@ -0,0 +1,113 @@
+import json
+import logging
+import queue
+import pytest
+from winter_supplement_engine import log
+from winter_supplement_engine.rules import process_supplement_request
+from winter_supplement_engine.workers import WorkerPool
+from winter_supplement_engine.log import (
+    configure_logging,
+    message_log,
+    DroppingQueueHandler,
+    JsonFormatter,
+    MessageLogger
+)
+
+@pytest.fixture
+def restore_logging():
+    """
+    Restore the root and message loggers after a test configures logging
+    """
+    root_logger = logging.getLogger()
+    saved = (list(root_logger.handlers), root_logger.level)
+    saved_messages = (message_log.logger.level, message_log.sample_rate, message_log.log_payloads)
+    yield
+    log._flush_logs()
+    root_logger.handlers[:] = saved[0]
+    root_logger.setLevel(saved[1])
+    message_log.logger.setLevel(saved_messages[0])
+    message_log.sample_rate, message_log.log_payloads = saved_messages[1:]
+
+def test_json_formatter_includes_extra_fields():
+    """
+    Test that records are formatted as JSON with their extra fields
+    """
+    record = logging.LogRecord("winter_supplement_engine.engine", logging.INFO, __file__, 1, "Published to %s", ("a/b",), None)
+    record.topic = "a/b"
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "Published to a/b"
+    assert entry["level"] == "INFO"
+    assert entry["topic"] == "a/b"
+
+def test_dropping_queue_handler():
+    """
+    Test that records are dropped instead of blocking when the queue is full
+    """
+    handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+    record = logging.LogRecord("test", logging.INFO, __file__, 1, "message", None, None)
+    handler.handle(record)
+    handler.handle(record)
+    assert handler.dropped == 1
+
+def test_message_logger_sampling():
+    """
+    Test that sampling and levels are checked before logging per-message events
+    """
+    message_logger = MessageLogger("winter_supplement_engine.test_messages")
+    message_logger.logger.setLevel(logging.INFO)
+
+    message_logger.sample_rate = 0.0
+    assert not message_logger.enabled()
+    message_logger.sample_rate = 1.0
+    assert message_logger.enabled()
+    assert not message_logger.enabled(logging.DEBUG)
+
+def test_message_logger_payloads():
+    """
+    Test that payloads can be left out of the logs
+    """
+    message_logger = MessageLogger("winter_supplement_engine.test_messages")
+    assert message_logger.payload(b'{"id": "1"}') == '{"id": "1"}'
+    message_logger.log_payloads = False
+    assert message_logger.payload(b'{"id": "1"}') == "<omitted>"
+
+def test_configure_logging_writes_through_queue(restore_logging, capsys):
+    """
+    Test that configured logging writes JSON lines from the listener thread
+    """
+    configure_logging(level="INFO", sample_rate=1.0, log_payloads=False, log_format="json")
+    message_log.info("Failed to process request", topic="a/b")
+    logging.getLogger("winter_supplement_engine.engine").debug("hidden")
+    log._listener[1].stop()
+    log._listener = None
+
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 1
+    entry = json.loads(lines[0])
+    assert entry["message"] == "Failed to process request"
+    assert entry["logger"] == "winter_supplement_engine.messages"
+    assert entry["topic"] == "a/b"
+    assert message_log.log_payloads is False
+
+def test_configure_logging_invalid_settings(restore_logging):
+    """
+    Test that invalid logging settings raise ValueError
+    """
+    with pytest.raises(ValueError):
+        configure_logging(sample_rate=2.0)
+    with pytest.raises(ValueError):
+        configure_logging(log_format="xml")
+
+def test_worker_process_logs_reach_the_output(restore_logging, capsys):
+    """
+    Test that records logged in a worker process are written by this process' listener
+    """
+    configure_logging(level="INFO", log_format="text")
+    pool = WorkerPool("process", workers=1)
+    results = []
+    pool.submit(process_supplement_request, '{"id": "abc"}', lambda future: results.append(future.result()))
+    pool.shutdown()
+    log._flush_logs()
+
+    assert results == [None]
+    assert "Input validation error" in capsys.readouterr().out
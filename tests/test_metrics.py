@@ -0,0 +1,196 @@
+import json
+import os
+import urllib.request
+import pytest
+import paho.mqtt.client as mqtt
+from unittest.mock import Mock, patch
+from winter_supplement_engine import metrics
+from winter_supplement_engine.engine import WinterSupplementEngine
+from winter_supplement_engine.metrics import Counter, Gauge, Histogram, Registry, start_metrics_server
+from winter_supplement_engine.rules import process_supplement_request
+
+@pytest.fixture()
+def mock_env_vars():
+    """
+    Mock environment variables without a TOPIC ID
+    """
+    env_vars = {
+        "MQTT_BROKER": "test.mosquitto.org",
+        "MQTT_BROKER_PORT": "1883",
+        "MQTT_INPUT_TOPIC_PREFIX": "BRE/calculateWinterSupplementInput",
+        "MQTT_OUTPUT_TOPIC_PREFIX": "BRE/calculateWinterSupplementOutput",
+    }
+    with patch.dict(os.environ, env_vars, clear=True), \
+         patch('winter_supplement_engine.engine.load_dotenv'):
+        yield env_vars
+
+@pytest.fixture()
+def restore_enabled():
+    """
+    Restore the module-wide metrics switch after a test changes it
+    """
+    enabled = metrics.enabled
+    yield
+    metrics.enabled = enabled
+
+def test_registry_renders_prometheus_text():
+    """
+    Test that counters, labelled counters, gauges and histograms are rendered in the exposition format
+    """
+    registry = Registry()
+    requests = Counter("requests", "Requests seen", registry=registry)
+    failures = Counter("failures", "Failures by reason", ("reason",), registry=registry)
+    depth = Gauge("depth", "Queue depth", registry=registry, function=lambda: 7)
+    latency = Histogram("latency_seconds", "Latency", registry=registry, buckets=(0.1, 1.0))
+
+    requests.inc()
+    requests.inc(2)
+    failures.labels('bad "json"').inc()
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5)
+
+    text = registry.render()
+    assert "# TYPE requests counter" in text
+    assert "requests_total 3" in text
+    assert 'failures_total{reason="bad \\"json\\""} 1' in text
+    assert "depth 7" in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1.0"} 2' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "latency_seconds_count 3" in text
+
+    # a function gauge is read again on every render
+    depth.set_function(lambda: 9)
+    assert "depth 9" in registry.render()
+
+    with pytest.raises(ValueError):
+        Counter("requests", "Duplicate", registry=registry)
+
+def test_process_supplement_request_records_stages(restore_enabled):
+    """
+    Test that every stage is timed and failures are counted by reason
+    """
+    metrics.enabled = True
+    stages = {stage: histogram.count for stage, histogram in metrics.STAGES.items()}
+    invalid_json = metrics.FAILED_INVALID_JSON.value
+    invalid_input = metrics.FAILED_INVALID_INPUT.value
+
+    payload = json.dumps({
+        "id": "abc",
+        "numberOfChildren": 2,
+        "familyComposition": "couple",
+        "familyUnitInPayForDecember": True
+    })
+    assert process_supplement_request(payload) is not None
+    for stage in ("parse", "validate", "calculate", "serialize"):
+        assert metrics.STAGES[stage].count == stages[stage] + 1
+
+    process_supplement_request("not json")
+    process_supplement_request(json.dumps({"id": "abc"}))
+    assert metrics.FAILED_INVALID_JSON.value == invalid_json + 1
+    assert metrics.FAILED_INVALID_INPUT.value == invalid_input + 1
+
+def test_stage_timings_disabled(restore_enabled):
+    """
+    Test that no timings are recorded when metrics are disabled
+    """
+    metrics.enabled = False
+    count = metrics.STAGES["parse"].count
+    process_supplement_request(json.dumps({"id": "abc"}))
+    assert metrics.STAGES["parse"].count == count
+
+def test_engine_records_message_and_connection_metrics(mock_env_vars, restore_enabled):
+    """
+    Test that on_message, publishing and the connection callbacks update the metrics
+    """
+    engine = WinterSupplementEngine()
+    client = Mock()
+    client.publish.return_value.rc = mqtt.MQTT_ERR_SUCCESS
+    received = metrics.MESSAGES_RECEIVED.value
+    published = metrics.MESSAGES_PUBLISHED.value
+    invalid_topic = metrics.FAILED_INVALID_TOPIC.value
+    observed = metrics.MESSAGE_SECONDS.count
+
+    message = Mock()
+    message.topic = "BRE/calculateWinterSupplementInput/test123"
+    message.payload = json.dumps({
+        "id": "abc",
+        "numberOfChildren": 0,
+        "familyComposition": "single",
+        "familyUnitInPayForDecember": True
+    })
+    engine.on_message(client, None, message)
+    message.topic = "invalid"
+    engine.on_message(client, None, message)
+
+    assert metrics.MESSAGES_RECEIVED.value == received + 2
+    assert metrics.MESSAGES_PUBLISHED.value == published + 1
+    assert metrics.FAILED_INVALID_TOPIC.value == invalid_topic + 1
+    assert metrics.MESSAGE_SECONDS.count == observed + 2
+    assert metrics.PUBLISH_QUEUE_DEPTH.function() >= 1
+    engine.on_publish(client, None, 1, 0, None)
+
+    engine.on_connect(client, None, None, 0)
+    assert metrics.CONNECTED.value == 1
+    engine.on_disconnect(client, None, None, 0, None)
+    assert metrics.CONNECTED.value == 0
+
+def test_refused_publish_is_not_counted_as_published(mock_env_vars):
+    """
+    Test that a publish the client refuses is counted as a failure and leaves the queue depth alone
+    """
+    engine = WinterSupplementEngine()
+    client = Mock()
+    client.publish.return_value.rc = mqtt.MQTT_ERR_NO_CONN
+    published = metrics.MESSAGES_PUBLISHED.value
+    refused = metrics.FAILED_PUBLISH_REFUSED.value
+    depth = metrics.PUBLISH_QUEUE_DEPTH.function()
+
+    engine.publish_result(client, "BRE/calculateWinterSupplementOutput/a", b"1")
+
+    assert metrics.MESSAGES_PUBLISHED.value == published
+    assert metrics.FAILED_PUBLISH_REFUSED.value == refused + 1
+    assert metrics.PUBLISH_QUEUE_DEPTH.function() == depth
+
+def test_process_workers_report_failures(mock_env_vars):
+    """
+    Test that validation failures counted in worker processes reach the engine's counters
+    """
+    with patch.dict(os.environ, {"ENGINE_WORKER_MODE": "process", "ENGINE_WORKERS": "1"}):
+        engine = WinterSupplementEngine()
+    invalid_json = metrics.FAILED_INVALID_JSON.value
+    invalid_input = metrics.FAILED_INVALID_INPUT.value
+    for payload in (b"not json", json.dumps({"id": "abc"}).encode()):
+        message = Mock()
+        message.topic = "BRE/calculateWinterSupplementInput/test123"
+        message.payload = payload
+        engine.on_message(Mock(), None, message)
+    engine.worker_pool.shutdown()
+
+    assert metrics.FAILED_INVALID_JSON.value == invalid_json + 1
+    assert metrics.FAILED_INVALID_INPUT.value == invalid_input + 1
+
+def test_metrics_disabled_by_environment(mock_env_vars, restore_enabled):
+    """
+    Test that METRICS_ENABLED turns stage timings off
+    """
+    with patch.dict(os.environ, {"METRICS_ENABLED": "false"}):
+        WinterSupplementEngine()
+    assert metrics.enabled is False
+
+def test_metrics_server():
+    """
+    Test that the registry is served on /metrics
+    """
+    registry = Registry()
+    Counter("served", "Served requests", registry=registry).inc()
+    server = start_metrics_server(0, host="127.0.0.1", registry=registry)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url, timeout=5) as response:
+            assert response.headers["Content-Type"].startswith("text/plain")
+            assert "served_total 1" in response.read().decode()
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,151 @@
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import pytest
+from unittest.mock import Mock, patch
+from winter_supplement_engine import metrics, profiling
+from winter_supplement_engine.async_engine import AsyncWinterSupplementEngine
+from winter_supplement_engine.engine import WinterSupplementEngine
+from winter_supplement_engine.profiling import SamplingProfiler, fold
+
+PAYLOAD = json.dumps({
+    "id": "slow",
+    "numberOfChildren": 1,
+    "familyComposition": "couple",
+    "familyUnitInPayForDecember": True
+})
+
+@pytest.fixture()
+def mock_env_vars():
+    """
+    Mock environment variables with every message traced as slow
+    """
+    env_vars = {
+        "MQTT_BROKER": "test.mosquitto.org",
+        "MQTT_BROKER_PORT": "1883",
+        "MQTT_INPUT_TOPIC_PREFIX": "BRE/calculateWinterSupplementInput",
+        "MQTT_OUTPUT_TOPIC_PREFIX": "BRE/calculateWinterSupplementOutput",
+        "SLOW_MESSAGE_MS": "0",
+    }
+    with patch.dict(os.environ, env_vars, clear=True), \
+         patch('winter_supplement_engine.engine.load_dotenv'):
+        yield env_vars
+    metrics.tracing = False
+
+def make_message():
+    message = Mock()
+    message.topic = "BRE/calculateWinterSupplementInput/tenant"
+    message.payload = PAYLOAD.encode()
+    return message
+
+def busy_loop(stop):
+    while not stop.is_set():
+        sum(range(100))
+
+def test_fold_lists_frames_from_the_root():
+    """
+    Test that a folded stack starts with the thread name and ends with the current frame
+    """
+    stack = fold(sys._getframe(), "MainThread")
+    frames = stack.split(";")
+    assert frames[0] == "MainThread"
+    assert frames[-1].startswith("test_fold_lists_frames_from_the_root (test_profiling.py:")
+
+def test_profiler_writes_folded_stacks(tmp_path):
+    """
+    Test that a profile samples other threads and writes one line per stack with its count
+    """
+    stop = threading.Event()
+    worker = threading.Thread(target=busy_loop, args=(stop,), name="busy")
+    worker.start()
+    path = tmp_path / "profile.folded"
+    profiler = SamplingProfiler(path, duration=0.2, interval=0.001).start()
+    profiler.thread.join(5)
+    stop.set()
+    worker.join()
+
+    lines = path.read_text().splitlines()
+    assert profiler.samples > 0
+    assert any(line.startswith("busy;") and "busy_loop (test_profiling.py:" in line for line in lines)
+    assert all(line.rpartition(" ")[2].isdigit() for line in lines)
+
+def test_only_one_profile_runs_at_a_time(tmp_path):
+    """
+    Test that starting a profile while one is running is refused
+    """
+    profiler = profiling.start_profile(tmp_path, duration=10)
+    try:
+        assert profiler is not None
+        assert profiling.start_profile(tmp_path, duration=10) is None
+    finally:
+        profiler.stop()
+    assert os.path.exists(profiler.path)
+
+def test_slow_message_is_traced(mock_env_vars, caplog):
+    """
+    Test that a message over the threshold is logged with the time spent in each stage
+    """
+    engine = WinterSupplementEngine()
+    with caplog.at_level(logging.WARNING, logger="winter_supplement_engine.engine"):
+        engine.on_message(Mock(), None, make_message())
+
+    record, = [record for record in caplog.records if record.getMessage().startswith("Slow message")]
+    assert record.topic == "BRE/calculateWinterSupplementInput/tenant"
+    assert list(record.stages) == ["parse", "validate", "calculate", "serialize", "publish", "other"]
+    assert record.duration_ms >= sum(ms for stage, ms in record.stages.items() if stage != "other")
+
+def test_slow_message_is_traced_after_the_worker_pool(mock_env_vars, caplog):
+    """
+    Test that a message handed to a worker is timed until its result is published, stages included
+    """
+    with patch.dict(os.environ, {"ENGINE_WORKER_MODE": "thread"}):
+        engine = WinterSupplementEngine()
+    observed = metrics.MESSAGE_SECONDS.count
+    with caplog.at_level(logging.WARNING, logger="winter_supplement_engine.engine"):
+        engine.on_message(Mock(), None, make_message())
+        engine.worker_pool.shutdown()
+
+    record, = [record for record in caplog.records if record.getMessage().startswith("Slow message")]
+    assert list(record.stages) == ["parse", "validate", "calculate", "serialize", "publish", "other"]
+    assert metrics.MESSAGE_SECONDS.count == observed + 1
+
+def test_async_slow_message_is_traced(mock_env_vars, caplog):
+    """
+    Test that the asyncio engine times a message until its task publishes the result
+    """
+    client = Mock()
+    client.socket.return_value = None
+    with patch('paho.mqtt.client.Client', return_value=client):
+        engine = AsyncWinterSupplementEngine()
+    observed = metrics.MESSAGE_SECONDS.count
+
+    async def scenario():
+        async with engine:
+            engine.on_message(client, None, make_message())
+
+    with caplog.at_level(logging.WARNING, logger="winter_supplement_engine.engine"):
+        asyncio.run(scenario())
+
+    record, = [record for record in caplog.records if record.getMessage().startswith("Slow message")]
+    assert list(record.stages) == ["parse", "validate", "calculate", "serialize", "publish", "other"]
+    assert metrics.MESSAGE_SECONDS.count == observed + 1
+
+def test_fast_message_is_not_traced(mock_env_vars, caplog):
+    """
+    Test that messages under the threshold aren't logged
+    """
+    with patch.dict(os.environ, {"SLOW_MESSAGE_MS": "10000"}):
+        engine = WinterSupplementEngine()
+    with caplog.at_level(logging.WARNING, logger="winter_supplement_engine.engine"):
+        engine.on_message(Mock(), None, make_message())
+    assert not [record for record in caplog.records if record.getMessage().startswith("Slow message")]
+
+def test_stage_timer_is_free_when_off():
+    """
+    Test that no timer is created when metrics and tracing are both off
+    """
+    with patch.object(metrics, "enabled", False), patch.object(metrics, "tracing", False):
+        assert metrics.stage_timer() is metrics.NULL_TIMER
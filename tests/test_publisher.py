@@ -0,0 +1,131 @@
+import threading
+import time
+import paho.mqtt.client as mqtt
+from unittest.mock import Mock
+from winter_supplement_engine.publisher import BatchPublisher
+
+def make_client():
+    client = Mock()
+    client.is_connected.return_value = True
+    client.publish.side_effect = lambda topic, payload, qos=0, properties=None: published_info()
+    return client
+
+def published_info(published=True):
+    info = mqtt.MQTTMessageInfo(1)
+    if published:
+        info._set_as_published()
+    return info
+
+def test_batch_flushed_when_full():
+    """
+    Test that a batch is published as soon as it reaches the batch size
+    """
+    client = make_client()
+    publisher = BatchPublisher(client, max_batch=3, max_delay=10).start()
+    for index in range(3):
+        publisher.publish(f"out/{index % 2}", b"{}")
+
+    deadline = time.monotonic() + 5
+    while client.publish.call_count < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    publisher.close(5)
+
+    assert [call.args[0] for call in client.publish.call_args_list] == ["out/0", "out/1", "out/0"]
+    stats = publisher.stats()
+    assert stats["flushes"] == 1
+    assert stats["largest_batch"] == 3
+    assert stats["topics"]["out/0"] == {"messages": 2, "bytes": 4, "flushes": 1}
+
+def test_batch_flushed_after_delay():
+    """
+    Test that a partial batch is published once the time window closes
+    """
+    client = make_client()
+    publisher = BatchPublisher(client, max_batch=100, max_delay=0.01).start()
+    publisher.publish("out/a", b"{}")
+
+    deadline = time.monotonic() + 5
+    while not client.publish.called and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert client.publish.call_count == 1
+    publisher.close(5)
+
+def test_close_flushes_remaining_results():
+    """
+    Test that closing the publisher publishes whatever is still buffered
+    """
+    client = make_client()
+    publisher = BatchPublisher(client, max_batch=100, max_delay=60).start()
+    for _ in range(5):
+        publisher.publish("out/a", "{}")
+    publisher.close(5)
+    assert client.publish.call_count == 5
+
+def test_max_inflight_waits_for_completion():
+    """
+    Test that publishing waits while max_inflight publishes haven't completed
+    """
+    pending = [published_info(False) for _ in range(2)]
+    infos = iter([*pending, published_info()])
+    client = make_client()
+    client.publish.side_effect = lambda topic, payload, qos=0, properties=None: next(infos)
+    publisher = BatchPublisher(client, max_batch=10, max_inflight=2)
+
+    # complete the first publish a little later
+    timer = threading.Timer(0.2, pending[0]._set_as_published)
+    timer.start()
+    start = time.monotonic()
+    publisher.flush([("out/a", b"1", None), ("out/a", b"2", None), ("out/a", b"3", None)])
+    timer.join()
+
+    assert client.publish.call_count == 3
+    assert time.monotonic() - start >= 0.2
+
+def test_publish_blocks_while_buffer_is_full():
+    """
+    Test that publishing waits for room once max_buffered results are waiting
+    """
+    client = make_client()
+    publisher = BatchPublisher(client, max_batch=10, max_delay=60, max_buffered=2)
+    publisher.publish("out/a", b"1")
+    publisher.publish("out/a", b"2")
+    blocked = threading.Thread(target=publisher.publish, args=("out/a", b"3"))
+    blocked.start()
+    blocked.join(0.2)
+    assert blocked.is_alive()
+
+    # the flusher takes the full buffer as a batch, which makes room
+    publisher.start()
+    blocked.join(5)
+    publisher.close(5)
+    assert not blocked.is_alive()
+    assert client.publish.call_count == 3
+
+def test_full_buffer_skips_inflight_wait():
+    """
+    Test that in-flight publishes aren't waited on while callers wait for buffer room
+    """
+    client = make_client()
+    client.publish.side_effect = lambda topic, payload, qos=0, properties=None: published_info(False)
+    publisher = BatchPublisher(client, max_batch=10, max_inflight=1, max_buffered=1)
+    publisher.buffer.append(("out/a", b"waiting", None))
+
+    start = time.monotonic()
+    publisher.flush([("out/a", b"1", None), ("out/a", b"2", None)])
+    assert client.publish.call_count == 2
+    assert time.monotonic() - start < 1
+
+def test_close_gives_up_on_a_stuck_flush():
+    """
+    Test that closing returns after its timeout when the flusher can't finish
+    """
+    release = threading.Event()
+    client = make_client()
+    client.publish.side_effect = lambda topic, payload, qos=0, properties=None: release.wait() and published_info()
+    publisher = BatchPublisher(client, max_batch=1, max_delay=0).start()
+    publisher.publish("out/a", b"1")
+
+    start = time.monotonic()
+    publisher.close(0.2)
+    assert time.monotonic() - start < 2
+    release.set()
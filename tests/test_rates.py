@@ -0,0 +1,133 @@
+import json
+import os
+import time
+import pytest
+from unittest.mock import patch
+from winter_supplement_engine import table
+from winter_supplement_engine.config import EngineConfig
+from winter_supplement_engine.engine import WinterSupplementEngine
+from winter_supplement_engine.rates import RateWatcher, load_rates, parse_rates
+from winter_supplement_engine.rules import DEFAULT_RATES, Rates, calculate_supplement, process_supplement_batch
+from winter_supplement_engine.table import SupplementTable, configure_default_table, get_default_table, process_with_table
+
+RATE_FILE = {"version": "2025-01", "singleBaseAmount": 70, "familyBaseAmount": 130.0, "childAmount": 25.5}
+
+PAYLOAD = json.dumps({
+    "id": "rates",
+    "numberOfChildren": 2,
+    "familyComposition": "couple",
+    "familyUnitInPayForDecember": True
+})
+
+@pytest.fixture
+def rate_file(tmp_path):
+    """
+    Write a rate file with non-default amounts
+    """
+    path = tmp_path / "rates.json"
+    path.write_text(json.dumps(RATE_FILE))
+    return path
+
+@pytest.fixture
+def reset_default_table():
+    """
+    Rebuild the process-wide table from its configured settings and restore it afterwards
+    """
+    saved = (table._default_table, table._rate_watcher, table._rates_file, table._reload_interval)
+    table._default_table = table._rate_watcher = None
+    yield
+    if table._rate_watcher is not None:
+        table._rate_watcher.stop()
+    table._default_table, table._rate_watcher, table._rates_file, table._reload_interval = saved
+
+def test_load_rates(rate_file):
+    """
+    Test that a rate file is loaded into Rates with float amounts
+    """
+    assert load_rates(rate_file) == Rates("2025-01", 70.0, 130.0, 25.5)
+
+@pytest.mark.parametrize("data", [
+    [],
+    {**RATE_FILE, "version": ""},
+    {**RATE_FILE, "childAmount": -1},
+    {**RATE_FILE, "singleBaseAmount": "60"},
+    {**RATE_FILE, "familyBaseAmount": True},
+    {key: value for key, value in RATE_FILE.items() if key != "childAmount"},
+])
+def test_parse_rates_rejects_invalid_files(data):
+    """
+    Test that incomplete or invalid rate files are rejected
+    """
+    with pytest.raises(ValueError):
+        parse_rates(data)
+
+def test_calculation_uses_rates():
+    """
+    Test that the calculation, the table and batches all apply the given rates
+    """
+    rates = Rates("test", 70.0, 130.0, 25.5)
+    data = json.loads(PAYLOAD)
+    result = calculate_supplement(data, rates)
+    assert result["baseAmount"] == 130.0
+    assert result["childrenAmount"] == 51.0
+    assert result["supplementAmount"] == 181.0
+
+    assert SupplementTable(rates).render(data) == json.dumps(result)
+    assert process_supplement_batch([PAYLOAD], rates) == [json.dumps(result)]
+    assert calculate_supplement(data) == calculate_supplement(data, DEFAULT_RATES)
+
+def test_rate_watcher_reloads_changed_file(rate_file):
+    """
+    Test that the watcher applies changed files and skips invalid ones
+    """
+    applied = []
+    watcher = RateWatcher(rate_file, applied.append)
+    assert not watcher.check()
+
+    rate_file.write_text(json.dumps({**RATE_FILE, "version": "2025-02", "childAmount": 30.0}))
+    os.utime(rate_file, ns=(0, 1))
+    assert watcher.check()
+    assert applied[-1].version == "2025-02"
+
+    rate_file.write_text("{not json")
+    assert not watcher.check()
+    assert len(applied) == 1
+
+def test_default_table_hot_reload(rate_file, reset_default_table):
+    """
+    Test that the default table is built from the configured rate file and swapped when the file changes
+    """
+    configure_default_table(str(rate_file), 0.01)
+    first = get_default_table()
+    assert first.stats()["version"] == "2025-01"
+    assert json.loads(process_with_table(PAYLOAD))["supplementAmount"] == 181.0
+
+    rate_file.write_text(json.dumps({**RATE_FILE, "version": "2025-02", "childAmount": 30.0}))
+    os.utime(rate_file, ns=(0, 1))
+    deadline = time.monotonic() + 5
+    while get_default_table() is first and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert get_default_table().stats()["version"] == "2025-02"
+    assert json.loads(process_with_table(PAYLOAD))["supplementAmount"] == 190.0
+    # a message that already holds the old table still renders with the old rates
+    assert json.loads(first.render(json.loads(PAYLOAD)))["supplementAmount"] == 181.0
+
+def test_engine_uses_rate_file_from_its_config(rate_file, reset_default_table):
+    """
+    Test that an engine loads the rate file named in its config rather than the environment
+    """
+    env_vars = {
+        "MQTT_BROKER": "test.mosquitto.org",
+        "MQTT_BROKER_PORT": "1883",
+        "MQTT_INPUT_TOPIC_PREFIX": "BRE/calculateWinterSupplementInput",
+        "MQTT_OUTPUT_TOPIC_PREFIX": "BRE/calculateWinterSupplementOutput",
+        "RATES_FILE": str(rate_file),
+        "RATES_RELOAD_INTERVAL": "0",
+        "ENGINE_WORKER_MODE": "inline",
+    }
+    with patch.dict(os.environ, env_vars, clear=True):
+        config = EngineConfig.from_env()
+    with patch.dict(os.environ, {}, clear=True), patch("paho.mqtt.client.Client"):
+        engine = WinterSupplementEngine(config)
+    assert engine.table.stats()["version"] == "2025-01"
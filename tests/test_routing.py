@@ -0,0 +1,83 @@
+import os
+import pytest
+from unittest.mock import Mock, patch
+from winter_supplement_engine.engine import WinterSupplementEngine
+from winter_supplement_engine.routing import TopicRouter, parse_routes
+
+ROUTES = {
+    "BRE/calculateWinterSupplementInput": "BRE/calculateWinterSupplementOutput",
+    "tenants/acme/input": "tenants/acme/output",
+}
+
+def test_parse_routes():
+    """
+    Test that route pairs are parsed and trailing slashes are ignored
+    """
+    assert parse_routes("a/in=a/out, b/in/=b/out/,") == {"a/in": "a/out", "b/in": "b/out"}
+    with pytest.raises(ValueError):
+        parse_routes("a/in")
+    with pytest.raises(ValueError):
+        parse_routes("a/in=")
+
+def test_router_maps_each_prefix():
+    """
+    Test that every input prefix is routed to its own output prefix
+    """
+    router = TopicRouter(ROUTES)
+    assert router.route("BRE/calculateWinterSupplementInput/abc") == "BRE/calculateWinterSupplementOutput/abc"
+    assert router.route("tenants/acme/input/abc") == "tenants/acme/output/abc"
+    assert router.route("tenants/other/input/abc") is None
+    assert router.route("invalid") is None
+    assert router.route("BRE/calculateWinterSupplementInput/") is None
+    assert router.subscriptions() == ["BRE/calculateWinterSupplementInput/+", "tenants/acme/input/+"]
+
+def test_router_caches_topics():
+    """
+    Test that routed topics are remembered, interned and bounded by the cache size
+    """
+    router = TopicRouter(ROUTES, cache_size=2)
+    first = router.route("tenants/acme/input/" + "abc")
+    assert router.route("tenants/acme/input/" + "abc") is first
+    assert len(router) == 1
+
+    router.route("tenants/acme/input/def")
+    router.route("tenants/acme/input/ghi")
+    assert len(router) == 1
+
+def test_router_with_topic_id():
+    """
+    Test that only the configured topic id is routed when one is set
+    """
+    router = TopicRouter(ROUTES, topic_id="test123")
+    assert router.subscriptions() == ["BRE/calculateWinterSupplementInput/test123", "tenants/acme/input/test123"]
+    assert router.route("tenants/acme/input/test123") == "tenants/acme/output/test123"
+    assert router.route("tenants/acme/input/other") is None
+
+def test_engine_subscribes_to_every_route():
+    """
+    Test that the engine subscribes to every input prefix in one request and routes results back
+    """
+    env_vars = {
+        "MQTT_BROKER": "test.mosquitto.org",
+        "MQTT_BROKER_PORT": "1883",
+        "MQTT_INPUT_TOPIC_PREFIX": "BRE/calculateWinterSupplementInput",
+        "MQTT_OUTPUT_TOPIC_PREFIX": "BRE/calculateWinterSupplementOutput",
+        "MQTT_TOPIC_ROUTES": "tenants/acme/input=tenants/acme/output",
+        "MQTT_SHARED_GROUP": "engines",
+    }
+    with patch.dict(os.environ, env_vars, clear=True), \
+         patch('winter_supplement_engine.engine.load_dotenv'), \
+         patch('winter_supplement_engine.engine.process_supplement_request', return_value=b"{}"):
+        engine = WinterSupplementEngine()
+        client = Mock()
+        engine.on_connect(client, None, None, 0)
+        client.subscribe.assert_called_once_with([
+            ("$share/engines/BRE/calculateWinterSupplementInput/+", 0),
+            ("$share/engines/tenants/acme/input/+", 0),
+        ])
+
+        message = Mock()
+        message.topic = "tenants/acme/input/abc"
+        message.payload = b"{}"
+        engine.on_message(client, None, message)
+        client.publish.assert_called_once_with("tenants/acme/output/abc", b"{}", qos=0, properties=None)
@@ -3,6 +3,9 @@ from winter_supplement_engine.rules import (
     validate_input,
     calculate_supplement,
     process_supplement_request,
+    process_supplement_batch,
+    BatchError,
+    InputColumns,
     WinterSupplementInput,
     WinterSupplementOutput
 )
@@ -202,3 +205,78 @@ def test_json_processing_invalid_data_types():
     })
     result = process_supplement_request(invalid_data_json)
     assert result is None
+
+
+def test_batch_processing_matches_single_requests():
+    """
+    Test that batch processing returns the same output as processing each request on its own
+    """
+    payloads = [
+        json.dumps({
+            "id": f"test{children}-{composition}-{eligible}",
+            "numberOfChildren": children,
+            "familyComposition": composition,
+            "familyUnitInPayForDecember": eligible
+        })
+        for children in (0, 1, 5)
+        for composition in ("single", "couple", "Single")
+        for eligible in (True, False)
+    ]
+    results = process_supplement_batch(payloads)
+    assert results == [process_supplement_request(payload) for payload in payloads]
+
+def test_batch_processing_invalid_items():
+    """
+    Test that invalid items become error records without aborting the batch
+    """
+    valid = json.dumps({
+        "id": "test1",
+        "numberOfChildren": 0,
+        "familyComposition": "couple",
+        "familyUnitInPayForDecember": True
+    })
+    payloads = [
+        "{ invalid json }",
+        valid,
+        json.dumps({"id": "test2", "numberOfChildren": 1}),
+        json.dumps({
+            "id": "test3",
+            "numberOfChildren": 31,
+            "familyComposition": "single",
+            "familyUnitInPayForDecember": True
+        }),
+        b'[1, 2, 3]',
+    ]
+    results = process_supplement_batch(payloads)
+
+    assert len(results) == len(payloads)
+    assert results[0] == BatchError(0, "Invalid JSON input")
+    assert json.loads(results[1])["supplementAmount"] == 120.0
+    assert isinstance(results[2], BatchError) and "Missing required fields" in results[2].error
+    assert isinstance(results[3], BatchError) and "numberOfChildren" in results[3].error
+    assert results[4] == BatchError(4, "Input must be a JSON object")
+
+def test_batch_processing_accepts_iterables():
+    """
+    Test that batch processing accepts any iterable of payloads
+    """
+    payloads = (
+        json.dumps({
+            "id": str(index),
+            "numberOfChildren": index % 3,
+            "familyComposition": "single",
+            "familyUnitInPayForDecember": True
+        })
+        for index in range(100)
+    )
+    results = process_supplement_batch(payloads)
+    assert [json.loads(result)["id"] for result in results] == [str(index) for index in range(100)]
+
+def test_columns_are_compact():
+    """
+    Test that batch columns keep the calculation inputs in typed arrays
+    """
+    columns = InputColumns()
+    columns.append({"id": "a", "numberOfChildren": 1, "familyComposition": "single", "familyUnitInPayForDecember": True})
+    assert len(columns) == 1
+    assert columns.children.itemsize == 2 and columns.eligible.itemsize == 1
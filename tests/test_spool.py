@@ -0,0 +1,174 @@
+import os
+import pytest
+import paho.mqtt.client as mqtt
+from unittest.mock import Mock, patch
+from winter_supplement_engine.engine import WinterSupplementEngine
+from winter_supplement_engine.publisher import BatchPublisher
+from winter_supplement_engine.spool import Spool
+
+@pytest.fixture()
+def mock_env_vars(tmp_path):
+    """
+    Mock environment variables with the spool enabled
+    """
+    env_vars = {
+        "MQTT_BROKER": "test.mosquitto.org",
+        "MQTT_BROKER_PORT": "1883",
+        "MQTT_INPUT_TOPIC_PREFIX": "BRE/calculateWinterSupplementInput",
+        "MQTT_OUTPUT_TOPIC_PREFIX": "BRE/calculateWinterSupplementOutput",
+        "SPOOL_DIR": str(tmp_path / "spool"),
+    }
+    with patch.dict(os.environ, env_vars, clear=True), \
+         patch('winter_supplement_engine.engine.load_dotenv'):
+        yield env_vars
+
+def published_info():
+    info = mqtt.MQTTMessageInfo(1)
+    info._set_as_published()
+    return info
+
+def test_spool_reads_back_records_in_order(tmp_path):
+    """
+    Test that records are read back from the segments in the order they were written
+    """
+    spool = Spool(tmp_path, segment_size=64)
+    for index in range(10):
+        spool.append(f"out/{index}", f'{{"id": "{index}"}}')
+
+    segments = spool.segments()
+    records = [record for segment in segments for record in spool.read(segment)]
+
+    assert len(segments) > 1
+    assert records == [(f"out/{index}", f'{{"id": "{index}"}}'.encode(), "") for index in range(10)]
+    assert len(spool) == 10
+
+def test_spool_survives_restart(tmp_path):
+    """
+    Test that records written by a previous spool are counted and kept after the last one
+    """
+    spool = Spool(tmp_path)
+    spool.append("out/a", b"1")
+    spool.close()
+
+    reopened = Spool(tmp_path)
+    reopened.append("out/b", b"2")
+    records = [record for segment in reopened.segments() for record in reopened.read(segment)]
+
+    assert len(reopened) == 2
+    assert records == [("out/a", b"1", ""), ("out/b", b"2", "")]
+
+def test_spool_ignores_partly_written_record(tmp_path):
+    """
+    Test that a record cut off by a crash is skipped and the records before it are kept
+    """
+    spool = Spool(tmp_path)
+    spool.append("out/a", b"complete")
+    spool.append("out/b", b"cut off")
+    segment, = spool.segments()
+    with open(segment, "r+b") as file:
+        file.truncate(os.path.getsize(segment) - 3)
+
+    assert list(spool.read(segment)) == [("out/a", b"complete", "")]
+
+def test_engine_spools_results_while_disconnected(mock_env_vars):
+    """
+    Test that results are spooled instead of published while the client is disconnected
+    """
+    engine = WinterSupplementEngine()
+    client = Mock()
+    client.is_connected.return_value = False
+
+    engine.publish_result(client, "BRE/calculateWinterSupplementOutput/a", b'{"id": "a"}')
+
+    client.publish.assert_not_called()
+    assert len(engine.spool) == 1
+
+def test_engine_spools_refused_publishes(mock_env_vars):
+    """
+    Test that a publish the client refuses is kept in the spool
+    """
+    engine = WinterSupplementEngine()
+    client = Mock()
+    client.is_connected.return_value = True
+    client.publish.return_value = mqtt.MQTTMessageInfo(1)
+    client.publish.return_value.rc = mqtt.MQTT_ERR_NO_CONN
+
+    engine.publish_result(client, "BRE/calculateWinterSupplementOutput/a", b'{"id": "a"}')
+
+    assert len(engine.spool) == 1
+
+def test_engine_replays_spool_after_reconnect(mock_env_vars):
+    """
+    Test that spooled results are published in order and removed once published
+    """
+    engine = WinterSupplementEngine()
+    client = Mock()
+    client.is_connected.return_value = False
+    for index in range(3):
+        engine.publish_result(client, f"BRE/calculateWinterSupplementOutput/{index}", f"{index}".encode())
+
+    client.is_connected.return_value = True
+    client.publish.side_effect = lambda topic, payload, qos=0, properties=None: published_info()
+    assert engine.replay_spool(client) == 3
+
+    assert [call.args[:2] for call in client.publish.call_args_list] == [
+        (f"BRE/calculateWinterSupplementOutput/{index}", f"{index}".encode()) for index in range(3)
+    ]
+    assert len(engine.spool) == 0
+    assert engine.spool.segments() == []
+
+def test_engine_keeps_segment_when_replay_fails(mock_env_vars):
+    """
+    Test that a segment stays in the spool when the connection drops while replaying it
+    """
+    engine = WinterSupplementEngine()
+    client = Mock()
+    client.is_connected.return_value = False
+    engine.publish_result(client, "BRE/calculateWinterSupplementOutput/a", b"1")
+    engine.publish_result(client, "BRE/calculateWinterSupplementOutput/b", b"2")
+
+    refused = mqtt.MQTTMessageInfo(2)
+    refused.rc = mqtt.MQTT_ERR_NO_CONN
+    client.is_connected.return_value = True
+    client.publish.side_effect = [published_info(), refused]
+
+    assert engine.replay_spool(client) == 0
+    assert len(engine.spool) == 2
+
+def test_on_connect_starts_replay(mock_env_vars):
+    """
+    Test that connecting replays the spool only when it holds results
+    """
+    engine = WinterSupplementEngine()
+    client = Mock()
+    with patch.object(engine, "start_replay") as mock_replay:
+        engine.on_connect(client, None, None, 0)
+        mock_replay.assert_not_called()
+
+        engine.spool.append("BRE/calculateWinterSupplementOutput/a", b"1")
+        engine.on_connect(client, None, None, 0)
+        mock_replay.assert_called_once_with(client)
+
+def test_engine_sets_reconnect_backoff(mock_env_vars):
+    """
+    Test that the client reconnects with the configured backoff
+    """
+    with patch.dict(os.environ, {"RECONNECT_MIN_DELAY": "2", "RECONNECT_MAX_DELAY": "30"}), \
+         patch('paho.mqtt.client.Client') as mock_client:
+        WinterSupplementEngine()
+    mock_client.return_value.reconnect_delay_set.assert_called_once_with(2, 30)
+
+def test_publisher_spools_while_disconnected(tmp_path):
+    """
+    Test that the batch publisher spools results it can't hand to the client
+    """
+    spool = Spool(tmp_path)
+    client = Mock()
+    client.socket.return_value = None
+    client.is_connected.return_value = False
+    publisher = BatchPublisher(client, spool=spool)
+
+    publisher.flush([("out/a", b"1", None), ("out/b", b"2", None)])
+
+    client.publish.assert_not_called()
+    assert len(spool) == 2
@@ -0,0 +1,59 @@
+import os
+import threading
+import time
+from unittest.mock import patch
+from winter_supplement_engine.engine import WinterSupplementEngine
+from winter_supplement_engine.supervisor import Supervisor
+
+def exit_immediately():
+    pass
+
+def sleep_forever():
+    time.sleep(60)
+
+def test_shared_subscription_topic():
+    """
+    Test that MQTT_SHARED_GROUP turns the input topic into a shared subscription
+    """
+    env_vars = {
+        "MQTT_BROKER": "test.mosquitto.org",
+        "MQTT_BROKER_PORT": "1883",
+        "MQTT_INPUT_TOPIC_PREFIX": "BRE/calculateWinterSupplementInput",
+        "MQTT_OUTPUT_TOPIC_PREFIX": "BRE/calculateWinterSupplementOutput",
+        "MQTT_SHARED_GROUP": "engines"
+    }
+    with patch.dict(os.environ, env_vars, clear=True), \
+         patch('winter_supplement_engine.engine.load_dotenv'):
+        engine = WinterSupplementEngine()
+
+    assert engine.input_topic == "BRE/calculateWinterSupplementInput/+"
+    assert engine.subscription_topic == "$share/engines/BRE/calculateWinterSupplementInput/+"
+    # messages arrive on the real topic, without the share prefix
+    assert engine.get_output_topic("BRE/calculateWinterSupplementInput/abc") == "BRE/calculateWinterSupplementOutput/abc"
+
+def test_supervisor_restarts_crashed_workers():
+    """
+    Test that workers that exit are restarted until the supervisor stops
+    """
+    supervisor = Supervisor(2, target=exit_immediately, restart_delay=0.01, poll_interval=0.05)
+    with patch('winter_supplement_engine.supervisor.signal.signal'):
+        timer = threading.Timer(0.5, supervisor.stop)
+        timer.start()
+        supervisor.run()
+
+    assert supervisor.restarts >= 2
+    assert supervisor.workers == {}
+
+def test_supervisor_stops_running_workers():
+    """
+    Test that shutdown terminates workers that are still running
+    """
+    supervisor = Supervisor(2, target=sleep_forever, stop_timeout=5)
+    supervisor.start_worker(0)
+    supervisor.start_worker(1)
+    processes = list(supervisor.workers.values())
+
+    supervisor.shutdown()
+
+    assert all(not process.is_alive() for process in processes)
+    assert supervisor.restarts == 0
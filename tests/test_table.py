@@ -0,0 +1,54 @@
+import json
+from winter_supplement_engine.rules import calculate_supplement, process_supplement_request
+from winter_supplement_engine.table import SupplementTable, get_default_table, process_with_table
+
+def test_table_covers_every_outcome():
+    """
+    Test that the table precomputes every eligibility, composition and children combination
+    """
+    table = SupplementTable()
+    assert table.stats() == {"version": "default", "size": 124, "hits": 0, "misses": 0}
+
+def test_table_render_matches_calculation():
+    """
+    Test that table lookups give the same JSON as calculating and serializing the output
+    """
+    table = SupplementTable()
+    for number_of_children in (0, 1, 30):
+        for family_composition in ("single", "couple"):
+            for is_eligible in (True, False):
+                data = {
+                    "id": "test\"quoted\"",
+                    "numberOfChildren": number_of_children,
+                    "familyComposition": family_composition,
+                    "familyUnitInPayForDecember": is_eligible
+                }
+                assert table.render(data) == json.dumps(calculate_supplement(data))
+    assert table.stats()["hits"] == 12
+
+def test_table_miss_is_calculated():
+    """
+    Test that inputs outside the table are calculated and counted as misses
+    """
+    table = SupplementTable()
+    data = {
+        "id": "test1",
+        "numberOfChildren": 0,
+        "familyComposition": "Single",
+        "familyUnitInPayForDecember": True
+    }
+    assert table.render(data) == json.dumps(calculate_supplement(data))
+    assert table.stats()["misses"] == 1
+
+def test_process_with_table():
+    """
+    Test that processing with the default table matches processing without it
+    """
+    payload = json.dumps({
+        "id": "test1",
+        "numberOfChildren": 3,
+        "familyComposition": "couple",
+        "familyUnitInPayForDecember": True
+    })
+    assert process_with_table(payload) == process_supplement_request(payload)
+    assert get_default_table() is get_default_table()
@@ -0,0 +1,75 @@
+import pytest
+from typing import Annotated, Literal, TypedDict
+from winter_supplement_engine.rules import check_input
+from winter_supplement_engine.validation import compile_validator, Range, ValidationError
+
+def test_check_input_valid():
+    """
+    Test that a valid input has no errors
+    """
+    valid_input = {
+        "id": "test123",
+        "numberOfChildren": 2,
+        "familyComposition": "Couple",
+        "familyUnitInPayForDecember": False
+    }
+    assert check_input(valid_input) == []
+
+def test_check_input_reports_every_invalid_field():
+    """
+    Test that every invalid field is reported as a structured error
+    """
+    invalid_input = {
+        "id": 123,
+        "numberOfChildren": 31,
+        "familyComposition": "invalid",
+        "familyUnitInPayForDecember": "true"
+    }
+    errors = check_input(invalid_input)
+    assert [error.field for error in errors] == [
+        "id",
+        "numberOfChildren",
+        "familyComposition",
+        "familyUnitInPayForDecember"
+    ]
+    assert errors[1] == ValidationError(
+        "numberOfChildren",
+        "numberOfChildren must be a non-negative integer not exceeding 30"
+    )
+    assert errors[2].message == "familyComposition must be either 'single' or 'couple'"
+
+def test_check_input_missing_fields():
+    """
+    Test that missing fields are reported before any value is checked
+    """
+    errors = check_input({"id": 123, "numberOfChildren": 2})
+    assert sorted(error.field for error in errors) == ["familyComposition", "familyUnitInPayForDecember"]
+
+def test_check_input_not_an_object():
+    """
+    Test that non-object inputs are rejected without raising
+    """
+    assert check_input([1, 2, 3]) == [ValidationError("", "Input must be a JSON object")]
+    assert check_input(None) == [ValidationError("", "Input must be a JSON object")]
+
+def test_compile_validator_range():
+    """
+    Test that Range metadata on other TypedDicts is compiled into bounds checks
+    """
+    class Sample(TypedDict):
+        level: Annotated[int, Range(1, 5)]
+        mode: Literal["on", "off"]
+
+    validator = compile_validator(Sample)
+    assert validator({"level": 3, "mode": "ON"}) == []
+    assert validator({"level": 0, "mode": "on"}) == [ValidationError("level", "level must be an integer between 1 and 5")]
+
+def test_compile_validator_unsupported_annotation():
+    """
+    Test that unsupported annotations fail when compiling instead of when validating
+    """
+    class Sample(TypedDict):
+        amount: float
+
+    with pytest.raises(TypeError):
+        compile_validator(Sample)
@@ -0,0 +1,51 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from winter_supplement_engine.rules import calculate_supplement, MAX_CHILDREN
+from winter_supplement_engine.vectorized import (
+    calculate_supplement_arrays,
+    encode_compositions,
+    COMPOSITION_SINGLE,
+    COMPOSITION_COUPLE
+)
+
+def test_encode_compositions():
+    """
+    Test that only an exact "single" is encoded as a single person
+    """
+    codes = encode_compositions(["single", "couple", "Single"])
+    assert codes.tolist() == [COMPOSITION_SINGLE, COMPOSITION_COUPLE, COMPOSITION_COUPLE]
+
+def test_arrays_match_scalar_calculation():
+    """
+    Test that the vectorized kernel gives exactly the same amounts as calculate_supplement
+    """
+    inputs = [
+        {
+            "id": "test",
+            "numberOfChildren": children,
+            "familyComposition": composition,
+            "familyUnitInPayForDecember": eligible
+        }
+        for children in range(MAX_CHILDREN + 1)
+        for composition in ("single", "couple", "Single")
+        for eligible in (True, False)
+    ]
+    base, children_amount, total = calculate_supplement_arrays(
+        [data["numberOfChildren"] for data in inputs],
+        encode_compositions(data["familyComposition"] for data in inputs),
+        [data["familyUnitInPayForDecember"] for data in inputs]
+    )
+    expected = [calculate_supplement(data) for data in inputs]
+
+    assert base.tolist() == [output["baseAmount"] for output in expected]
+    assert children_amount.tolist() == [output["childrenAmount"] for output in expected]
+    assert total.tolist() == [output["supplementAmount"] for output in expected]
+
+def test_arrays_shape_mismatch():
+    """
+    Test that columns of different lengths raise ValueError
+    """
+    with pytest.raises(ValueError):
+        calculate_supplement_arrays([0, 1], [COMPOSITION_SINGLE], [True, True])
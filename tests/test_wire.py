@@ -0,0 +1,107 @@
+import json
+import os
+import pytest
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+from unittest.mock import Mock, patch
+from winter_supplement_engine import wire
+from winter_supplement_engine.engine import WinterSupplementEngine
+from winter_supplement_engine.rules import Rates, calculate_supplement, process_supplement_request
+
+INPUTS = [
+    {"id": "a", "numberOfChildren": 0, "familyComposition": "single", "familyUnitInPayForDecember": True},
+    {"id": "b", "numberOfChildren": 3, "familyComposition": "couple", "familyUnitInPayForDecember": True},
+    {"id": "ç", "numberOfChildren": 2, "familyComposition": "single", "familyUnitInPayForDecember": False},
+]
+
+@pytest.fixture()
+def mock_env_vars():
+    """
+    Mock environment variables for the engine
+    """
+    env_vars = {
+        "MQTT_BROKER": "test.mosquitto.org",
+        "MQTT_BROKER_PORT": "1883",
+        "MQTT_INPUT_TOPIC_PREFIX": "BRE/calculateWinterSupplementInput",
+        "MQTT_OUTPUT_TOPIC_PREFIX": "BRE/calculateWinterSupplementOutput",
+    }
+    with patch.dict(os.environ, env_vars, clear=True), \
+         patch('winter_supplement_engine.engine.load_dotenv'):
+        yield env_vars
+
+def binary_properties(content_type=wire.CONTENT_TYPE):
+    properties = Properties(PacketTypes.PUBLISH)
+    properties.ContentType = content_type
+    return properties
+
+def test_binary_batch_matches_json_outputs():
+    """
+    Test that a batch of binary inputs gets the same outputs as the JSON path, in order
+    """
+    result = wire.process_binary_request(wire.encode_inputs(INPUTS))
+    assert wire.decode_outputs(result) == [calculate_supplement(data) for data in INPUTS]
+
+def test_binary_is_smaller_than_json():
+    """
+    Test that binary requests and replies are smaller than their JSON equivalents
+    """
+    request = wire.encode_inputs(INPUTS[:1])
+    reply = wire.process_binary_request(request)
+    assert len(request) < len(json.dumps(INPUTS[0])) / 5
+    assert len(reply) < len(process_supplement_request(json.dumps(INPUTS[0])))
+
+def test_binary_uses_rates():
+    """
+    Test that binary replies are calculated with the given rates
+    """
+    rates = Rates("test", 1.0, 2.0, 3.0)
+    output, = wire.decode_outputs(wire.process_binary_request(wire.encode_inputs(INPUTS[1:2]), rates))
+    assert output["supplementAmount"] == 11.0
+
+def test_invalid_binary_record_keeps_its_place():
+    """
+    Test that an out of range record is answered as invalid without affecting the others
+    """
+    payload = bytearray(wire.encode_inputs(INPUTS[:2]))
+    # composition of the first record
+    payload[wire.COUNT.size + 3] = 7
+    outputs = wire.decode_outputs(wire.process_binary_request(bytes(payload)))
+    assert outputs == [None, calculate_supplement(INPUTS[1])]
+
+@pytest.mark.parametrize("payload", [b"", b"\x01\x00", wire.encode_inputs(INPUTS)[:-1], wire.encode_inputs(INPUTS) + b"\x00"])
+def test_malformed_binary_payload(payload):
+    """
+    Test that truncated or oversized payloads are rejected
+    """
+    assert wire.process_binary_request(payload) is None
+
+def test_is_binary():
+    """
+    Test that the binary format is selected by content type or user property only
+    """
+    user_property = Properties(PacketTypes.PUBLISH)
+    user_property.UserProperty = [wire.FORMAT_PROPERTY]
+
+    assert wire.is_binary(binary_properties())
+    assert wire.is_binary(user_property)
+    assert not wire.is_binary(binary_properties("application/json"))
+    assert not wire.is_binary(Properties(PacketTypes.PUBLISH))
+    assert not wire.is_binary(None)
+
+def test_engine_replies_in_binary(mock_env_vars):
+    """
+    Test that the engine answers a binary request in binary with the content type set
+    """
+    engine = WinterSupplementEngine()
+    client = Mock()
+    message = Mock()
+    message.topic = "BRE/calculateWinterSupplementInput/tenant"
+    message.payload = wire.encode_inputs(INPUTS)
+    message.properties = binary_properties()
+
+    engine.on_message(client, None, message)
+
+    topic, payload = client.publish.call_args.args
+    assert topic == "BRE/calculateWinterSupplementOutput/tenant"
+    assert client.publish.call_args.kwargs["properties"].ContentType == wire.CONTENT_TYPE
+    assert wire.decode_outputs(payload) == [calculate_supplement(data) for data in INPUTS]
@@ -0,0 +1,106 @@
+import os
+import threading
+import time
+import pytest
+from concurrent.futures import BrokenExecutor
+from winter_supplement_engine.rules import process_supplement_request
+from winter_supplement_engine.workers import WorkerPool
+
+VALID_PAYLOAD = b'{"id": "test1", "numberOfChildren": 2, "familyComposition": "single", "familyUnitInPayForDecember": true}'
+
+def test_worker_pool_invalid_mode():
+    """
+    Test that an unknown worker mode raises ValueError
+    """
+    with pytest.raises(ValueError) as exc_info:
+        WorkerPool("fibers")
+    assert "Invalid worker mode" in str(exc_info.value)
+
+def test_worker_pool_default_queue_size():
+    """
+    Test that the queue size defaults to two slots per worker
+    """
+    pool = WorkerPool("thread", workers=3)
+    try:
+        assert pool.queue_size == 6
+    finally:
+        pool.shutdown()
+
+def test_worker_pool_processes_payloads():
+    """
+    Test that results are handed to the callback for every payload
+    """
+    pool = WorkerPool("thread", workers=2)
+    results = []
+    lock = threading.Lock()
+
+    def collect(future):
+        with lock:
+            results.append(future.result())
+
+    for _ in range(10):
+        pool.submit(process_supplement_request, VALID_PAYLOAD, collect)
+    pool.shutdown()
+
+    assert len(results) == 10
+    assert all('"supplementAmount": 160.0' in result for result in results)
+
+def test_worker_pool_backpressure():
+    """
+    Test that submit blocks while the queue is full and resumes once a slot frees up
+    """
+    pool = WorkerPool("thread", workers=1, queue_size=1)
+    release = threading.Event()
+    submitted = threading.Event()
+
+    pool.submit(lambda payload: release.wait(), None, lambda future: None)
+
+    def submit_second():
+        pool.submit(lambda payload: payload, None, lambda future: None)
+        submitted.set()
+
+    thread = threading.Thread(target=submit_second)
+    thread.start()
+
+    # the second submit must wait for the first payload to finish
+    assert not submitted.wait(0.2)
+    release.set()
+    assert submitted.wait(2)
+
+    thread.join()
+    pool.shutdown()
+
+def test_worker_pool_process_mode():
+    """
+    Test that the process pool runs the business rules and returns results
+    """
+    pool = WorkerPool("process", workers=1)
+    results = []
+    pool.submit(process_supplement_request, VALID_PAYLOAD, lambda future: results.append(future.result()))
+    pool.shutdown()
+
+    assert len(results) == 1
+    assert '"baseAmount": 120.0' in results[0]
+
+def exit_worker(payload):
+    os._exit(1)
+
+def test_worker_pool_restarts_broken_process_pool():
+    """
+    Test that a process pool whose worker died is replaced instead of refusing every later payload
+    """
+    pool = WorkerPool("process", workers=1)
+    failures = []
+    pool.submit(exit_worker, None, lambda future: failures.append(future.exception()))
+    # let the pool notice its worker died
+    deadline = time.monotonic() + 5
+    while not failures and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    results = []
+    pool.submit(process_supplement_request, VALID_PAYLOAD, lambda future: results.append(future.result()))
+    pool.shutdown()
+
+    assert isinstance(failures[0], BrokenExecutor)
+    assert pool.restarts == 1
+    assert '"baseAmount": 120.0' in results[0]
@@ -0,0 +1,136 @@
+import threading
+from collections import deque
+from time import monotonic
+from typing import Any, Optional
+
+# what a full queue drops to make room for a new message
+SHED_POLICIES = ("newest", "largest")
+
+def topic_tenant(topic: str) -> str:
+    """Return the tenant a message belongs to, the topic id at the end of its topic"""
+    return topic.rpartition("/")[2]
+
+class RateLimiter:
+    """Token bucket per tenant, each refilled at rate tokens a second up to burst
+
+    Buckets are locked, a connection pool calls allow() from the network thread of
+    every connection. Once max_tenants buckets exist, the ones that refilled
+    completely are dropped, they belong to tenants that haven't been limited lately.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None, max_tenants: int = 10000):
+        if rate <= 0:
+            raise ValueError(f"Invalid value for ADMISSION_RATE: {rate}")
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1.0)
+        if self.burst < 1:
+            raise ValueError(f"Invalid value for ADMISSION_BURST: {self.burst}")
+        self.max_tenants = max_tenants
+        # tenant -> [tokens, time of the last refill]
+        self._buckets: dict[str, list[float]] = {}
+        self._lock = threading.Lock()
+
+    def allow(self, tenant: str, now: Optional[float] = None) -> bool:
+        """Take a token from the tenant's bucket, return False if it's empty"""
+        if now is None:
+            now = monotonic()
+        with self._lock:
+            bucket = self._buckets.get(tenant)
+            if bucket is None:
+                if len(self._buckets) >= self.max_tenants:
+                    self._evict_full(now)
+                bucket = self._buckets[tenant] = [self.burst, now]
+            else:
+                # pool threads can call with slightly older times, a bucket never goes back in time
+                bucket[0] = min(self.burst, bucket[0] + max(now - bucket[1], 0) * self.rate)
+                bucket[1] = max(now, bucket[1])
+            if bucket[0] < 1:
+                return False
+            bucket[0] -= 1
+            return True
+
+    def _evict_full(self, now: float):
+        full = [
+            tenant for tenant, (tokens, updated) in self._buckets.items()
+            if tokens + (now - updated) * self.rate >= self.burst
+        ]
+        for tenant in full:
+            del self._buckets[tenant]
+        # every tenant is being limited, start over rather than grow without bound
+        if not full:
+            self._buckets.clear()
+
+    def __len__(self):
+        return len(self._buckets)
+
+class FairQueue:
+    """Bounded queue with a FIFO per tenant, taken from in round robin
+
+    A tenant with a backlog gets one turn per cycle like every other tenant, so it
+    can't delay the others by more than one message each. When the queue is full,
+    policy "newest" drops the incoming message and "largest" drops the oldest
+    message of the tenant with the most queued.
+    """
+
+    def __init__(self, capacity: int, policy: str = "newest"):
+        if capacity < 1:
+            raise ValueError(f"Invalid value for ADMISSION_QUEUE_SIZE: {capacity}")
+        if policy not in SHED_POLICIES:
+            raise ValueError(f"Invalid value for ADMISSION_SHED_POLICY: {policy} (expected one of {', '.join(SHED_POLICIES)})")
+        self.capacity = capacity
+        self.policy = policy
+        self.size = 0
+        self.closed = False
+        self._queues: dict[str, deque] = {}
+        # tenants with queued messages, in the order they get their next turn
+        self._turns: deque[str] = deque()
+        self._condition = threading.Condition()
+
+    def put(self, tenant: str, item: Any) -> Optional[tuple[str, Any]]:
+        """Queue an item without blocking, return the (tenant, item) that was shed to fit it, if any"""
+        with self._condition:
+            shed = None
+            if self.size >= self.capacity:
+                if self.policy == "newest":
+                    return tenant, item
+                victim = max(self._queues, key=lambda queued: len(self._queues[queued]))
+                shed = victim, self._queues[victim].popleft()
+                self.size -= 1
+                if not self._queues[victim]:
+                    del self._queues[victim]
+                    self._turns.remove(victim)
+
+            queue = self._queues.get(tenant)
+            if queue is None:
+                queue = self._queues[tenant] = deque()
+                self._turns.append(tenant)
+            queue.append(item)
+            self.size += 1
+            self._condition.notify()
+            return shed
+
+    def get(self) -> Optional[tuple[str, Any]]:
+        """Wait for the next tenant's oldest item, None once closed and empty"""
+        with self._condition:
+            while not self.size and not self.closed:
+                self._condition.wait()
+            if not self.size:
+                return None
+            tenant = self._turns.popleft()
+            queue = self._queues[tenant]
+            item = queue.popleft()
+            self.size -= 1
+            if queue:
+                self._turns.append(tenant)
+            else:
+                del self._queues[tenant]
+            return tenant, item
+
+    def close(self):
+        """Let get() return None once the queued items are taken"""
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+    def __len__(self):
+        return self.size
@@ -0,0 +1,320 @@
+import asyncio
+import logging
+import signal
+from functools import partial
+from time import perf_counter
+from winter_supplement_engine import metrics
+from winter_supplement_engine import wire
+from winter_supplement_engine.config import EngineConfig, load_dotenv
+from winter_supplement_engine.engine import REPLAY_TIMEOUT, WinterSupplementEngine
+from winter_supplement_engine.log import configure_logging, message_log
+
+logger = logging.getLogger(__name__)
+
+class AsyncWinterSupplementEngine(WinterSupplementEngine):
+    """Engine driven by an asyncio event loop instead of paho's blocking network loop"""
+
+    def __init__(self, concurrency=None, config=None):
+        super().__init__(config)
+
+        # the event loop drives a single socket, pools need the threaded engine
+        if len(self.pool) > 1:
+            raise ValueError("The asyncio engine supports one connection, unset MQTT_BROKERS and MQTT_CONNECTIONS")
+
+        # maximum number of messages processed at once, reading pauses when reached
+        if concurrency is None:
+            concurrency = self.config.concurrency
+        if concurrency < 1:
+            raise ValueError(f"Invalid value for ENGINE_CONCURRENCY: {concurrency}")
+        self.concurrency = concurrency
+
+        # publishes are already written together when the event loop finds the socket
+        # writable, and the batching thread can't safely drive the loop's socket callbacks
+        self.publisher = self.pool.primary.publisher = None
+
+        # messages run as tasks as soon as they're read, rate limits still apply but
+        # there's no queue in front of the workers to take turns from
+        self.admission_queue = None
+
+        self.loop = None
+        self.tasks = set()
+        self.reading_paused = False
+        self._misc_task = None
+        # set by stop() or close(), run() returns once it is
+        self._closing = None
+        # set when the socket closes, the connection task reconnects when it is
+        self._socket_closed = None
+        self._connection_task = None
+        self._reconnect_delay = self.reconnect_min_delay
+
+        # let the event loop drive the client's socket
+        self.client.on_socket_open = self.on_loop(self.on_socket_open)
+        self.client.on_socket_close = self.on_loop(self.on_socket_close)
+        self.client.on_socket_register_write = self.on_loop(self.on_socket_register_write)
+        self.client.on_socket_unregister_write = self.on_loop(self.on_socket_unregister_write)
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        await self.close()
+
+    async def connect(self):
+        """Connect to the broker on the running event loop, lost connections are reestablished until close()"""
+        self.loop = asyncio.get_running_loop()
+        self._closing = asyncio.Event()
+        self._socket_closed = asyncio.Event()
+        logger.info("Connecting to MQTT broker: %s:%s", self.mqtt_broker, self.mqtt_broker_port)
+        connected = False
+        if not self.retry_first_connect:
+            # a broker that can't be reached at startup is an error, like in the threaded engine
+            await self.connect_client()
+            connected = True
+        self._connection_task = self.loop.create_task(self.keep_connected(connected))
+
+    async def keep_connected(self, connected):
+        """Reconnect whenever the socket closes, waiting RECONNECT_MIN_DELAY and doubling up to RECONNECT_MAX_DELAY"""
+        while not self._closing.is_set():
+            if connected:
+                await self._socket_closed.wait()
+                if self._closing.is_set():
+                    return
+            delay = self._reconnect_delay
+            self._reconnect_delay = min(delay * 2, self.reconnect_max_delay)
+            logger.info("Reconnecting to MQTT broker in %ss", delay)
+            await asyncio.sleep(delay)
+            if self._closing.is_set():
+                return
+            try:
+                await self.connect_client()
+                connected = True
+            except OSError as e:
+                logger.warning("Failed to connect to MQTT broker: %s", e)
+                connected = False
+
+    async def connect_client(self):
+        # the DNS lookup and TCP handshake block, they run on the default executor
+        # and the socket callbacks paho calls from there are passed back to the event loop
+        await self.loop.run_in_executor(None, self.client.connect, self.mqtt_broker, self.mqtt_broker_port)
+
+    def on_connect(self, client, userdata, flags, rc, properties=None):
+        super().on_connect(client, userdata, flags, rc, properties)
+        if rc == 0:
+            self._reconnect_delay = self.reconnect_min_delay
+
+    async def close(self):
+        """Finish in-flight messages and disconnect from the broker"""
+        if self._closing is not None:
+            self._closing.set()
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.client.disconnect()
+        if self._socket_closed is not None and self.client.socket() is not None:
+            await self._socket_closed.wait()
+        if self._connection_task is not None:
+            self._connection_task.cancel()
+        if self.worker_pool is not None:
+            self.worker_pool.shutdown()
+        if self.spool is not None:
+            self.spool.close()
+
+    def stop(self):
+        """Make run() return, it finishes the in-flight messages and disconnects first"""
+        if self.loop is not None and self._closing is not None:
+            self.loop.call_soon_threadsafe(self._closing.set)
+
+    async def run(self):
+        """Run the engine until stop() is called, reconnecting whenever the connection drops"""
+        async with self:
+            await self._closing.wait()
+
+    def on_loop(self, callback):
+        """Wrap a socket callback so it always runs on the event loop, whichever thread paho calls it from"""
+        def call(*args):
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+            if running is self.loop:
+                callback(*args)
+            else:
+                self.loop.call_soon_threadsafe(callback, *args)
+        return call
+
+    # socket callbacks, called by paho when the event loop has to watch the socket
+    def on_socket_open(self, client, userdata, sock):
+        self._socket_closed.clear()
+        self.reading_paused = False
+        self.loop.add_reader(sock, client.loop_read)
+        self._misc_task = self.loop.create_task(self.misc_loop(client))
+
+    def on_socket_close(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+        if self._misc_task is not None:
+            self._misc_task.cancel()
+        self._socket_closed.set()
+
+    def on_socket_register_write(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+
+    async def misc_loop(self, client):
+        # keepalives and retries, paho expects this about once a second
+        while client.loop_misc() == 0:
+            await asyncio.sleep(1)
+
+    # callback when message is received, runs on the event loop
+    def on_message(self, client, userdata, message):
+        trace = metrics.begin_trace() if metrics.tracing else None
+        start = perf_counter() if metrics.enabled or trace is not None else None
+        metrics.MESSAGES_RECEIVED.inc()
+        # set once a task took the message, which then times it when the result is published
+        handed_off = False
+        try:
+            topic = message.topic
+            payload = message.payload
+            if message_log.enabled():
+                message_log.logger.info(
+                    "Message received on topic %s: %s", topic, message_log.payload(payload),
+                    extra={"topic": topic}
+                )
+
+            output_topic = self.router.route(topic)
+            if output_topic is None:
+                metrics.FAILED_INVALID_TOPIC.inc()
+                message_log.info("Invalid topic format: %s", topic, topic=topic)
+                return
+
+            if self.rate_limiter is not None and not self.admit(topic):
+                return
+
+            properties = wire.REPLY_PROPERTIES if wire.is_binary(message.properties) else None
+
+            # duplicates are answered on the event loop without starting a task
+            table = self.table
+            cache_key = None
+            if self.result_cache is not None:
+                cache_key = self.result_cache.key(payload)
+                result = self.result_cache.get(cache_key, table)
+                if result is not None:
+                    self.publish_result(client, output_topic, result, properties)
+                    return
+
+            received = (topic, start, trace) if start is not None else None
+            task = self.loop.create_task(
+                self.handle_message(client, output_topic, payload, cache_key, table, properties, received)
+            )
+            self.tasks.add(task)
+            task.add_done_callback(self.on_task_done)
+            handed_off = True
+
+            # stop reading from the broker until a slot frees up
+            if len(self.tasks) >= self.concurrency:
+                self.pause_reading(client)
+
+        except Exception:
+            metrics.FAILED_ERROR.inc()
+            logger.exception("Error processing message")
+
+        finally:
+            if trace is not None:
+                metrics.end_trace()
+            if start is not None and not handed_off:
+                self.observe_message(message.topic, start, trace)
+
+    async def handle_message(self, client, output_topic, payload, cache_key=None, table=None, properties=None,
+                             received=None):
+        """Process a payload off the event loop and publish its result"""
+        trace = received[2] if received is not None else None
+        try:
+            executor = self.worker_pool.executor if self.worker_pool is not None else None
+            process = self.request_processor(properties, table or self.table, trace)
+            result = self.unpack_result(await self.loop.run_in_executor(executor, partial(process, payload)))
+            self.cache_result(cache_key, table, result)
+            # other tasks run between awaits, the trace is only this message's while publishing
+            if trace is not None:
+                metrics.begin_trace(trace)
+            try:
+                self.publish_result(client, output_topic, result, properties)
+            finally:
+                if trace is not None:
+                    metrics.end_trace()
+        except Exception:
+            metrics.FAILED_ERROR.inc()
+            logger.exception("Error processing message")
+        finally:
+            if received is not None:
+                self.observe_message(*received)
+
+    def start_replay(self, client):
+        """Replay the spool as a task, publishes have to be made on the event loop"""
+        task = self.loop.create_task(self.replay_spool_async(client))
+        self.tasks.add(task)
+        task.add_done_callback(self.on_task_done)
+
+    async def replay_spool_async(self, client) -> int:
+        """Publish every spooled result, yielding to the event loop while each segment is sent"""
+        if not self._replay_lock.acquire(blocking=False):
+            return 0
+        replayed = 0
+        try:
+            steps = self.replay_segments(client, self.spool)
+            try:
+                info = next(steps)
+                while True:
+                    # the event loop writes the segment out while this waits
+                    deadline = self.loop.time() + REPLAY_TIMEOUT
+                    while not info.is_published() and self.loop.time() < deadline and client.is_connected():
+                        await asyncio.sleep(0.01)
+                    info = steps.send(info.is_published())
+            except StopIteration as done:
+                replayed = done.value
+            return replayed
+        finally:
+            self._replay_lock.release()
+            if replayed:
+                logger.info("Replayed %s spooled results", replayed)
+
+    def on_task_done(self, task):
+        self.tasks.discard(task)
+        if self.reading_paused and len(self.tasks) < self.concurrency:
+            self.resume_reading(self.client)
+
+    def pause_reading(self, client):
+        sock = client.socket()
+        if sock is not None and not self.reading_paused:
+            self.loop.remove_reader(sock)
+            self.reading_paused = True
+
+    def resume_reading(self, client):
+        sock = client.socket()
+        if sock is not None and self.reading_paused:
+            self.loop.add_reader(sock, client.loop_read)
+        self.reading_paused = False
+
+    def start(self):
+        """Start the engine on a new event loop"""
+        try:
+            self.serve_metrics()
+            asyncio.run(self.run())
+        except Exception as e:
+            logger.error("An error occurred: %s", e)
+            exit(1)
+
+def main():
+    load_dotenv()
+    config = EngineConfig.from_env()
+    configure_logging(config=config)
+    engine = AsyncWinterSupplementEngine(config=config)
+    # disconnect cleanly on SIGTERM so queued logs are flushed on exit
+    signal.signal(signal.SIGTERM, lambda signum, frame: engine.stop())
+    # `kill -USR1 <pid>` profiles the running engine
+    signal.signal(signal.SIGUSR1, lambda signum, frame: engine.start_profile())
+    engine.start()
+
+
+if __name__ == "__main__":
+    main()
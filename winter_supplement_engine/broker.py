@@ -0,0 +1,432 @@
+"""Lightweight in-process MQTT broker for local load testing.
+
+Supports MQTT 3.1.1 and 5.0 clients with QoS 0/1/2 publishes, + and # wildcards
+and $share shared subscriptions. Subscriptions are granted at most QoS 1 and
+retained messages, wills and persistent sessions are not supported.
+"""
+import argparse
+import asyncio
+import itertools
+import threading
+from typing import Optional
+
+# packet types
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+PUBREC = 5
+PUBREL = 6
+PUBCOMP = 7
+SUBSCRIBE = 8
+SUBACK = 9
+UNSUBSCRIBE = 10
+UNSUBACK = 11
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+# highest QoS granted to subscriptions
+MAX_QOS = 1
+
+# pause the publisher when a subscriber has this many bytes waiting to be sent
+WRITE_HIGH_WATER = 256 * 1024
+
+# MQTT v5 publish property ids and the size of their values
+# None means a two byte length prefixed value, "pair" is two of those
+PUBLISH_PROPERTY_SIZES = {
+    0x01: 1,  # payload format indicator
+    0x02: 4,  # message expiry interval
+    0x03: None,  # content type
+    0x08: None,  # response topic
+    0x09: None,  # correlation data
+    0x0B: "varint",  # subscription identifier
+    0x23: 2,  # topic alias
+    0x26: "pair",  # user property
+}
+TOPIC_ALIAS = 0x23
+
+def encode_varint(value: int) -> bytes:
+    encoded = bytearray()
+    while True:
+        byte = value % 128
+        value //= 128
+        if value:
+            byte |= 0x80
+        encoded.append(byte)
+        if not value:
+            return bytes(encoded)
+
+def decode_varint(data: bytes, pos: int) -> tuple[int, int]:
+    value = 0
+    for shift in range(0, 28, 7):
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+    raise ValueError("Malformed variable byte integer")
+
+def encode_string(value: str) -> bytes:
+    encoded = value.encode()
+    return len(encoded).to_bytes(2, "big") + encoded
+
+def decode_string(data: bytes, pos: int) -> tuple[str, int]:
+    data_bytes, pos = decode_binary(data, pos)
+    return data_bytes.decode(), pos
+
+def decode_binary(data: bytes, pos: int) -> tuple[bytes, int]:
+    length = int.from_bytes(data[pos:pos + 2], "big")
+    return data[pos + 2:pos + 2 + length], pos + 2 + length
+
+def packet(packet_type: int, body: bytes = b"", flags: int = 0) -> bytes:
+    return bytes([packet_type << 4 | flags]) + encode_varint(len(body)) + body
+
+def strip_topic_alias(properties: bytes) -> bytes:
+    """Remove the publisher's topic alias, which only applies to its own connection"""
+    pos = 0
+    kept = bytearray()
+    while pos < len(properties):
+        start = pos
+        property_id = properties[pos]
+        pos += 1
+        size = PUBLISH_PROPERTY_SIZES.get(property_id)
+        if property_id not in PUBLISH_PROPERTY_SIZES:
+            # unknown property, forward everything that's left untouched
+            return bytes(kept + properties[start:])
+        if size == "varint":
+            _, pos = decode_varint(properties, pos)
+        elif size == "pair":
+            _, pos = decode_binary(properties, pos)
+            _, pos = decode_binary(properties, pos)
+        elif size is None:
+            _, pos = decode_binary(properties, pos)
+        else:
+            pos += size
+        if property_id != TOPIC_ALIAS:
+            kept += properties[start:pos]
+    return bytes(kept)
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    """Check a topic against a subscription filter with + and # wildcards"""
+    filter_parts = topic_filter.split("/")
+    topic_parts = topic.split("/")
+
+    # wildcards at the first level don't match $ topics
+    if topic.startswith("$") and filter_parts[0] in ("+", "#"):
+        return False
+
+    for index, part in enumerate(filter_parts):
+        if part == "#":
+            return True
+        if index >= len(topic_parts):
+            return False
+        if part != "+" and part != topic_parts[index]:
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+class Session:
+    """A connected client"""
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.client_id = ""
+        self.protocol = 4
+        self.connected = False
+        self.packet_ids = itertools.cycle(range(1, 65536))
+
+    def send(self, data: bytes):
+        if not self.writer.is_closing():
+            self.writer.write(data)
+
+    async def drain(self):
+        if self.writer.transport.get_write_buffer_size() > WRITE_HIGH_WATER:
+            try:
+                await self.writer.drain()
+            except ConnectionError:
+                pass
+
+class LocalBroker:
+    """MQTT broker running on its own event loop, in a background thread or an existing loop"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+
+        # filter -> {session: qos}
+        self.subscriptions: dict[str, dict[Session, int]] = {}
+        # (group, filter) -> {session: qos}
+        self.shared_subscriptions: dict[tuple[str, str], dict[Session, int]] = {}
+        self._shared_turns: dict[tuple[str, str], int] = {}
+        self.sessions: dict[str, Session] = {}
+
+        self.messages_received = 0
+        self.messages_delivered = 0
+
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._client_ids = itertools.count(1)
+        self._connections: dict[asyncio.Task, asyncio.StreamWriter] = {}
+
+    # running in a background thread
+    def start(self, timeout: float = 5.0) -> "LocalBroker":
+        """Start the broker on a background thread and wait until it is listening"""
+        ready = threading.Event()
+        errors = []
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            try:
+                self._loop.run_until_complete(self.listen())
+            except Exception as e:
+                errors.append(e)
+                ready.set()
+                return
+            ready.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self.close())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name="local-broker", daemon=True)
+        self._thread.start()
+        if not ready.wait(timeout):
+            raise TimeoutError("Local broker did not start in time")
+        if errors:
+            raise errors[0]
+        return self
+
+    def stop(self, timeout: float = 5.0):
+        """Stop a broker started with start()"""
+        if self._loop is not None and self._thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.stop()
+
+    # running on an existing event loop
+    async def listen(self):
+        """Start listening, the actual port is available on self.port afterwards"""
+        self._server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.listen()
+        await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+        # closing the sockets ends each connection's read loop
+        for writer in self._connections.values():
+            writer.close()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        if self._server is not None:
+            await self._server.wait_closed()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        session = Session(writer)
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        try:
+            while True:
+                header = (await reader.readexactly(1))[0]
+                length = 0
+                for shift in range(0, 28, 7):
+                    byte = (await reader.readexactly(1))[0]
+                    length |= (byte & 0x7F) << shift
+                    if not byte & 0x80:
+                        break
+                body = await reader.readexactly(length) if length else b""
+
+                packet_type = header >> 4
+                if not session.connected and packet_type != CONNECT:
+                    break
+                if packet_type == DISCONNECT:
+                    break
+                await self.handle_packet(session, packet_type, header & 0x0F, body)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError, IndexError, UnicodeDecodeError):
+            pass
+        finally:
+            self._connections.pop(task, None)
+            self.remove_session(session)
+            writer.close()
+
+    async def handle_packet(self, session: Session, packet_type: int, flags: int, body: bytes):
+        if packet_type == CONNECT:
+            self.handle_connect(session, body)
+        elif packet_type == PUBLISH:
+            await self.handle_publish(session, flags, body)
+        elif packet_type == PUBREL:
+            session.send(packet(PUBCOMP, body[:2]))
+        elif packet_type == SUBSCRIBE:
+            self.handle_subscribe(session, body)
+        elif packet_type == UNSUBSCRIBE:
+            self.handle_unsubscribe(session, body)
+        elif packet_type == PINGREQ:
+            session.send(packet(PINGRESP))
+        # acknowledgements for messages we delivered need no action at QoS 1
+
+    def handle_connect(self, session: Session, body: bytes):
+        _, pos = decode_string(body, 0)
+        session.protocol = body[pos]
+        # skip the connect flags and keep alive, every session starts clean
+        # and anything after the client id (will, credentials) is ignored
+        pos += 4
+        if session.protocol == 5:
+            properties_length, pos = decode_varint(body, pos)
+            pos += properties_length
+        client_id, pos = decode_string(body, pos)
+
+        properties = b""
+        if not client_id:
+            client_id = f"local-broker-{next(self._client_ids)}"
+            # assigned client identifier
+            properties = b"\x12" + encode_string(client_id)
+        session.client_id = client_id
+
+        # a new connection with the same client id takes over the old one
+        previous = self.sessions.get(client_id)
+        if previous is not None:
+            self.remove_session(previous)
+            previous.writer.close()
+        self.sessions[client_id] = session
+        session.connected = True
+
+        if session.protocol == 5:
+            session.send(packet(CONNACK, b"\x00\x00" + encode_varint(len(properties)) + properties))
+        else:
+            session.send(packet(CONNACK, b"\x00\x00"))
+
+    async def handle_publish(self, session: Session, flags: int, body: bytes):
+        qos = (flags >> 1) & 0x03
+        topic, pos = decode_string(body, 0)
+        packet_id = b""
+        if qos:
+            packet_id = body[pos:pos + 2]
+            pos += 2
+        properties = b""
+        if session.protocol == 5:
+            properties_length, pos = decode_varint(body, pos)
+            properties = strip_topic_alias(body[pos:pos + properties_length])
+            pos += properties_length
+        payload = body[pos:]
+
+        self.messages_received += 1
+        if qos == 1:
+            session.send(packet(PUBACK, packet_id))
+        elif qos == 2:
+            session.send(packet(PUBREC, packet_id))
+
+        targets = self.route(topic)
+        for target, granted_qos in targets:
+            self.deliver(target, topic, payload, properties, min(qos, granted_qos))
+
+        # slow subscribers push back on the publisher instead of growing without limit
+        for target, _ in targets:
+            await target.drain()
+
+    def route(self, topic: str) -> list[tuple[Session, int]]:
+        """Find the sessions that should receive a message on a topic"""
+        targets = []
+        for topic_filter, subscribers in self.subscriptions.items():
+            if subscribers and topic_matches(topic_filter, topic):
+                targets.extend(subscribers.items())
+
+        # each shared subscription group gets one copy, round robin between members
+        for key, members in self.shared_subscriptions.items():
+            if members and topic_matches(key[1], topic):
+                turn = self._shared_turns.get(key, 0)
+                self._shared_turns[key] = turn + 1
+                targets.append(list(members.items())[turn % len(members)])
+        return targets
+
+    def deliver(self, session: Session, topic: str, payload: bytes, properties: bytes, qos: int):
+        body = encode_string(topic)
+        if qos:
+            body += next(session.packet_ids).to_bytes(2, "big")
+        if session.protocol == 5:
+            body += encode_varint(len(properties)) + properties
+        session.send(packet(PUBLISH, body + payload, qos << 1))
+        self.messages_delivered += 1
+
+    def handle_subscribe(self, session: Session, body: bytes):
+        packet_id = body[:2]
+        pos = 2
+        if session.protocol == 5:
+            properties_length, pos = decode_varint(body, pos)
+            pos += properties_length
+
+        granted = bytearray()
+        while pos < len(body):
+            topic_filter, pos = decode_string(body, pos)
+            qos = min(body[pos] & 0x03, MAX_QOS)
+            pos += 1
+            self.subscribers_for(topic_filter)[session] = qos
+            granted.append(qos)
+
+        if session.protocol == 5:
+            session.send(packet(SUBACK, packet_id + b"\x00" + bytes(granted)))
+        else:
+            session.send(packet(SUBACK, packet_id + bytes(granted)))
+
+    def handle_unsubscribe(self, session: Session, body: bytes):
+        packet_id = body[:2]
+        pos = 2
+        if session.protocol == 5:
+            properties_length, pos = decode_varint(body, pos)
+            pos += properties_length
+
+        reason_codes = bytearray()
+        while pos < len(body):
+            topic_filter, pos = decode_string(body, pos)
+            found = self.subscribers_for(topic_filter).pop(session, None) is not None
+            # success, or no subscription existed
+            reason_codes.append(0x00 if found else 0x11)
+
+        if session.protocol == 5:
+            session.send(packet(UNSUBACK, packet_id + b"\x00" + bytes(reason_codes), 0x02))
+        else:
+            session.send(packet(UNSUBACK, packet_id, 0x02))
+
+    def subscribers_for(self, topic_filter: str) -> dict[Session, int]:
+        if topic_filter.startswith("$share/"):
+            _, group, shared_filter = topic_filter.split("/", 2)
+            return self.shared_subscriptions.setdefault((group, shared_filter), {})
+        return self.subscriptions.setdefault(topic_filter, {})
+
+    def remove_session(self, session: Session):
+        for subscribers in (*self.subscriptions.values(), *self.shared_subscriptions.values()):
+            subscribers.pop(session, None)
+        if self.sessions.get(session.client_id) is session:
+            del self.sessions[session.client_id]
+        session.connected = False
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1883)
+    args = parser.parse_args(argv)
+
+    broker = LocalBroker(args.host, args.port)
+
+    async def serve():
+        await broker.listen()
+        print(f"Local MQTT broker listening on {broker.host}:{broker.port}")
+        await broker.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
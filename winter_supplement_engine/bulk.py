@@ -0,0 +1,179 @@
+"""Process JSONL or CSV files of WinterSupplementInput records without a broker.
+
+Outputs are written as JSON lines in input order, records that fail validation
+go to a separate rejects file with their line number and error. The input is
+memory-mapped and split into chunks on line boundaries, so memory stays flat
+however large the file is and chunks can be processed on every core.
+"""
+import argparse
+import csv
+import json
+import mmap
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterator, Optional
+from winter_supplement_engine.config import parse_bool
+from winter_supplement_engine.rates import load_rates
+from winter_supplement_engine.rules import (
+    BatchError,
+    DEFAULT_RATES,
+    Rates,
+    process_supplement_batch,
+    process_supplement_records
+)
+
+# bytes per chunk, rounded up to the end of a line
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+
+FORMATS = ("jsonl", "csv")
+
+def detect_format(path) -> str:
+    """Guess the input format from the file extension"""
+    return "csv" if Path(path).suffix.lower() == ".csv" else "jsonl"
+
+def read_header(mm) -> tuple[list[str], int]:
+    """Return the CSV column names and the offset of the first record"""
+    end = mm.find(b"\n")
+    end = len(mm) if end == -1 else end + 1
+    fieldnames = next(csv.reader([mm[:end].decode("utf-8-sig")]), [])
+    return [name.strip() for name in fieldnames], end
+
+def iter_chunks(mm, start: int, chunk_size: int) -> Iterator[tuple[int, int]]:
+    """Yield (start, end) byte ranges that each end on a line boundary"""
+    size = len(mm)
+    while start < size:
+        end = mm.find(b"\n", min(start + chunk_size, size) - 1)
+        end = size if end == -1 else end + 1
+        yield start, end
+        start = end
+
+def parse_row(line: bytes, fieldnames: list[str]) -> dict:
+    """Parse one CSV line on its own, a stray quote can't pull the lines after it into the same row"""
+    values = next(csv.reader([line.decode("utf-8", errors="replace")]), [])
+    # missing columns are left out so validation rejects the record
+    return dict(zip(fieldnames, values))
+
+def convert_row(row: dict) -> dict:
+    """Convert CSV strings to the types WinterSupplementInput expects"""
+    # values that don't convert are left as strings so validation rejects them
+    record = dict(row)
+    try:
+        record["numberOfChildren"] = int(record["numberOfChildren"])
+    except (KeyError, TypeError, ValueError):
+        pass
+    try:
+        record["familyUnitInPayForDecember"] = parse_bool(record["familyUnitInPayForDecember"])
+    except (KeyError, AttributeError, ValueError):
+        pass
+    return record
+
+def process_chunk(path, start: int, end: int, fieldnames: Optional[list[str]] = None, rates: Rates = DEFAULT_RATES):
+    """Process one byte range of the input
+
+    Returns the number of lines read, the outputs and (line index, error, line)
+    for each rejected record, with line indexes relative to the chunk.
+    """
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        lines = mm[start:end].split(b"\n")
+    if lines and not lines[-1]:
+        lines.pop()
+
+    # blank lines are skipped but still counted so line numbers stay right
+    numbered = [(index, line) for index, line in enumerate(lines) if line.strip()]
+    if fieldnames is None:
+        results = process_supplement_batch((line for _, line in numbered), rates)
+    else:
+        # one row per line, records can't span lines so results stay aligned with numbered
+        rows = (parse_row(line, fieldnames) for _, line in numbered)
+        results = process_supplement_records((convert_row(row) for row in rows), rates)
+
+    outputs = []
+    rejects = []
+    for (index, line), result in zip(numbered, results):
+        if isinstance(result, BatchError):
+            rejects.append((index, result.error, line.decode("utf-8", errors="replace").rstrip("\r")))
+        else:
+            outputs.append(result)
+    return len(lines), outputs, rejects
+
+def process_file(input_path, output, rejects, input_format=None, workers=1, chunk_size=DEFAULT_CHUNK_SIZE,
+                 rates: Rates = DEFAULT_RATES) -> dict:
+    """Stream a file through the rules, writing outputs and rejects to open text files"""
+    input_format = input_format or detect_format(input_path)
+    if input_format not in FORMATS:
+        raise ValueError(f"Unsupported input format: {input_format}")
+
+    counts = {"lines": 0, "outputs": 0, "rejects": 0}
+    if os.path.getsize(input_path) == 0:
+        return counts
+
+    with open(input_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        fieldnames = None
+        start = 0
+        if input_format == "csv":
+            fieldnames, start = read_header(mm)
+            counts["lines"] = 1
+
+        def write(chunk_result):
+            line_count, chunk_outputs, chunk_rejects = chunk_result
+            if chunk_outputs:
+                output.write("\n".join(chunk_outputs))
+                output.write("\n")
+            for index, error, line in chunk_rejects:
+                rejects.write(json.dumps({"line": counts["lines"] + index + 1, "error": error, "input": line}))
+                rejects.write("\n")
+            counts["lines"] += line_count
+            counts["outputs"] += len(chunk_outputs)
+            counts["rejects"] += len(chunk_rejects)
+
+        chunks = iter_chunks(mm, start, chunk_size)
+        if workers <= 1:
+            for chunk_start, chunk_end in chunks:
+                write(process_chunk(input_path, chunk_start, chunk_end, fieldnames, rates))
+            return counts
+
+        # keep a bounded number of chunks in flight and write them back in order
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            for chunk_start, chunk_end in chunks:
+                pending.append(executor.submit(process_chunk, input_path, chunk_start, chunk_end, fieldnames, rates))
+                if len(pending) >= 2 * workers:
+                    write(pending.popleft().result())
+            while pending:
+                write(pending.popleft().result())
+    return counts
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input", help="JSONL or CSV file of WinterSupplementInput records")
+    parser.add_argument("-o", "--output", required=True, help="file to write WinterSupplementOutput records to, as JSON lines")
+    parser.add_argument("--rejects", help="file to write rejected records to, defaults to <output>.rejects.jsonl")
+    parser.add_argument("--format", choices=FORMATS, help="input format, guessed from the extension by default")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processes to spread chunks over")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="bytes of input per chunk")
+    parser.add_argument("--rates", default=os.getenv("RATES_FILE"), help="rate file to apply, defaults to RATES_FILE")
+    args = parser.parse_args(argv)
+
+    rates = load_rates(args.rates) if args.rates else DEFAULT_RATES
+
+    rejects_path = args.rejects or f"{args.output}.rejects.jsonl"
+    start = time.perf_counter()
+    with open(args.output, "w", encoding="utf-8") as output, open(rejects_path, "w", encoding="utf-8") as rejects:
+        counts = process_file(args.input, output, rejects, args.format, args.workers, args.chunk_size, rates)
+    elapsed = time.perf_counter() - start
+
+    records = counts["outputs"] + counts["rejects"]
+    print(
+        f"{records} records in {elapsed:.2f}s ({records / elapsed if elapsed > 0 else 0:,.0f}/s): "
+        f"{counts['outputs']} written to {args.output}, {counts['rejects']} rejected to {rejects_path}",
+        file=sys.stderr
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from time import monotonic
+from typing import Optional, Union
+from winter_supplement_engine import metrics
+
+class ResultCache:
+    """Bounded LRU map from a request payload to its serialized result
+
+    Payloads include the request id, so a hash of the payload identifies a
+    request and its inputs. Entries expire after ttl seconds when one is given
+    and the least recently used entry is evicted once capacity is reached.
+    """
+
+    def __init__(self, capacity: int, ttl: Optional[float] = None):
+        if capacity < 1:
+            raise ValueError(f"Invalid value for DEDUP_CACHE_SIZE: {capacity}")
+        self.capacity = capacity
+        self.ttl = ttl
+        # key -> (table, result, expiry)
+        self._entries: OrderedDict[bytes, tuple] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(payload: Union[str, bytes]) -> bytes:
+        """Return the cache key for a payload"""
+        if isinstance(payload, str):
+            payload = payload.encode()
+        return hashlib.blake2b(payload, digest_size=16).digest()
+
+    def get(self, key: bytes, table) -> Optional[Union[str, bytes]]:
+        """Return the cached result, or None if there isn't a current one"""
+        with self._lock:
+            entry = self._entries.get(key)
+            # results are only reused with the table that produced them, so a rate
+            # change never serves amounts calculated with the old rates
+            if entry is None or entry[0] is not table or (entry[2] is not None and entry[2] < monotonic()):
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                metrics.DEDUP_MISSES.inc()
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        metrics.DEDUP_HITS.inc()
+        return entry[1]
+
+    def put(self, key: bytes, table, result: Union[str, bytes]):
+        """Cache a result, evicting the least recently used entry when full"""
+        expiry = monotonic() + self.ttl if self.ttl is not None else None
+        evicted = 0
+        with self._lock:
+            self._entries[key] = (table, result, expiry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                evicted += 1
+            self.evictions += evicted
+        if evicted:
+            metrics.DEDUP_EVICTIONS.inc(evicted)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        """Return the cache size and hit, miss and eviction counts"""
+        return {
+            "size": len(self._entries),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,75 @@
+import importlib
+import importlib.util
+import json
+from typing import Any, Optional, Union
+
+# all codecs raise ValueError (or a subclass) for payloads that can't be decoded
+class JsonCodec:
+    """Codec backed by the standard library json module"""
+    name = "json"
+
+    def decode(self, payload: Union[bytes, str]) -> Any:
+        # json.loads detects the encoding of bytes itself, no need to decode first
+        return json.loads(payload)
+
+    def encode(self, data: Any) -> bytes:
+        return json.dumps(data).encode()
+
+class OrjsonCodec:
+    """Codec backed by orjson"""
+    name = "orjson"
+
+    def __init__(self):
+        self._orjson = importlib.import_module("orjson")
+
+    def decode(self, payload: Union[bytes, str]) -> Any:
+        return self._orjson.loads(payload)
+
+    def encode(self, data: Any) -> bytes:
+        return self._orjson.dumps(data)
+
+    def __reduce__(self):
+        # modules can't be pickled, import orjson again in worker processes
+        return (OrjsonCodec, ())
+
+class MsgspecCodec:
+    """Codec backed by msgspec's JSON decoder and encoder"""
+    name = "msgspec"
+
+    def __init__(self):
+        msgspec_json = importlib.import_module("msgspec.json")
+        self._decoder = msgspec_json.Decoder()
+        self._encoder = msgspec_json.Encoder()
+
+    def decode(self, payload: Union[bytes, str]) -> Any:
+        return self._decoder.decode(payload)
+
+    def encode(self, data: Any) -> bytes:
+        return self._encoder.encode(data)
+
+    def __reduce__(self):
+        # decoders can't be pickled, rebuild them in worker processes instead
+        return (MsgspecCodec, ())
+
+def _installed(module: str) -> bool:
+    # finds the backend without importing it, only the codec that is used gets imported
+    return importlib.util.find_spec(module) is not None
+
+# codecs by name with whether their backend is installed, fastest first
+CODECS = {
+    "orjson": (OrjsonCodec, _installed("orjson")),
+    "msgspec": (MsgspecCodec, _installed("msgspec")),
+    "json": (JsonCodec, True),
+}
+
+def get_codec(name: Optional[str] = None):
+    """Return the named codec, or the fastest installed one when no name is given"""
+    if name is None:
+        name = next(codec_name for codec_name, (_, available) in CODECS.items() if available)
+
+    if name not in CODECS:
+        raise ValueError(f"Unknown codec: {name} (expected one of {', '.join(CODECS)})")
+    codec_class, available = CODECS[name]
+    if not available:
+        raise ValueError(f"Codec {name} is not installed, install it with `poetry install --extras {name}`")
+    return codec_class()
@@ -1,4 +1,7 @@
 import os
+from dataclasses import dataclass, field, fields
+from pathlib import Path
+from typing import Optional
 
 # function to raise errors if environment variables are missing
 def get_env_variable(var_name, var_type=str, default=None, required=True):
@@ -10,4 +13,132 @@ def get_env_variable(var_name, var_type=str, default=None, required=True):
     try:
         return var_type(value)
     except ValueError as e:
-        raise ValueError(f"Invalid value for {var_name}: {e}")
\ No newline at end of file
+        raise ValueError(f"Invalid value for {var_name}: {e}")
+
+# converts boolean environment variables like "true", "0" or "no"
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    normalized = value.strip().lower()
+    if normalized in ("1", "true", "yes", "on"):
+        return True
+    if normalized in ("0", "false", "no", "off"):
+        return False
+    raise ValueError(f"expected a boolean, got {value!r}")
+
+def env_setting(name, var_type=str, default=None, required=False, check=None):
+    """Declare an EngineConfig field read from the environment variable name, check validates the value"""
+    return field(
+        default=None,
+        metadata={"env": name, "type": var_type, "default": default, "required": required, "check": check}
+    )
+
+# names accepted for LOG_LEVEL and LOG_MESSAGE_LEVEL
+LOG_LEVELS = ("CRITICAL", "ERROR", "WARNING", "INFO", "DEBUG")
+
+# value checks for env_setting, each a predicate with what it expects
+def at_least(minimum):
+    return lambda value: value >= minimum, f"expected at least {minimum}"
+
+def above(minimum):
+    return lambda value: value > minimum, f"expected more than {minimum}"
+
+def between(low, high):
+    return lambda value: low <= value <= high, f"expected {low} to {high}"
+
+def one_of(*choices):
+    return lambda value: value in choices, f"expected one of {', '.join(choices)}"
+
+@dataclass(frozen=True)
+class EngineConfig:
+    """Every engine setting, read from the environment and validated in one pass"""
+    mqtt_broker: str = env_setting("MQTT_BROKER", required=True)
+    mqtt_broker_port: int = env_setting("MQTT_BROKER_PORT", int, required=True, check=between(1, 65535))
+    mqtt_input_topic_prefix: str = env_setting("MQTT_INPUT_TOPIC_PREFIX", required=True)
+    mqtt_output_topic_prefix: str = env_setting("MQTT_OUTPUT_TOPIC_PREFIX", required=True)
+    mqtt_topic_id: Optional[str] = env_setting("MQTT_TOPIC_ID")
+    mqtt_shared_group: Optional[str] = env_setting("MQTT_SHARED_GROUP")
+    mqtt_topic_routes: Optional[str] = env_setting("MQTT_TOPIC_ROUTES")
+    mqtt_brokers: Optional[str] = env_setting("MQTT_BROKERS")
+    mqtt_connections: int = env_setting("MQTT_CONNECTIONS", int, default=1, check=at_least(1))
+    retry_first_connect: bool = env_setting("MQTT_RETRY_FIRST_CONNECT", parse_bool, default="false")
+    reconnect_min_delay: int = env_setting("RECONNECT_MIN_DELAY", int, default=1, check=at_least(0))
+    reconnect_max_delay: int = env_setting("RECONNECT_MAX_DELAY", int, default=60, check=at_least(1))
+    route_cache_size: int = env_setting("ROUTE_CACHE_SIZE", int, default=10000, check=at_least(0))
+    worker_mode: str = env_setting("ENGINE_WORKER_MODE", default="inline", check=one_of("inline", "thread", "process"))
+    worker_count: Optional[int] = env_setting("ENGINE_WORKERS", int, check=at_least(1))
+    worker_queue_size: Optional[int] = env_setting("ENGINE_QUEUE_SIZE", int, check=at_least(1))
+    concurrency: int = env_setting("ENGINE_CONCURRENCY", int, default=64, check=at_least(1))
+    codec_name: Optional[str] = env_setting("ENGINE_CODEC")
+    metrics_enabled: bool = env_setting("METRICS_ENABLED", parse_bool, default="true")
+    metrics_port: Optional[int] = env_setting("METRICS_PORT", int, check=between(1, 65535))
+    publish_qos: int = env_setting("PUBLISH_QOS", int, default=0, check=between(0, 2))
+    publish_batch_size: Optional[int] = env_setting("PUBLISH_BATCH_SIZE", int, check=at_least(1))
+    publish_batch_delay: float = env_setting("PUBLISH_BATCH_DELAY_MS", float, default=5, check=at_least(0))
+    publish_max_inflight: int = env_setting("PUBLISH_MAX_INFLIGHT", int, default=1000, check=at_least(1))
+    publish_max_buffered: Optional[int] = env_setting("PUBLISH_MAX_BUFFERED", int, check=at_least(1))
+    dedup_cache_size: Optional[int] = env_setting("DEDUP_CACHE_SIZE", int, check=at_least(0))
+    dedup_cache_ttl: Optional[float] = env_setting("DEDUP_CACHE_TTL", float, check=above(0))
+    spool_dir: Optional[str] = env_setting("SPOOL_DIR")
+    spool_segment_size: int = env_setting("SPOOL_SEGMENT_SIZE", int, default=16 * 1024 * 1024, check=at_least(1))
+    spool_fsync: bool = env_setting("SPOOL_FSYNC", parse_bool, default="false")
+    admission_rate: Optional[float] = env_setting("ADMISSION_RATE", float, check=above(0))
+    admission_burst: Optional[float] = env_setting("ADMISSION_BURST", float, check=at_least(1))
+    admission_queue_size: Optional[int] = env_setting("ADMISSION_QUEUE_SIZE", int, check=at_least(1))
+    admission_shed_policy: str = env_setting("ADMISSION_SHED_POLICY", default="newest", check=one_of("newest", "largest"))
+    slow_message_ms: Optional[float] = env_setting("SLOW_MESSAGE_MS", float, check=at_least(0))
+    profile_dir: str = env_setting("PROFILE_DIR", default=".")
+    profile_seconds: float = env_setting("PROFILE_SECONDS", float, default=30, check=above(0))
+    profile_interval_ms: float = env_setting("PROFILE_INTERVAL_MS", float, default=5, check=above(0))
+    rates_file: Optional[str] = env_setting("RATES_FILE")
+    rates_reload_interval: float = env_setting("RATES_RELOAD_INTERVAL", float, default=1.0, check=at_least(0))
+    log_level: str = env_setting("LOG_LEVEL", str.upper, default="INFO", check=one_of(*LOG_LEVELS))
+    log_message_level: Optional[str] = env_setting("LOG_MESSAGE_LEVEL", str.upper, check=one_of(*LOG_LEVELS))
+    log_sample_rate: float = env_setting("LOG_SAMPLE_RATE", float, default=1.0, check=between(0, 1))
+    log_payloads: bool = env_setting("LOG_PAYLOADS", parse_bool, default="true")
+    log_format: str = env_setting("LOG_FORMAT", default="json", check=one_of("json", "text"))
+    log_queue_size: int = env_setting("LOG_QUEUE_SIZE", int, default=10000, check=at_least(1))
+
+    def __post_init__(self):
+        # values are checked here rather than where they're used, so a bad setting
+        # fails at startup instead of on every message
+        errors = []
+        for setting in fields(self):
+            check = setting.metadata["check"]
+            value = getattr(self, setting.name)
+            if check is not None and value is not None and not check[0](value):
+                errors.append(f"Invalid value for {setting.metadata['env']}: {value!r} ({check[1]})")
+        if (self.reconnect_min_delay is not None and self.reconnect_max_delay is not None
+                and self.reconnect_min_delay > self.reconnect_max_delay):
+            errors.append(
+                f"Invalid value for RECONNECT_MAX_DELAY: {self.reconnect_max_delay!r} "
+                f"(expected at least RECONNECT_MIN_DELAY, {self.reconnect_min_delay})"
+            )
+        if errors:
+            raise ValueError("; ".join(errors))
+
+    @classmethod
+    def from_env(cls) -> "EngineConfig":
+        """Read every setting, raising one ValueError that lists all the invalid ones"""
+        values = {}
+        errors = []
+        for setting in fields(cls):
+            spec = setting.metadata
+            try:
+                values[setting.name] = get_env_variable(spec["env"], spec["type"], spec["default"], spec["required"])
+            except ValueError as e:
+                errors.append(str(e))
+        if errors:
+            raise ValueError("; ".join(errors))
+        return cls(**values)
+
+def load_dotenv() -> bool:
+    """Load the nearest .env file above the package, python-dotenv is only imported when there is one"""
+    # same search as python-dotenv's load_dotenv() called from this package
+    directory = Path(__file__).resolve().parent
+    for candidate in (directory, *directory.parents):
+        path = candidate / ".env"
+        if path.is_file():
+            from dotenv import load_dotenv as load_dotenv_file
+            return load_dotenv_file(path)
+    return False
@@ -0,0 +1,149 @@
+"""Connections to one or more brokers, each running its own network loop."""
+import logging
+import threading
+from time import monotonic
+from typing import Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# shared subscription group used when MQTT_SHARED_GROUP isn't set but several engines
+# or connections would otherwise each get every message
+DEFAULT_SHARED_GROUP = "winter-supplement-engine"
+
+def parse_brokers(value: str) -> list[tuple[str, int]]:
+    """Parse "host:port,..." into (host, port) pairs"""
+    brokers = []
+    for entry in value.split(","):
+        if not entry.strip():
+            continue
+        host, separator, port = entry.strip().rpartition(":")
+        if not separator or not host or not port.isdigit():
+            raise ValueError(f"Invalid value for MQTT_BROKERS: {entry!r}, expected host:port")
+        broker = (host, int(port))
+        if broker not in brokers:
+            brokers.append(broker)
+    return brokers
+
+class Connection:
+    """One client of the pool and its health
+
+    Connections to the same broker share its spool and replay lock, so results
+    kept while one of them is down can be replayed by whichever reconnects first.
+    """
+
+    def __init__(self, host: str, port: int, index: int = 0):
+        self.host = host
+        self.port = port
+        self.index = index
+        self.name = f"{host}:{port}/{index}"
+        self.client = None
+        self.publisher = None
+        self.spool = None
+        self.replay_lock = threading.Lock()
+
+        self.connected = False
+        self.connects = 0
+        self.disconnects = 0
+        self.messages = 0
+        self.last_error = None
+        self.since = monotonic()
+
+    @property
+    def broker(self) -> tuple[str, int]:
+        return self.host, self.port
+
+    def up(self):
+        self.connected = True
+        self.connects += 1
+        self.since = monotonic()
+
+    def down(self, reason=None):
+        if self.connected:
+            self.disconnects += 1
+            self.since = monotonic()
+        self.connected = False
+        if reason is not None:
+            self.last_error = str(reason)
+
+    def health(self) -> dict:
+        """Return the connection's state for logs and status checks"""
+        return {
+            "connection": self.name,
+            "connected": self.connected,
+            "seconds_in_state": round(monotonic() - self.since, 3),
+            "connects": self.connects,
+            "disconnects": self.disconnects,
+            "messages": self.messages,
+            "last_error": self.last_error,
+        }
+
+class ConnectionPool:
+    """Every connection of the engine, looked up by client
+
+    Messages are spread over the connections to a broker by its shared
+    subscription, which stops sending to a connection as soon as it drops. Results
+    for a connection that is down are moved to the other connections to the same
+    broker in turn, see fallback().
+    """
+
+    def __init__(self):
+        self.connections: list[Connection] = []
+        self._by_client: dict = {}
+        self._turns: dict[tuple[str, int], int] = {}
+
+    def add(self, connection: Connection):
+        self.connections.append(connection)
+        self._by_client[connection.client] = connection
+
+    @property
+    def primary(self) -> Connection:
+        """The first connection to the first broker"""
+        return self.connections[0]
+
+    def get(self, client) -> Optional[Connection]:
+        return self._by_client.get(client)
+
+    def brokers(self) -> list[tuple[str, int]]:
+        return list(dict.fromkeys(connection.broker for connection in self.connections))
+
+    def healthy(self) -> list[Connection]:
+        return [connection for connection in self.connections if connection.connected]
+
+    def siblings(self, connection: Connection) -> list[Connection]:
+        """Return the other connections to the same broker that are up"""
+        return [
+            other for other in self.connections
+            if other is not connection and other.broker == connection.broker and other.connected
+        ]
+
+    def fallback(self, connection: Connection) -> Optional[Connection]:
+        """Return another connected connection to the same broker, taking turns between them"""
+        candidates = self.siblings(connection)
+        if not candidates:
+            return None
+        turn = self._turns.get(connection.broker, 0)
+        self._turns[connection.broker] = turn + 1
+        return candidates[turn % len(candidates)]
+
+    def start(self):
+        """Connect every client in the background, first connections are retried like reconnects"""
+        for connection in self.connections:
+            logger.info("Connecting to MQTT broker: %s", connection.name)
+            connection.client.connect_async(connection.host, connection.port)
+            connection.client.loop_start()
+
+    def stop(self):
+        """Disconnect every client and wait for its network loop to finish"""
+        for connection in self.connections:
+            connection.client.disconnect()
+        for connection in self.connections:
+            connection.client.loop_stop()
+
+    def health(self) -> list[dict]:
+        return [connection.health() for connection in self.connections]
+
+    def __len__(self):
+        return len(self.connections)
+
+    def __iter__(self) -> Iterator[Connection]:
+        return iter(self.connections)
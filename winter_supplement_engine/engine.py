@@ -1,21 +1,121 @@
+import logging
+import os
+import signal
+import threading
 import paho.mqtt.client as mqtt
 from paho.mqtt.enums import CallbackAPIVersion
-from dotenv import load_dotenv
-from winter_supplement_engine.config import get_env_variable
+from functools import partial
+from time import perf_counter
+from typing import Optional
+from winter_supplement_engine import metrics, wire
+from winter_supplement_engine.codec import get_codec
+from winter_supplement_engine.config import EngineConfig, load_dotenv
+from winter_supplement_engine.connections import DEFAULT_SHARED_GROUP, Connection, ConnectionPool, parse_brokers
+from winter_supplement_engine.log import configure_logging, message_log
+from winter_supplement_engine.routing import TopicRouter, parse_routes
 from winter_supplement_engine.rules import process_supplement_request
+from winter_supplement_engine.table import configure_default_table, get_default_table, process_with_table
+from winter_supplement_engine.workers import WorkerPool
+
+logger = logging.getLogger(__name__)
+
+# seconds to wait for the last publish of a replayed segment before keeping it for the next connection
+REPLAY_TIMEOUT = 30
 
 class WinterSupplementEngine:
-    def __init__(self):
-        # load and get env variables
-        load_dotenv()
-        self.mqtt_broker = get_env_variable("MQTT_BROKER")
-        self.mqtt_broker_port = get_env_variable("MQTT_BROKER_PORT", int)
-        self.mqtt_input_topic_prefix = get_env_variable("MQTT_INPUT_TOPIC_PREFIX")
-        self.mqtt_output_topic_prefix = get_env_variable("MQTT_OUTPUT_TOPIC_PREFIX")
-        self.mqtt_topic_id = get_env_variable("MQTT_TOPIC_ID", required=False)
-
-        # initialize client
-        self.client = mqtt.Client(protocol=mqtt.MQTTv5, callback_api_version=CallbackAPIVersion.VERSION2)
+    def __init__(self, config: Optional[EngineConfig] = None):
+        # load and validate env variables, unless the settings were given
+        if config is None:
+            load_dotenv()
+            config = EngineConfig.from_env()
+        self.config = config
+        # every setting is also an attribute of the engine, e.g. self.mqtt_broker
+        self.__dict__.update(vars(config))
+        self.metrics_server = None
+
+        # counters are always kept, timings are skipped when metrics are disabled
+        metrics.enabled = self.metrics_enabled
+        # stage timings are kept per message only when slow messages are traced
+        metrics.tracing = self.slow_message_ms is not None
+
+        # codec used to parse payloads and serialize results, defaults to the fastest installed
+        self.codec = get_codec(self.codec_name)
+
+        # precompute every possible output so messages only need a table lookup
+        # loaded now so a bad RATES_FILE fails at startup rather than on the first message
+        configure_default_table(self.rates_file, self.rates_reload_interval)
+        get_default_table()
+        metrics.TABLE_HITS.set_function(lambda: self.table.hits)
+        metrics.TABLE_MISSES.set_function(lambda: self.table.misses)
+
+        # answer repeated requests with the result already published for them
+        self.result_cache = None
+        if self.dedup_cache_size:
+            # the optional subsystems are only imported when they are enabled
+            from winter_supplement_engine.cache import ResultCache
+            self.result_cache = ResultCache(self.dedup_cache_size, self.dedup_cache_ttl)
+            metrics.DEDUP_SIZE.set_function(lambda: len(self.result_cache))
+
+        # setup worker pool, messages are processed on the network thread when inline
+        self.worker_pool = None
+        if self.worker_mode != "inline":
+            # worker processes build their own table from the same rate file
+            self.worker_pool = WorkerPool(
+                self.worker_mode, self.worker_count, self.worker_queue_size,
+                initializer=configure_default_table, initargs=(self.rates_file, self.rates_reload_interval)
+            )
+
+        # limit each tenant's message rate and share the workers fairly between tenants
+        self.rate_limiter = None
+        if self.admission_rate is not None:
+            from winter_supplement_engine.admission import RateLimiter
+            self.rate_limiter = RateLimiter(self.admission_rate, self.admission_burst)
+            metrics.ADMISSION_TENANTS.set_function(lambda: len(self.rate_limiter))
+        self.admission_queue = None
+        self.admission_thread = None
+        if self.admission_queue_size is not None:
+            if self.worker_pool is None:
+                raise ValueError("ADMISSION_QUEUE_SIZE needs a worker pool, set ENGINE_WORKER_MODE to thread or process")
+            from winter_supplement_engine.admission import FairQueue
+            self.admission_queue = FairQueue(self.admission_queue_size, self.admission_shed_policy)
+            metrics.ADMISSION_QUEUE_DEPTH.set_function(lambda: len(self.admission_queue))
+
+        # MQTT_CONNECTIONS connections to MQTT_BROKER and to every broker in MQTT_BROKERS,
+        # each with its own network loop feeding the same workers
+        self.brokers = [(self.mqtt_broker, self.mqtt_broker_port)]
+        if self.mqtt_brokers is not None:
+            self.brokers += [broker for broker in parse_brokers(self.mqtt_brokers) if broker not in self.brokers]
+        self.pool = ConnectionPool()
+        self.spools = []
+        for host, port in self.brokers:
+            # keep results on disk while the broker is unreachable, they're published again on reconnect
+            # with several brokers each one gets its own directory, results are only replayed where they belong
+            spool = None
+            if self.spool_dir is not None:
+                from winter_supplement_engine.spool import Spool
+                directory = self.spool_dir if len(self.brokers) == 1 else os.path.join(self.spool_dir, f"{host}-{port}")
+                spool = Spool(directory, self.spool_segment_size, self.spool_fsync)
+                self.spools.append(spool)
+            replay_lock = threading.Lock()
+            for index in range(self.mqtt_connections):
+                connection = Connection(host, port, index)
+                connection.client = self.make_client(connection)
+                connection.spool = spool
+                connection.replay_lock = replay_lock
+                connection.publisher = self.make_publisher(connection.client, spool)
+                self.pool.add(connection)
+        metrics.CONNECTIONS.set(len(self.pool))
+        if self.spools:
+            metrics.SPOOL_PENDING.set_function(lambda: sum(len(spool) for spool in self.spools))
+        self._stopped = threading.Event()
+        self._shutdown_thread = None
+
+        # the first connection to MQTT_BROKER, the only one unless a pool is configured
+        primary = self.pool.primary
+        self.client = primary.client
+        self.spool = primary.spool
+        self._replay_lock = primary.replay_lock
+        self.publisher = primary.publisher
 
         # setup topic based on whether MQTT_TOPIC_ID env variable is provided
         self.use_specific_topic = self.mqtt_topic_id is not None
@@ -25,74 +125,505 @@ class WinterSupplementEngine:
         else:
             self.input_topic = f"{self.mqtt_input_topic_prefix}/+"
 
-        # setup callbacks
-        self.client.on_connect = self.on_connect
-        self.client.on_message = self.on_message
-        self.client.on_disconnect = self.on_disconnect
+        # every input prefix is mapped to its own output prefix, the env prefixes
+        # plus any extra pairs from MQTT_TOPIC_ROUTES
+        routes = {self.mqtt_input_topic_prefix: self.mqtt_output_topic_prefix}
+        if self.mqtt_topic_routes is not None:
+            routes.update(parse_routes(self.mqtt_topic_routes))
+        self.router = TopicRouter(routes, self.mqtt_topic_id, self.route_cache_size)
+
+        # with a shared subscription the broker spreads messages across every engine in the group,
+        # several connections to one broker always share one so each message is handled once
+        self.subscription_topics = self.router.subscriptions()
+        shared_group = self.mqtt_shared_group
+        if shared_group is None and self.mqtt_connections > 1:
+            shared_group = DEFAULT_SHARED_GROUP
+        if shared_group is not None:
+            self.subscription_topics = [f"$share/{shared_group}/{topic}" for topic in self.subscription_topics]
+        self.subscription_topic = self.subscription_topics[0]
+
+    def make_client(self, connection):
+        """Create a client for a pool connection, the network loop reconnects with an exponential backoff"""
+        client = mqtt.Client(protocol=mqtt.MQTTv5, callback_api_version=CallbackAPIVersion.VERSION2, userdata=connection)
+        client.reconnect_delay_set(self.reconnect_min_delay, self.reconnect_max_delay)
+        client.on_connect = self.on_connect
+        client.on_message = self.on_message
+        client.on_disconnect = self.on_disconnect
+        client.on_publish = self.on_publish
+        return client
+
+    def make_publisher(self, client, spool=None):
+        """Batch a client's results into bursts instead of publishing each one as soon as it's ready"""
+        if self.publish_batch_size is None:
+            return None
+        from winter_supplement_engine.publisher import BatchPublisher
+        return BatchPublisher(
+            client,
+            max_batch=self.publish_batch_size,
+            max_delay=self.publish_batch_delay / 1000,
+            max_inflight=self.publish_max_inflight,
+            qos=self.publish_qos,
+            spool=spool,
+            max_buffered=self.publish_max_buffered
+        )
+
+    def connection_for(self, client) -> Connection:
+        """Return the pool connection of a client, clients from outside the pool count as the first one"""
+        connection = self.pool.get(client)
+        return connection if connection is not None else self.pool.primary
+
+    @property
+    def table(self):
+        """The current precomputed table, replaced when the rate file changes"""
+        return get_default_table()
 
     def on_connect(self, client, userdata, flags, rc, properties=None):
+        connection = self.connection_for(client)
         if rc == 0:
-            print(f"Connected to MQTT broker: {self.mqtt_broker}:{self.mqtt_broker_port}")
-            # subscribe to the input topic
-            client.subscribe(self.input_topic)
-            print(f"Subscribed to topic: {self.input_topic}")
+            connection.up()
+            logger.info("Connected to MQTT broker: %s:%s", connection.host, connection.port)
+            metrics.CONNECTED.set(len(self.pool.healthy()))
+            metrics.CONNECTS.inc()
+            # subscribe to the input topics
+            if len(self.subscription_topics) == 1:
+                client.subscribe(self.subscription_topic)
+            else:
+                client.subscribe([(topic, 0) for topic in self.subscription_topics])
+            logger.info("Subscribed to topic: %s", ", ".join(self.subscription_topics))
+            if connection.spool is not None and len(connection.spool):
+                self.start_replay(client)
         else:
-            print(f"Failed to connect to MQTT broker with result code: {rc}")
+            connection.last_error = str(rc)
+            logger.error("Failed to connect to MQTT broker with result code: %s", rc)
 
     def on_disconnect(self, client, userdata, disconnect_flags, rc, properties):
+        connection = self.connection_for(client)
+        connection.down(rc if rc != 0 else None)
+        metrics.CONNECTED.set(len(self.pool.healthy()))
+        metrics.DISCONNECTS.inc()
         if rc != 0:
-            # print reason code for the disconnection
-            print(f"Disconnected from MQTT broker: {rc}")
+            # log reason code for the disconnection
+            logger.warning(
+                "Disconnected from MQTT broker %s:%s: %s", connection.host, connection.port, rc,
+                extra={"connection": connection.name}
+            )
+            if len(self.pool) > 1:
+                logger.warning("%s of %s connections are up", len(self.pool.healthy()), len(self.pool))
+            if connection.spool is not None and not self.pool.siblings(connection):
+                logger.warning("Spooling results to %s until reconnected", connection.spool.directory)
 
     # callback when message is received
     def on_message(self, client, userdata, message):
+        trace = metrics.begin_trace() if metrics.tracing else None
+        start = perf_counter() if metrics.enabled or trace is not None else None
+        metrics.MESSAGES_RECEIVED.inc()
+        # clients of the pool are created with their connection as userdata
+        if userdata is not None:
+            userdata.messages += 1
+        # set once a worker took the message, which then times it when the result is published
+        handed_off = False
         try:
-            print(f"Message received on topic {message.topic}: {message.payload.decode()}")
+            # paho decodes the topic on every access, so read it once
+            topic = message.topic
+            payload = message.payload
+            if message_log.enabled():
+                message_log.logger.info(
+                    "Message received on topic %s: %s", topic, message_log.payload(payload),
+                    extra={"topic": topic}
+                )
 
-            # if topic ID is in env, use it
-            if self.use_specific_topic:
-                output_topic = self.output_topic
-            # otherwise, extract it from the incoming message
-            else:
-                topic_parts = message.topic.split('/')
-                if len(topic_parts) >= 3:
-                    topic_id = topic_parts[-1]
-                    output_topic = f"{self.mqtt_output_topic_prefix}/{topic_id}"
-                else:
-                    print(f"Invalid topic format: {message.topic}")
+            output_topic = self.router.route(topic)
+            if output_topic is None:
+                metrics.FAILED_INVALID_TOPIC.inc()
+                message_log.info("Invalid topic format: %s", topic, topic=topic)
+                return
+
+            # messages over their tenant's rate are dropped before any work is done on them
+            if self.rate_limiter is not None and not self.admit(topic):
+                return
+
+            # binary requests are answered in binary, with the content type set on the reply
+            properties = wire.REPLY_PROPERTIES if wire.is_binary(message.properties) else None
+
+            # duplicates and retries get the result that was already calculated
+            table = self.table
+            cache_key = None
+            if self.result_cache is not None:
+                cache_key = self.result_cache.key(payload)
+                result = self.result_cache.get(cache_key, table)
+                if result is not None:
+                    self.publish_result(client, output_topic, result, properties)
                     return
 
+            # hand the payload to the worker pool, results are published from its callback
+            if self.worker_pool is not None:
+                received = (topic, start, trace) if start is not None else None
+                job = (
+                    self.request_processor(properties, table, trace),
+                    payload,
+                    lambda future: self.on_result(client, output_topic, future, cache_key, table, properties, received)
+                )
+                if self.admission_queue is not None:
+                    self.enqueue(topic, job)
+                else:
+                    self.worker_pool.submit(*job)
+                handed_off = True
+                return
+
             # process the request using business rules
-            result = process_supplement_request(message.payload.decode())
-
-            # we only want to publish when there is a result
-            # otherwise the validation failed
-            if result is not None:
-                # publish to the output topic
-                client.publish(output_topic, result)
-                print(f"Published result to topic {output_topic}: {result}")
+            # the codec parses the raw bytes and returns bytes ready to publish
+            if properties is None:
+                result = process_supplement_request(payload, table=table, codec=self.codec)
             else:
-                print("Failed to process request")
+                result = wire.process_binary_request(payload, table.rates)
+            self.cache_result(cache_key, table, result)
+            self.publish_result(client, output_topic, result, properties)
 
-        except Exception as e:
-            print(f"Error processing message: {e}")
+        except Exception:
+            metrics.FAILED_ERROR.inc()
+            logger.exception("Error processing message")
+
+        finally:
+            if trace is not None:
+                metrics.end_trace()
+            if start is not None and not handed_off:
+                self.observe_message(message.topic, start, trace)
+
+    def admit(self, topic) -> bool:
+        """Take a token for the topic's tenant, return False if it is over its rate"""
+        from winter_supplement_engine.admission import topic_tenant
+        if not self.rate_limiter.allow(topic_tenant(topic)):
+            metrics.RATE_LIMITED.inc()
+            message_log.info("Rate limited message on topic %s", topic, topic=topic)
+            return False
+        metrics.ADMITTED.inc()
+        return True
+
+    def enqueue(self, topic, job):
+        """Queue a job for the worker pool behind the earlier messages of the topic's tenant"""
+        from winter_supplement_engine.admission import topic_tenant
+        tenant = topic_tenant(topic)
+        shed = self.admission_queue.put(tenant, job)
+        if shed is not None:
+            metrics.SHED.inc()
+            message_log.info("Shed a message from tenant %s, the admission queue is full", shed[0])
+
+    def dispatch_admitted(self):
+        """Feed queued jobs to the worker pool, taking turns between tenants"""
+        while True:
+            entry = self.admission_queue.get()
+            if entry is None:
+                return
+            _, job = entry
+            try:
+                # blocks while the pool is full, so the backlog builds up in the fair queue
+                self.worker_pool.submit(*job)
+            except Exception:
+                metrics.FAILED_ERROR.inc()
+                logger.exception("Error processing message")
+
+    def start_admission(self):
+        """Start the thread that feeds the admission queue to the worker pool"""
+        if self.admission_queue is not None and self.admission_thread is None:
+            self.admission_thread = threading.Thread(target=self.dispatch_admitted, name="admission", daemon=True)
+            self.admission_thread.start()
+
+    def request_processor(self, properties, table, trace=None):
+        """Return the function that answers a payload in the format its properties ask for"""
+        if properties is None:
+            process = partial(process_with_table, codec=self.codec)
+        else:
+            process = partial(wire.process_binary_request, rates=table.rates)
+        if self.worker_mode == "process":
+            # a worker process can't add to the trace, its stages count as other
+            return partial(process_counting_failures, process)
+        if trace is not None:
+            return partial(process_traced, trace, process)
+        return process
+
+    def unpack_result(self, value):
+        """Return a worker's result, adding the failures a worker process counted to this process' counters"""
+        if self.worker_mode != "process":
+            return value
+        result, failures = value
+        for metric, count in zip(CHILD_FAILURES, failures):
+            if count:
+                metric.inc(count)
+        return result
+
+    def observe_message(self, topic, start, trace=None):
+        """Record the time from a message's receipt to its result being published"""
+        elapsed = perf_counter() - start
+        if metrics.enabled:
+            metrics.MESSAGE_SECONDS.observe(elapsed)
+        if trace is not None:
+            self.trace_slow_message(topic, elapsed, trace)
+
+    def trace_slow_message(self, topic, elapsed, trace):
+        """Log the stage timings of a message that took longer than SLOW_MESSAGE_MS"""
+        elapsed_ms = elapsed * 1000
+        if elapsed_ms < self.slow_message_ms:
+            return
+        stages = {stage: round(seconds * 1000, 3) for stage, seconds in trace}
+        # whatever the stages don't account for, e.g. routing or waiting for a worker
+        stages["other"] = round(elapsed_ms - sum(stages.values()), 3)
+        logger.warning(
+            "Slow message on topic %s took %.1f ms: %s", topic, elapsed_ms,
+            ", ".join(f"{stage}={ms}ms" for stage, ms in stages.items()),
+            extra={"topic": topic, "duration_ms": round(elapsed_ms, 3), "stages": stages}
+        )
+
+    def start_profile(self, seconds=None):
+        """Sample every thread's stack in the background and write a folded stack file"""
+        from winter_supplement_engine import profiling
+        return profiling.start_profile(
+            self.profile_dir, seconds or self.profile_seconds, self.profile_interval_ms / 1000
+        )
+
+    def get_output_topic(self, input_topic):
+        """Return the output topic for a message topic, or None if the topic is invalid"""
+        return self.router.route(input_topic)
+
+    # callback when the worker pool finishes a payload
+    def on_result(self, client, output_topic, future, cache_key=None, table=None, properties=None, received=None):
+        # received is the (topic, start, trace) of the message when it is timed
+        trace = received[2] if received is not None else None
+        if trace is not None:
+            metrics.begin_trace(trace)
+        try:
+            result = self.unpack_result(future.result())
+            self.cache_result(cache_key, table, result)
+            self.publish_result(client, output_topic, result, properties)
+        except Exception:
+            metrics.FAILED_ERROR.inc()
+            logger.exception("Error processing message")
+        finally:
+            if trace is not None:
+                metrics.end_trace()
+            if received is not None:
+                self.observe_message(*received)
+
+    def cache_result(self, cache_key, table, result):
+        """Keep a result for repeats of the same request"""
+        if cache_key is not None and result is not None:
+            self.result_cache.put(cache_key, table, result)
+
+    def publish_result(self, client, output_topic, result, properties=None):
+        """Publish a processed result to the output topic"""
+        # we only want to publish when there is a result
+        # otherwise the validation failed
+        if result is not None:
+            # publish to the output topic, on the connection the request came in on
+            timer = metrics.stage_timer()
+            connection = self.connection_for(client)
+            if (connection.spool is not None or len(self.pool) > 1) and not client.is_connected():
+                # while it's down, another connection to the same broker takes its results
+                fallback = self.pool.fallback(connection)
+                if fallback is not None:
+                    connection, client = fallback, fallback.client
+                    metrics.PUBLISHES_REROUTED.inc()
+            if connection.spool is not None and not client.is_connected():
+                self.spool_result(output_topic, result, properties, connection.spool)
+            elif connection.publisher is not None:
+                # counted by the publisher once the client takes it
+                connection.publisher.publish(output_topic, result, properties)
+            else:
+                info = client.publish(output_topic, result, qos=self.publish_qos, properties=properties)
+                if info.rc == mqtt.MQTT_ERR_SUCCESS:
+                    metrics.MESSAGES_PUBLISHED.inc()
+                elif connection.spool is not None:
+                    self.spool_result(output_topic, result, properties, connection.spool)
+                else:
+                    # e.g. qos 0 while disconnected, the result is lost
+                    metrics.FAILED_PUBLISH_REFUSED.inc()
+                    message_log.info("Publish refused: %s", mqtt.error_string(info.rc), topic=output_topic)
+            timer.mark("publish")
+            if message_log.enabled():
+                message_log.logger.info(
+                    "Published result to topic %s: %s", output_topic, message_log.payload(result),
+                    extra={"topic": output_topic}
+                )
+        else:
+            message_log.info("Failed to process request", topic=output_topic)
+
+    def spool_result(self, output_topic, result, properties=None, spool=None):
+        """Keep a result that can't be published until the client reconnects"""
+        spool = spool if spool is not None else self.spool
+        spool.append(output_topic, result, properties.ContentType if properties is not None else "")
+        metrics.SPOOLED.inc()
+
+    def start_replay(self, client):
+        """Replay the spool off the network thread, which has to keep running to send it"""
+        threading.Thread(target=self.replay_spool, args=(client,), name="spool-replay", daemon=True).start()
+
+    def replay_spool(self, client) -> int:
+        """Publish every spooled result, returning how many were published"""
+        # a reconnect while replaying leaves the remaining segments to the running replay,
+        # connections to the same broker share its spool and lock
+        connection = self.connection_for(client)
+        if not connection.replay_lock.acquire(blocking=False):
+            return 0
+        replayed = 0
+        try:
+            steps = self.replay_segments(client, connection.spool)
+            try:
+                info = next(steps)
+                while True:
+                    info.wait_for_publish(REPLAY_TIMEOUT)
+                    info = steps.send(info.is_published())
+            except StopIteration as done:
+                replayed = done.value
+            return replayed
+        except Exception:
+            logger.exception("Error replaying the spool")
+            return replayed
+        finally:
+            connection.replay_lock.release()
+            if replayed:
+                logger.info("Replayed %s spooled results", replayed)
+
+    def replay_segments(self, client, spool):
+        """Publish a spool segment by segment, yielding the last publish of each to wait for
+
+        The caller sends back whether that publish completed, and the segment is only
+        removed once it did, so a connection lost mid-replay keeps the segment for the
+        next one and some of its results may be published twice. Returns how many
+        results were replayed.
+        """
+        replayed = 0
+        segments = spool.segments()
+        while segments and client.is_connected():
+            for segment in segments:
+                count = 0
+                info = None
+                for topic, payload, content_type in spool.read(segment):
+                    info = client.publish(topic, payload, qos=self.publish_qos, properties=reply_properties(content_type))
+                    if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                        logger.warning("Stopped replaying the spool: %s", mqtt.error_string(info.rc))
+                        return replayed
+                    metrics.MESSAGES_PUBLISHED.inc()
+                    count += 1
+                if info is not None and not (yield info):
+                    logger.warning("Stopped replaying the spool, %s was not acknowledged", segment)
+                    return replayed
+                spool.remove(segment, count)
+                replayed += count
+                metrics.SPOOL_REPLAYED.inc(count)
+            # results spooled while replaying are picked up before returning
+            segments = spool.segments()
+        return replayed
+
+    # callback when the client has finished sending a publish
+    def on_publish(self, client, userdata, mid, reason_code=None, properties=None):
+        metrics.PUBLISHES_COMPLETED.inc()
+
+    def serve_metrics(self):
+        """Start the metrics endpoint when METRICS_PORT is set"""
+        if self.metrics_port is not None and self.metrics_server is None:
+            self.metrics_server = metrics.start_metrics_server(self.metrics_port)
 
     def start(self):
-        """Start the MQTT client"""
+        """Start the MQTT client, or every client of the pool"""
         try:
-            # connect to the broker
-            print(f"Connecting to MQTT broker: {self.mqtt_broker}:{self.mqtt_broker_port}")
-            self.client.connect(self.mqtt_broker, self.mqtt_broker_port)
+            self.serve_metrics()
+            self.start_admission()
+            for connection in self.pool:
+                if connection.publisher is not None:
+                    connection.publisher.start()
 
-            # keep engine running
-            self.client.loop_forever()
+            if len(self.pool) > 1:
+                logger.info("Starting %s connections to %s brokers", len(self.pool), len(self.brokers))
+                self.pool.start()
+            else:
+                # connect to the broker
+                logger.info("Connecting to MQTT broker: %s:%s", self.mqtt_broker, self.mqtt_broker_port)
+                if self.retry_first_connect:
+                    # the first connection is retried with the same backoff as reconnects
+                    self.client.connect_async(self.mqtt_broker, self.mqtt_broker_port)
+                else:
+                    self.client.connect(self.mqtt_broker, self.mqtt_broker_port)
+                # the loop runs on its own thread even for one connection, paho only queues publishes
+                # from other threads (workers, the batch publisher, spool replays) for it then,
+                # instead of each of them writing to the socket and interleaving packets
+                self.client.loop_start()
+
+            # every connection runs its own network loop, lost connections are reestablished by it,
+            # this thread only waits for stop() to have drained the workers before closing them
+            self._stopped.wait()
+            self.pool.stop()
 
         except Exception as e:
-            print(f"An error occurred: {e}")
+            logger.error("An error occurred: %s", e)
             exit(1)
 
+        finally:
+            # already done by shutdown() after stop(), this covers the loop ending on an error
+            self.drain()
+            for connection in self.pool:
+                if connection.publisher is not None:
+                    connection.publisher.close()
+            for spool in self.spools:
+                spool.close()
+
+    def stop(self):
+        """Finish the messages already taken and disconnect, which makes start() return"""
+        # called from signal handlers, which interrupt the thread that is waiting in start(),
+        # the network loops have to keep sending results while the workers drain
+        if self._shutdown_thread is None:
+            self._shutdown_thread = threading.Thread(target=self.shutdown, name="engine-shutdown", daemon=True)
+            self._shutdown_thread.start()
+        return self._shutdown_thread
+
+    def shutdown(self):
+        """Stop taking messages, publish the results of the ones in progress, then disconnect"""
+        for connection in self.pool:
+            connection.client.unsubscribe(self.subscription_topics)
+        self.drain()
+        # the batched results are handed to the client before the disconnect is queued behind them
+        for connection in self.pool:
+            if connection.publisher is not None:
+                connection.publisher.close()
+        # start() disconnects every client once woken up
+        self._stopped.set()
+
+    def drain(self):
+        """Wait for admitted and queued payloads to finish, their results are published as they do"""
+        if self.admission_thread is not None:
+            self.admission_queue.close()
+            self.admission_thread.join()
+        if self.worker_pool is not None:
+            self.worker_pool.shutdown()
+
+# failure counters incremented while processing, in a worker process they're sent back with the result
+CHILD_FAILURES = (metrics.FAILED_INVALID_JSON, metrics.FAILED_INVALID_INPUT, metrics.FAILED_INVALID_BINARY, metrics.FAILED_ERROR)
+
+def process_counting_failures(process, payload):
+    """Run in a worker process, return the result with how much each of CHILD_FAILURES went up"""
+    before = [metric.value for metric in CHILD_FAILURES]
+    result = process(payload)
+    return result, [metric.value - previous for metric, previous in zip(CHILD_FAILURES, before)]
+
+def process_traced(trace, process, payload):
+    """Run on a worker thread, adding the payload's stage timings to its message's trace"""
+    metrics.begin_trace(trace)
+    try:
+        return process(payload)
+    finally:
+        metrics.end_trace()
+
+def reply_properties(content_type: str):
+    """Return the properties to publish a spooled result with"""
+    return wire.REPLY_PROPERTIES if content_type == wire.CONTENT_TYPE else None
+
 def main():
-    engine = WinterSupplementEngine()
+    load_dotenv()
+    config = EngineConfig.from_env()
+    configure_logging(config=config)
+    engine = WinterSupplementEngine(config)
+    # disconnect cleanly on SIGTERM so queued logs are flushed on exit
+    signal.signal(signal.SIGTERM, lambda signum, frame: engine.stop())
+    # `kill -USR1 <pid>` profiles the running engine
+    signal.signal(signal.SIGUSR1, lambda signum, frame: engine.start_profile())
     engine.start()
 
 
@@ -0,0 +1,258 @@
+"""Load generator that measures the engine's round-trip latency and throughput.
+
+Publishes requests at fixed rates to MQTT_INPUT_TOPIC_PREFIX/<id>, collects the
+replies on MQTT_OUTPUT_TOPIC_PREFIX/+ and reports p50/p99 round-trip latency and
+sustained messages per second for every rate step. With --embedded it starts a
+local broker and an engine process so no network access is needed.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import uuid
+import paho.mqtt.client as mqtt
+from paho.mqtt.enums import CallbackAPIVersion
+from winter_supplement_engine.broker import LocalBroker
+from winter_supplement_engine.config import load_dotenv
+
+DEFAULT_INPUT_TOPIC_PREFIX = "BRE/calculateWinterSupplementInput"
+DEFAULT_OUTPUT_TOPIC_PREFIX = "BRE/calculateWinterSupplementOutput"
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+class LoadGenerator:
+    """Publishes requests at a fixed rate and times the engine's replies"""
+
+    def __init__(self, host, port, input_prefix=DEFAULT_INPUT_TOPIC_PREFIX,
+                 output_prefix=DEFAULT_OUTPUT_TOPIC_PREFIX, tenants=100, qos=0, seed=0):
+        self.host = host
+        self.port = port
+        self.input_prefix = input_prefix
+        self.output_prefix = output_prefix
+        self.tenants = [uuid.UUID(int=random.Random(seed + index).getrandbits(128)).hex for index in range(tenants)]
+        self.qos = qos
+        self.rng = random.Random(seed)
+
+        # request id -> send time, filled by the publishing thread and drained by paho's
+        self.pending: dict[str, int] = {}
+        self.latencies: list[int] = []
+        self.last_reply = 0.0
+        self.lock = threading.Lock()
+        self.subscribed = threading.Event()
+
+        self.client = mqtt.Client(
+            client_id=f"loadtest-{uuid.uuid4().hex[:8]}",
+            protocol=mqtt.MQTTv5,
+            callback_api_version=CallbackAPIVersion.VERSION2
+        )
+        self.client.max_queued_messages_set(0)
+        self.client.on_connect = self.on_connect
+        self.client.on_subscribe = self.on_subscribe
+        self.client.on_message = self.on_message
+
+    def connect(self, timeout=10.0):
+        self.client.connect(self.host, self.port)
+        self.client.loop_start()
+        if not self.subscribed.wait(timeout):
+            raise TimeoutError(f"Could not subscribe to {self.output_prefix}/+ on {self.host}:{self.port}")
+
+    def close(self):
+        self.client.disconnect()
+        self.client.loop_stop()
+
+    def on_connect(self, client, userdata, flags, rc, properties=None):
+        client.subscribe(f"{self.output_prefix}/+", qos=self.qos)
+
+    def on_subscribe(self, client, userdata, mid, reason_codes, properties=None):
+        self.subscribed.set()
+
+    def on_message(self, client, userdata, message):
+        received = time.perf_counter_ns()
+        try:
+            request_id = json.loads(message.payload)["id"]
+        except (ValueError, KeyError, TypeError):
+            return
+        with self.lock:
+            sent = self.pending.pop(request_id, None)
+            if sent is not None:
+                self.latencies.append(received - sent)
+                self.last_reply = time.perf_counter()
+
+    def make_request(self, request_id):
+        topic_id = self.rng.choice(self.tenants)
+        payload = json.dumps({
+            "id": request_id,
+            "numberOfChildren": self.rng.randint(0, 6),
+            "familyComposition": self.rng.choice(("single", "couple")),
+            "familyUnitInPayForDecember": self.rng.random() < 0.8
+        })
+        return f"{self.input_prefix}/{topic_id}", payload
+
+    def send(self, request_id):
+        topic, payload = self.make_request(request_id)
+        with self.lock:
+            self.pending[request_id] = time.perf_counter_ns()
+        self.client.publish(topic, payload, qos=self.qos)
+
+    def wait_for_engine(self, timeout=30.0):
+        """Send probes until the engine answers, so the first step doesn't count startup"""
+        deadline = time.monotonic() + timeout
+        probe = 0
+        while time.monotonic() < deadline:
+            self.send(f"probe-{probe}")
+            probe += 1
+            time.sleep(0.2)
+            with self.lock:
+                if self.latencies:
+                    self.pending.clear()
+                    self.latencies.clear()
+                    return
+        raise TimeoutError("The engine did not answer any probe request")
+
+    def run_step(self, rate, duration, drain_timeout=5.0):
+        """Publish at a fixed rate for a duration and report the replies"""
+        with self.lock:
+            self.pending.clear()
+            self.latencies.clear()
+
+        total = max(1, int(rate * duration))
+        interval = 1.0 / rate
+        step_id = uuid.uuid4().hex[:6]
+        start = time.perf_counter()
+
+        for index in range(total):
+            # keep to the schedule instead of sleeping a fixed interval, so slow
+            # publishes don't lower the offered rate
+            delay = start + index * interval - time.perf_counter()
+            if delay > 0.001:
+                time.sleep(delay)
+            self.send(f"{step_id}-{index}")
+        send_elapsed = time.perf_counter() - start
+
+        # wait for outstanding replies
+        deadline = time.perf_counter() + drain_timeout
+        while time.perf_counter() < deadline:
+            with self.lock:
+                if not self.pending:
+                    break
+            time.sleep(0.01)
+
+        with self.lock:
+            latencies = sorted(self.latencies)
+            lost = len(self.pending)
+            last_reply = self.last_reply
+
+        elapsed = (last_reply - start) if latencies else send_elapsed
+        to_ms = lambda value: value / 1e6 if value is not None else None
+        return {
+            "target_rate": rate,
+            "sent": total,
+            "received": len(latencies),
+            "lost": lost,
+            "offered_rate": total / send_elapsed,
+            "throughput": len(latencies) / elapsed if elapsed > 0 else 0.0,
+            "latency_ms": {
+                "p50": to_ms(percentile(latencies, 0.50)),
+                "p90": to_ms(percentile(latencies, 0.90)),
+                "p99": to_ms(percentile(latencies, 0.99)),
+                "max": to_ms(latencies[-1] if latencies else None),
+            },
+        }
+
+def start_engine_process(host, port, input_prefix, output_prefix):
+    """Start an engine in its own process, pointed at the given broker"""
+    env = {
+        **os.environ,
+        "MQTT_BROKER": host,
+        "MQTT_BROKER_PORT": str(port),
+        "MQTT_INPUT_TOPIC_PREFIX": input_prefix,
+        "MQTT_OUTPUT_TOPIC_PREFIX": output_prefix,
+    }
+    env.pop("MQTT_TOPIC_ID", None)
+    return subprocess.Popen(
+        [sys.executable, "-m", "winter_supplement_engine.engine"],
+        env=env,
+        stdout=subprocess.DEVNULL
+    )
+
+def is_saturated(step):
+    """A step is saturated when the engine falls behind the offered rate"""
+    return step["lost"] > 0 or step["throughput"] < 0.95 * step["offered_rate"]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--broker", help="host:port of the broker, defaults to MQTT_BROKER and MQTT_BROKER_PORT")
+    parser.add_argument("--embedded", action="store_true", help="start a local broker and an engine process")
+    parser.add_argument("--rates", default="500,1000,2000,5000", help="comma separated messages per second to step through")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per rate step")
+    parser.add_argument("--tenants", type=int, default=100, help="number of topic ids to spread requests over")
+    parser.add_argument("--qos", type=int, default=0, choices=(0, 1, 2))
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    input_prefix = os.getenv("MQTT_INPUT_TOPIC_PREFIX", DEFAULT_INPUT_TOPIC_PREFIX)
+    output_prefix = os.getenv("MQTT_OUTPUT_TOPIC_PREFIX", DEFAULT_OUTPUT_TOPIC_PREFIX)
+
+    broker = None
+    engine = None
+    if args.embedded:
+        broker = LocalBroker().start()
+        host, port = broker.host, broker.port
+        engine = start_engine_process(host, port, input_prefix, output_prefix)
+    elif args.broker:
+        host, _, port = args.broker.rpartition(":")
+        port = int(port)
+    else:
+        host, port = os.getenv("MQTT_BROKER", "127.0.0.1"), int(os.getenv("MQTT_BROKER_PORT", "1883"))
+
+    generator = LoadGenerator(host, port, input_prefix, output_prefix, args.tenants, args.qos)
+    steps = []
+    try:
+        generator.connect()
+        generator.wait_for_engine()
+        for rate in (float(value) for value in args.rates.split(",")):
+            step = generator.run_step(rate, args.duration)
+            steps.append(step)
+            print(
+                f"{rate:>8.0f} msg/s offered: {step['throughput']:>8.0f} msg/s sustained, "
+                f"p50 {step['latency_ms']['p50'] or 0:.2f} ms, p99 {step['latency_ms']['p99'] or 0:.2f} ms, "
+                f"{step['lost']} lost",
+                file=sys.stderr
+            )
+            if is_saturated(step):
+                print("Engine saturated, stopping", file=sys.stderr)
+                break
+    finally:
+        generator.close()
+        if engine is not None:
+            engine.terminate()
+            engine.wait()
+        if broker is not None:
+            broker.stop()
+
+    report = {
+        "broker": f"{host}:{port}",
+        "embedded": args.embedded,
+        "qos": args.qos,
+        "duration": args.duration,
+        "steps": steps,
+        "saturation_rate": next((step["target_rate"] for step in steps if is_saturated(step)), None),
+    }
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from typing import TYPE_CHECKING, Callable, Optional, Union
+
+if TYPE_CHECKING:
+    from winter_supplement_engine.config import EngineConfig
+
+# logger for per-message events, sampled and leveled separately from the rest
+MESSAGES_LOGGER = "winter_supplement_engine.messages"
+
+# attributes every LogRecord has, anything else was passed through `extra`
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line, including `extra` fields"""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that drops records instead of blocking when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class MessageLogger:
+    """Per-message event logger, the sampling decision is made before any record is built"""
+
+    def __init__(self, name: str = MESSAGES_LOGGER):
+        self.logger = logging.getLogger(name)
+        self.sample_rate = 1.0
+        self.log_payloads = True
+
+    def enabled(self, level: int = logging.INFO) -> bool:
+        """Whether an event at this level should be logged, call before building its arguments"""
+        if not self.logger.isEnabledFor(level):
+            return False
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def payload(self, payload: Union[bytes, str, None]) -> str:
+        """Payload as it should appear in logs, omitted when payload logging is off"""
+        if not self.log_payloads:
+            return "<omitted>"
+        if isinstance(payload, bytes):
+            return payload.decode(errors="replace")
+        return str(payload)
+
+    def info(self, msg, *args, **fields):
+        if self.enabled(logging.INFO):
+            self.logger.info(msg, *args, extra=fields)
+
+    def debug(self, msg, *args, **fields):
+        if self.enabled(logging.DEBUG):
+            self.logger.debug(msg, *args, extra=fields)
+
+message_log = MessageLogger()
+
+# listener writing queued records, along with the pid that started it
+_listener: Optional[tuple[int, logging.handlers.QueueListener]] = None
+
+# listener writing the records of worker processes, and the queue they send them to
+_worker_listener: Optional[tuple[int, logging.handlers.QueueListener]] = None
+
+# levels and sampling of the last configure_logging(), handed on to worker processes
+_settings: Optional[tuple] = None
+
+@atexit.register
+def _flush_logs():
+    # write out whatever is still queued when the process exits,
+    # listeners started by the parent of a forked process are left alone
+    global _listener, _worker_listener
+    for started in (_worker_listener, _listener):
+        if started is not None and started[0] == os.getpid():
+            started[1].stop()
+    _listener = _worker_listener = None
+
+def configure_logging(level=None, message_level=None, sample_rate=None, log_payloads=None, log_format=None, queue_size=None,
+                      config: Optional["EngineConfig"] = None):
+    """Send the engine's logs through a background queue, settings default to the config's LOG_* settings"""
+    global _listener
+
+    if config is not None:
+        level = level or config.log_level
+        message_level = message_level or config.log_message_level
+        sample_rate = config.log_sample_rate if sample_rate is None else sample_rate
+        log_payloads = config.log_payloads if log_payloads is None else log_payloads
+        log_format = log_format or config.log_format
+        queue_size = config.log_queue_size if queue_size is None else queue_size
+    level = level or "INFO"
+    message_level = message_level or level
+    if sample_rate is None:
+        sample_rate = 1.0
+    if log_payloads is None:
+        log_payloads = True
+    log_format = log_format or "json"
+    if queue_size is None:
+        queue_size = 10000
+
+    if not 0.0 <= sample_rate <= 1.0:
+        raise ValueError(f"Invalid value for LOG_SAMPLE_RATE: {sample_rate} (expected 0 to 1)")
+    if log_format not in ("json", "text"):
+        raise ValueError(f"Invalid value for LOG_FORMAT: {log_format} (expected json or text)")
+
+    # stop the previous listeners
+    _flush_logs()
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if log_format == "json":
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    # records are formatted and written on the listener's thread, never on the network thread
+    log_queue = queue.Queue(maxsize=queue_size)
+    listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    _listener = (os.getpid(), listener)
+
+    # installed on the root logger so modules run with `python -m` are covered too
+    root_logger = logging.getLogger()
+    for handler in list(root_logger.handlers):
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(DroppingQueueHandler(log_queue))
+
+    global _settings
+    _settings = (level, message_level, sample_rate, log_payloads)
+    _apply_levels(*_settings)
+
+def _apply_levels(level, message_level, sample_rate, log_payloads):
+    logging.getLogger().setLevel(level.upper())
+    message_log.logger.setLevel(message_level.upper())
+    message_log.sample_rate = sample_rate
+    message_log.log_payloads = log_payloads
+
+def worker_logging(context) -> tuple[Optional[Callable], tuple]:
+    """Return a process pool initializer, and its arguments, that sends the workers' logs to this process' output
+
+    Worker processes have no listener of their own, so their records go through a
+    queue of the multiprocessing context to a listener in this process. Returns
+    no initializer when logging wasn't configured.
+    """
+    global _worker_listener
+    if _listener is None or _listener[0] != os.getpid():
+        return None, ()
+    if _worker_listener is None:
+        log_queue = context.Queue()
+        listener = logging.handlers.QueueListener(log_queue, *_listener[1].handlers, respect_handler_level=True)
+        listener.start()
+        _worker_listener = (os.getpid(), listener)
+    return _configure_worker, (_worker_listener[1].queue, *_settings)
+
+def _configure_worker(log_queue, level, message_level, sample_rate, log_payloads):
+    # runs first in every worker process
+    root_logger = logging.getLogger()
+    for handler in list(root_logger.handlers):
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(DroppingQueueHandler(log_queue))
+    _apply_levels(level, message_level, sample_rate, log_payloads)
@@ -0,0 +1,315 @@
+"""Counters, gauges and histograms exposed in the Prometheus text format."""
+import bisect
+import logging
+import threading
+from time import perf_counter
+from typing import TYPE_CHECKING, Callable, Optional
+
+if TYPE_CHECKING:
+    import http.server
+
+logger = logging.getLogger(__name__)
+
+# latency buckets in seconds, from a few microseconds up to a second
+DEFAULT_BUCKETS = (
+    0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0
+)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labelnames, labelvalues, extra=()):
+    pairs = [*zip(labelnames, labelvalues), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    """Base for metrics with optional labels, children are created once per label combination
+
+    Updates aren't locked to keep them cheap on the message path, a thread switch
+    in the middle of one can lose an increment which is fine for monitoring.
+    """
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames=(), registry: Optional["Registry"] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple, Metric] = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *labelvalues):
+        """Return the child for these label values, callers on hot paths should keep it"""
+        if len(labelvalues) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        child = self._children.get(labelvalues)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(labelvalues, self._new_child())
+        return child
+
+    def _new_child(self):
+        return type(self)(self.name, self.documentation)
+
+    def samples(self):
+        """Yield (suffix, labels, value) for every series"""
+        if self.labelnames:
+            for labelvalues, child in list(self._children.items()):
+                for suffix, extra, value in child._own_samples():
+                    yield suffix, _format_labels(self.labelnames, labelvalues, extra), value
+        else:
+            for suffix, extra, value in self._own_samples():
+                yield suffix, _format_labels((), (), extra), value
+
+    def _own_samples(self):
+        raise NotImplementedError
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def _own_samples(self):
+        yield "_total", (), self.value
+
+class Gauge(Metric):
+    type_name = "gauge"
+
+    def __init__(self, *args, function: Optional[Callable[[], float]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.value = 0
+        # gauges backed by a function are read when scraped
+        self.function = function
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set_function(self, function: Callable[[], float]):
+        self.function = function
+
+    def _own_samples(self):
+        yield "", (), self.function() if self.function is not None else self.value
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(self, *args, buckets=DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def _new_child(self):
+        return Histogram(self.name, self.documentation, buckets=self.buckets)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def _own_samples(self):
+        cumulative = 0
+        for bound, count in zip((*self.buckets, float("inf")), self.counts):
+            cumulative += count
+            yield "_bucket", (("le", _format_value(bound)),), cumulative
+        yield "_sum", (), self.sum
+        yield "_count", (), self.count
+
+class Registry:
+    """Collection of metrics rendered together"""
+
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self.metrics[metric.name] = metric
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            for suffix, labels, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+# set to False to skip stage timings entirely
+enabled = True
+
+# message flow
+MESSAGES_RECEIVED = Counter("winter_supplement_messages_received", "Messages received from the broker", registry=REGISTRY)
+MESSAGES_PUBLISHED = Counter("winter_supplement_messages_published", "Results the client accepted for publishing", registry=REGISTRY)
+MESSAGES_FAILED = Counter(
+    "winter_supplement_messages_failed", "Messages that produced no published result, by reason", ("reason",),
+    registry=REGISTRY
+)
+PUBLISHES_COMPLETED = Counter(
+    "winter_supplement_publishes_completed", "Publishes the client finished sending", registry=REGISTRY
+)
+PUBLISH_QUEUE_DEPTH = Gauge(
+    "winter_supplement_publish_queue_depth", "Publishes handed to the client that haven't been sent yet",
+    registry=REGISTRY, function=lambda: MESSAGES_PUBLISHED.value - PUBLISHES_COMPLETED.value
+)
+PUBLISH_BATCH_SIZE = Histogram(
+    "winter_supplement_publish_batch_size", "Results published per batch when batching is enabled",
+    registry=REGISTRY, buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+)
+
+# latency
+MESSAGE_SECONDS = Histogram(
+    "winter_supplement_message_seconds", "Time from receiving a message to publishing its result", registry=REGISTRY
+)
+STAGE_SECONDS = Histogram(
+    "winter_supplement_stage_seconds", "Time spent in each processing stage", ("stage",), registry=REGISTRY
+)
+STAGES = {stage: STAGE_SECONDS.labels(stage) for stage in ("parse", "validate", "calculate", "serialize", "publish")}
+
+# connection state
+CONNECTED = Gauge("winter_supplement_connected", "Connections to the brokers that are up", registry=REGISTRY)
+CONNECTIONS = Gauge("winter_supplement_connections", "Connections in the pool, up or down", registry=REGISTRY)
+CONNECTS = Counter("winter_supplement_connects", "Successful connections to the brokers", registry=REGISTRY)
+DISCONNECTS = Counter("winter_supplement_disconnects", "Disconnections from the brokers", registry=REGISTRY)
+PUBLISHES_REROUTED = Counter(
+    "winter_supplement_publishes_rerouted", "Results published on another connection because theirs was down",
+    registry=REGISTRY
+)
+
+# results written to the spool while disconnected and published again after reconnecting
+SPOOLED = Counter("winter_supplement_spooled", "Results written to the spool while disconnected", registry=REGISTRY)
+SPOOL_REPLAYED = Counter("winter_supplement_spool_replayed", "Spooled results published after reconnecting", registry=REGISTRY)
+SPOOL_PENDING = Gauge("winter_supplement_spool_pending", "Results in the spool waiting to be published", registry=REGISTRY)
+
+# duplicate requests answered from the result cache
+DEDUP_HITS = Counter("winter_supplement_dedup_hits", "Requests answered from the result cache", registry=REGISTRY)
+DEDUP_MISSES = Counter("winter_supplement_dedup_misses", "Requests that weren't in the result cache", registry=REGISTRY)
+DEDUP_EVICTIONS = Counter("winter_supplement_dedup_evictions", "Results evicted from the full result cache", registry=REGISTRY)
+DEDUP_SIZE = Gauge("winter_supplement_dedup_size", "Results held in the result cache", registry=REGISTRY)
+
+# admission control decisions, by outcome
+ADMISSION_DECISIONS = Counter(
+    "winter_supplement_admission_decisions", "Messages admitted, rate limited or shed by admission control",
+    ("decision",), registry=REGISTRY
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "winter_supplement_admission_queue_depth", "Admitted messages waiting for a worker", registry=REGISTRY
+)
+ADMISSION_TENANTS = Gauge(
+    "winter_supplement_admission_tenants", "Tenants with a rate limit bucket", registry=REGISTRY
+)
+
+RATE_RELOADS = Counter("winter_supplement_rate_reloads", "Rate files reloaded while running", registry=REGISTRY)
+
+# precomputed table lookups, read from the engine's table when scraped
+TABLE_HITS = Gauge("winter_supplement_table_hits", "Outputs served from the precomputed table", registry=REGISTRY)
+TABLE_MISSES = Gauge("winter_supplement_table_misses", "Outputs calculated because they weren't in the table", registry=REGISTRY)
+
+# failure reasons, resolved once so the hot path skips the label lookup
+FAILED_INVALID_JSON = MESSAGES_FAILED.labels("invalid_json")
+FAILED_INVALID_INPUT = MESSAGES_FAILED.labels("invalid_input")
+FAILED_INVALID_BINARY = MESSAGES_FAILED.labels("invalid_binary")
+FAILED_INVALID_TOPIC = MESSAGES_FAILED.labels("invalid_topic")
+FAILED_ERROR = MESSAGES_FAILED.labels("error")
+FAILED_PUBLISH_REFUSED = MESSAGES_FAILED.labels("publish_refused")
+
+# admission outcomes, resolved once the same way
+ADMITTED = ADMISSION_DECISIONS.labels("admitted")
+RATE_LIMITED = ADMISSION_DECISIONS.labels("rate_limited")
+SHED = ADMISSION_DECISIONS.labels("shed")
+
+class StageTimer:
+    """Records the time since the previous mark under a stage name, and in the message's trace"""
+    __slots__ = ("last", "trace")
+
+    def __init__(self, trace: Optional[list] = None):
+        self.last = perf_counter()
+        self.trace = trace
+
+    def mark(self, stage: str):
+        now = perf_counter()
+        if enabled:
+            STAGES[stage].observe(now - self.last)
+        if self.trace is not None:
+            self.trace.append((stage, now - self.last))
+        self.last = now
+
+class _NullTimer:
+    __slots__ = ()
+
+    def mark(self, stage: str):
+        pass
+
+NULL_TIMER = _NullTimer()
+
+# set when slow messages are traced, stage timings are then also kept per message
+tracing = False
+_trace = threading.local()
+
+def begin_trace(trace: Optional[list] = None) -> list:
+    """Start collecting the stage timings of the message handled on this thread, or continue its trace"""
+    if trace is None:
+        trace = []
+    _trace.stages = trace
+    return trace
+
+def end_trace():
+    _trace.stages = None
+
+def stage_timer():
+    """Return a timer for one message, or one that does nothing when metrics and tracing are off"""
+    if tracing:
+        return StageTimer(getattr(_trace, "stages", None))
+    return StageTimer() if enabled else NULL_TIMER
+
+def start_metrics_server(port: int, host: str = "0.0.0.0", registry: Registry = REGISTRY) -> "http.server.ThreadingHTTPServer":
+    """Serve the registry on /metrics from a background thread"""
+    # http.server pulls in most of the email package, only import it when serving
+    import http.server
+
+    class MetricsHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # scrapes would otherwise be written to stderr on every request
+            pass
+
+    server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True)
+    thread.start()
+    logger.info("Serving metrics on http://%s:%s/metrics", host, server.server_address[1])
+    return server
@@ -0,0 +1,87 @@
+"""Sampling profiler that writes folded stacks, the input format of flamegraph.pl and speedscope.
+
+Every interval the stacks of all other threads are read with sys._current_frames(),
+so the profiled code runs unmodified and nothing is paid while no profile is running.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+class SamplingProfiler:
+    """Samples every thread's stack for duration seconds and writes the counts to path"""
+
+    def __init__(self, path, duration: float = 30.0, interval: float = 0.005):
+        if duration <= 0:
+            raise ValueError(f"Invalid value for PROFILE_SECONDS: {duration}")
+        if interval <= 0:
+            raise ValueError(f"Invalid value for PROFILE_INTERVAL_MS: {interval * 1000}")
+        self.path = path
+        self.duration = duration
+        self.interval = interval
+        self.samples = 0
+        self.stacks: Counter[str] = Counter()
+        self.stopped = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="sampling-profiler", daemon=True)
+            self.thread.start()
+        return self
+
+    def run(self):
+        own_thread = threading.get_ident()
+        deadline = time.monotonic() + self.duration
+        while not self.stopped.wait(self.interval) and time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_thread:
+                    self.stacks[fold(frame, names.get(thread_id, str(thread_id)))] += 1
+            self.samples += 1
+        self.write()
+
+    def write(self):
+        """Write one "frame;frame;frame count" line per distinct stack"""
+        with open(self.path, "w", encoding="utf-8") as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f"{stack} {count}\n")
+        logger.info("Wrote %s samples of %s stacks to %s", self.samples, len(self.stacks), self.path)
+
+    def stop(self):
+        """End the profile early, the file is still written"""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+def fold(frame, thread_name: str) -> str:
+    """Return a stack as root-first frames joined by semicolons, under its thread's name"""
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    frames.append(thread_name)
+    # tools split on the last space for the count, so spaces inside frames are fine
+    return ";".join(reversed(frames))
+
+_active: Optional[SamplingProfiler] = None
+_active_lock = threading.Lock()
+
+def start_profile(directory=".", duration: float = 30.0, interval: float = 0.005) -> Optional[SamplingProfiler]:
+    """Start a profile in the background unless one is already running"""
+    global _active
+    with _active_lock:
+        if _active is not None and _active.thread is not None and _active.thread.is_alive():
+            logger.warning("A profile is already running, writing to %s", _active.path)
+            return None
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"profile-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}.folded")
+        logger.info("Profiling for %ss, writing to %s", duration, path)
+        _active = SamplingProfiler(path, duration, interval).start()
+        return _active
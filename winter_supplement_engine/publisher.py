@@ -0,0 +1,191 @@
+import logging
+import threading
+from collections import deque
+from time import monotonic
+from typing import Optional, Union
+import paho.mqtt.client as mqtt
+from paho.mqtt.properties import Properties
+from winter_supplement_engine import metrics
+
+logger = logging.getLogger(__name__)
+
+# seconds close() waits for the flusher before giving up on the results it still holds
+CLOSE_TIMEOUT = 10
+
+class BatchPublisher:
+    """Collects results and publishes them in bursts from a single thread
+
+    A batch is flushed when it reaches max_batch results or max_delay seconds after
+    its first result arrived, whichever comes first. Raising max_delay trades latency
+    for fewer, larger bursts. Results the client can't take while disconnected are
+    written to the spool when one is given. At most max_buffered results wait for a
+    flush, publish() blocks the caller beyond that.
+    """
+
+    def __init__(self, client: mqtt.Client, max_batch=100, max_delay=0.005, max_inflight=1000, qos=0, spool=None,
+                 max_buffered=None):
+        if max_batch < 1:
+            raise ValueError(f"Invalid value for PUBLISH_BATCH_SIZE: {max_batch}")
+        if max_inflight < 1:
+            raise ValueError(f"Invalid value for PUBLISH_MAX_INFLIGHT: {max_inflight}")
+        if max_buffered is None:
+            max_buffered = max_inflight
+        if max_buffered < 1:
+            raise ValueError(f"Invalid value for PUBLISH_MAX_BUFFERED: {max_buffered}")
+        self.client = client
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_inflight = max_inflight
+        self.max_buffered = max_buffered
+        self.qos = qos
+        self.spool = spool
+
+        self.buffer: list[tuple[str, Union[str, bytes], Optional[Properties]]] = []
+        # the flusher waits on condition for results, callers wait on not_full for room
+        lock = threading.Lock()
+        self.condition = threading.Condition(lock)
+        self.not_full = threading.Condition(lock)
+        self.closed = False
+        self.thread = None
+
+        # publishes handed to the client that haven't been sent (or acknowledged for qos > 0)
+        self.inflight: deque[mqtt.MQTTMessageInfo] = deque()
+
+        # flush statistics, per output topic: [messages, bytes, flushes]
+        self.flushes = 0
+        self.largest_batch = 0
+        self.topics: dict[str, list[int]] = {}
+
+    def start(self):
+        """Start the flushing thread"""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="batch-publisher", daemon=True)
+            self.thread.start()
+        return self
+
+    def publish(self, topic: str, payload: Union[str, bytes], properties: Optional[Properties] = None):
+        """Add a result to the current batch, blocking while the buffer is full"""
+        # the caller keeps its worker slot (or paho's network thread) while it waits, so a
+        # broker that can't keep up stalls the reads instead of growing the buffer
+        with self.condition:
+            while len(self.buffer) >= self.max_buffered and not self.closed:
+                self.not_full.wait()
+            self.buffer.append((topic, payload, properties))
+            if len(self.buffer) == 1 or len(self.buffer) >= self._batch_target:
+                self.condition.notify()
+
+    @property
+    def _batch_target(self) -> int:
+        # a batch can't grow past what the buffer holds
+        return min(self.max_batch, self.max_buffered)
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.buffer and not self.closed:
+                    self.condition.wait()
+                if not self.buffer:
+                    return
+
+                # let the batch fill up until the window closes
+                deadline = monotonic() + self.max_delay
+                while len(self.buffer) < self._batch_target and not self.closed:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+
+                batch = self.buffer[:self.max_batch]
+                del self.buffer[:self.max_batch]
+                self.not_full.notify_all()
+
+            try:
+                self.flush(batch)
+            except Exception:
+                logger.exception("Error publishing batch")
+
+    def flush(self, batch):
+        """Hand a batch to the client back to back"""
+        # the client only queues each publish and wakes its network thread, which then
+        # writes the queued batch in one pass instead of waking up for every result
+        for topic, payload, properties in batch:
+            if self.spool is not None and not self.client.is_connected():
+                self._spool(topic, payload, properties)
+                continue
+            self.wait_for_inflight()
+            info = self.client.publish(topic, payload, qos=self.qos, properties=properties)
+            if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                if self.spool is not None:
+                    self._spool(topic, payload, properties)
+                else:
+                    metrics.FAILED_PUBLISH_REFUSED.inc()
+                continue
+            metrics.MESSAGES_PUBLISHED.inc()
+            self.inflight.append(info)
+
+            topic_stats = self.topics.get(topic)
+            if topic_stats is None:
+                topic_stats = self.topics[topic] = [0, 0, 0]
+            topic_stats[0] += 1
+            topic_stats[1] += len(payload)
+
+        for topic in {topic for topic, _, _ in batch}:
+            # topics that were only spooled have no stats yet
+            topic_stats = self.topics.get(topic)
+            if topic_stats is not None:
+                topic_stats[2] += 1
+        self.flushes += 1
+        self.largest_batch = max(self.largest_batch, len(batch))
+        metrics.PUBLISH_BATCH_SIZE.observe(len(batch))
+
+    def _spool(self, topic, payload, properties):
+        self.spool.append(topic, payload, properties.ContentType if properties is not None else "")
+        metrics.SPOOLED.inc()
+
+    def wait_for_inflight(self):
+        """Wait until there is room for another publish under max_inflight"""
+        inflight = self.inflight
+        while inflight and self._completed(inflight[0]):
+            inflight.popleft()
+        while len(inflight) >= self.max_inflight:
+            # nothing completes while disconnected, publish anyway and let the client queue it
+            if not self.client.is_connected():
+                return
+            # with a full buffer the network thread may be the caller waiting for room, and
+            # then it can't complete publishes either, so hand them to the client anyway
+            if len(self.buffer) >= self.max_buffered:
+                return
+            inflight[0].wait_for_publish(timeout=0.1)
+            while inflight and self._completed(inflight[0]):
+                inflight.popleft()
+
+    @staticmethod
+    def _completed(info: mqtt.MQTTMessageInfo) -> bool:
+        # publishes the client refused will never complete
+        return info.rc != mqtt.MQTT_ERR_SUCCESS or info.is_published()
+
+    def stats(self) -> dict:
+        """Return flush counts, in-flight publishes and per-topic totals"""
+        return {
+            "flushes": self.flushes,
+            "largest_batch": self.largest_batch,
+            "inflight": len(self.inflight),
+            "buffered": len(self.buffer),
+            "topics": {
+                topic: {"messages": messages, "bytes": size, "flushes": flushes}
+                for topic, (messages, size, flushes) in list(self.topics.items())
+            },
+        }
+
+    def close(self, timeout=CLOSE_TIMEOUT):
+        """Flush the remaining results and stop the flushing thread, waiting at most timeout seconds"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+            self.not_full.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            if self.thread.is_alive():
+                logger.warning("Publisher still flushing after %ss, %s buffered results not published",
+                               timeout, len(self.buffer))
+            self.thread = None
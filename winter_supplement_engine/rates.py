@@ -0,0 +1,93 @@
+import json
+import logging
+import os
+import threading
+from typing import Callable, Optional
+from winter_supplement_engine.rules import Rates
+
+logger = logging.getLogger(__name__)
+
+# rate file fields and the Rates attributes they map to
+RATE_FIELDS = {
+    "singleBaseAmount": "single_base_amount",
+    "familyBaseAmount": "family_base_amount",
+    "childAmount": "child_amount",
+}
+
+def parse_rates(data) -> Rates:
+    """Build Rates from a parsed rate file, raising ValueError if it is invalid"""
+    if not isinstance(data, dict):
+        raise ValueError("Rate file must contain a JSON object")
+    version = data.get("version")
+    if not isinstance(version, str) or not version:
+        raise ValueError("Rate file must have a non-empty string version")
+
+    amounts = {}
+    for field, attribute in RATE_FIELDS.items():
+        value = data.get(field)
+        # bool is a subclass of int, but true isn't a rate
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+            raise ValueError(f"{field} must be a non-negative number")
+        amounts[attribute] = float(value)
+    return Rates(version, **amounts)
+
+def load_rates(path) -> Rates:
+    """Read and validate a JSON rate file"""
+    with open(path, "rb") as file:
+        try:
+            data = json.load(file)
+        except ValueError as e:
+            raise ValueError(f"Invalid JSON in rate file {path}: {e}")
+    return parse_rates(data)
+
+class RateWatcher:
+    """Polls a rate file and calls on_change with the new rates when it changes
+
+    Files that fail to load are logged and skipped, so the rates in use are only
+    ever replaced by a complete, valid set.
+    """
+
+    def __init__(self, path, on_change: Callable[[Rates], None], interval: float = 1.0):
+        self.path = path
+        self.on_change = on_change
+        self.interval = interval
+        self.signature = self._signature()
+        self.stopped = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def _signature(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="rate-watcher", daemon=True)
+            self.thread.start()
+        return self
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.check()
+
+    def check(self) -> bool:
+        """Reload the file if it changed since the last check, return whether rates were applied"""
+        signature = self._signature()
+        if signature is None or signature == self.signature:
+            return False
+        self.signature = signature
+        try:
+            rates = load_rates(self.path)
+        except (OSError, ValueError) as e:
+            logger.error("Keeping current rates, could not load %s: %s", self.path, e)
+            return False
+        self.on_change(rates)
+        return True
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
@@ -0,0 +1,62 @@
+import sys
+from typing import Optional
+
+# marks topics that haven't been routed yet, None is cached for invalid topics
+_MISSING = object()
+
+def parse_routes(value: str) -> dict[str, str]:
+    """Parse "input/prefix=output/prefix,..." into a prefix map"""
+    routes = {}
+    for pair in value.split(","):
+        if not pair.strip():
+            continue
+        input_prefix, separator, output_prefix = pair.partition("=")
+        input_prefix, output_prefix = input_prefix.strip().rstrip("/"), output_prefix.strip().rstrip("/")
+        if not separator or not input_prefix or not output_prefix:
+            raise ValueError(f"Invalid value for MQTT_TOPIC_ROUTES: {pair!r}, expected input/prefix=output/prefix")
+        routes[input_prefix] = output_prefix
+    return routes
+
+class TopicRouter:
+    """Maps input topics to output topics, remembering the answer for every topic seen
+
+    Routing a topic that was seen before is one dictionary lookup. The cache is
+    cleared when it reaches cache_size, so memory stays bounded when topic ids
+    keep changing.
+    """
+
+    def __init__(self, routes: dict[str, str], topic_id: Optional[str] = None, cache_size: int = 10000):
+        if not routes:
+            raise ValueError("At least one topic route is required")
+        self.routes = dict(routes)
+        self.topic_id = topic_id
+        self.cache_size = cache_size
+        self._cache: dict[str, Optional[str]] = {}
+
+    def subscriptions(self) -> list[str]:
+        """Return the topic filter for every input prefix"""
+        level = self.topic_id if self.topic_id is not None else "+"
+        return [f"{input_prefix}/{level}" for input_prefix in self.routes]
+
+    def route(self, topic: str) -> Optional[str]:
+        """Return the output topic for an input topic, or None if no route matches"""
+        output_topic = self._cache.get(topic, _MISSING)
+        if output_topic is _MISSING:
+            output_topic = self._resolve(topic)
+            if len(self._cache) >= self.cache_size:
+                self._cache.clear()
+            self._cache[topic] = output_topic
+        return output_topic
+
+    def _resolve(self, topic: str) -> Optional[str]:
+        input_prefix, _, topic_id = topic.rpartition("/")
+        output_prefix = self.routes.get(input_prefix)
+        if output_prefix is None or not topic_id:
+            return None
+        if self.topic_id is not None and topic_id != self.topic_id:
+            return None
+        # interned so every message for a tenant publishes with the same string object
+        return sys.intern(f"{output_prefix}/{topic_id}")
+
+    def __len__(self):
+        return len(self._cache)
@@ -1,11 +1,42 @@
-from typing import TypedDict, Literal, Annotated, Optional
+from typing import TypedDict, Literal, Annotated, Optional, Iterable, Union, TYPE_CHECKING
+from array import array
 from dataclasses import dataclass
 import json
+import logging
+from winter_supplement_engine import metrics
+from winter_supplement_engine.log import message_log
+from winter_supplement_engine.validation import compile_validator, Range
+
+if TYPE_CHECKING:
+    from winter_supplement_engine.codec import JsonCodec
+    from winter_supplement_engine.table import SupplementTable
+
+logger = logging.getLogger(__name__)
+
+# reasonable maximum to protect against potential misuse
+MAX_CHILDREN = 30
+
+FAMILY_COMPOSITIONS = ("single", "couple")
+
+# supplement rates, used unless a rate file is loaded
+SINGLE_BASE_AMOUNT = 60.0  # single person with no children
+FAMILY_BASE_AMOUNT = 120.0  # couples and anyone with children
+CHILD_AMOUNT = 20.0  # per dependent child
+
+# a versioned set of supplement rates
+@dataclass(frozen=True)
+class Rates:
+    version: str
+    single_base_amount: float
+    family_base_amount: float
+    child_amount: float
+
+DEFAULT_RATES = Rates("default", SINGLE_BASE_AMOUNT, FAMILY_BASE_AMOUNT, CHILD_AMOUNT)
 
 # the type of the messages the engine should receive
 class WinterSupplementInput(TypedDict):
     id: str
-    numberOfChildren: Annotated[int, "Must be 0 or greater"]
+    numberOfChildren: Annotated[int, "Must be 0 or greater", Range(0, MAX_CHILDREN)]
     familyComposition: Literal["single", "couple"]
     familyUnitInPayForDecember: bool
 
@@ -17,40 +48,72 @@ class WinterSupplementOutput(TypedDict):
     childrenAmount: float
     supplementAmount: float
 
+# struct-of-arrays storage for validated batch inputs
+# only keeps what the calculation depends on, a few bytes per record plus the id
+class InputColumns:
+    __slots__ = ("ids", "children", "single", "eligible")
+
+    def __init__(self):
+        self.ids: list[str] = []
+        self.children = array("H")
+        # calculate_supplement only gives the single rate on an exact "single" match
+        self.single = array("b")
+        self.eligible = array("b")
+
+    def append(self, data: WinterSupplementInput):
+        self.ids.append(data['id'])
+        self.children.append(data['numberOfChildren'])
+        self.single.append(data['familyComposition'] == "single")
+        self.eligible.append(data['familyUnitInPayForDecember'])
+
+    def __len__(self):
+        return len(self.ids)
+
+# error record returned in place of a result when a batch item fails
+@dataclass
+class BatchError:
+    index: int
+    error: str
+
+# validator compiled from the WinterSupplementInput annotations
+check_input = compile_validator(WinterSupplementInput)
+
+# fields every input message must contain
+REQUIRED_FIELDS = check_input.required_fields
+
 # function to validate the messages the engine receives
 def validate_input(data: dict) -> Optional[WinterSupplementInput]:
-    try:
-        # make sure all fields are present
-        required_fields = {'id', 'numberOfChildren', 'familyComposition', 'familyUnitInPayForDecember'}
-        if not all(field in data for field in required_fields):
-            missing = required_fields - set(data.keys())
-            raise ValueError(f"Missing required fields: {missing}")
-
-        # validate id
-        if not isinstance(data['id'], str):
-            raise ValueError("id must be a string")
-
-        # validate numberOfChildren
-        MAX_CHILDREN = 30  # reasonable maximum to protect against potential misuse
-        if not isinstance(data['numberOfChildren'], int) or data['numberOfChildren'] < 0 or data['numberOfChildren'] > MAX_CHILDREN:
-            raise ValueError(f"numberOfChildren must be a non-negative integer not exceeding {MAX_CHILDREN}")
-
-        # validate familyComposition
-        if data['familyComposition'].lower() not in ["single", "couple"]:
-            raise ValueError("familyComposition must be either 'single' or 'couple'")
-
-        # validate familyUnitInPayForDecember
-        if not isinstance(data['familyUnitInPayForDecember'], bool):
-            raise ValueError("familyUnitInPayForDecember must be a boolean")
-
-        return data
-    except Exception as e:
-        print(f"Input validation error: {str(e)}")
+    errors = check_input(data)
+    if errors:
+        if message_log.enabled():
+            message_log.logger.info(
+                "Input validation error: %s", "; ".join(str(error) for error in errors),
+                extra={"fields": [error.field for error in errors]}
+            )
         return None
+    return data
+
 
+# the amounts for one set of inputs, shared by every calculation path
+# returns the baseAmount, childrenAmount and supplementAmount
+def supplement_amounts(
+    is_eligible: bool,
+    family_composition: str,
+    number_of_children: int,
+    rates: Rates = DEFAULT_RATES
+) -> tuple[float, float, float]:
+    if not is_eligible:
+        return 0.0, 0.0, 0.0
+
+    if family_composition == "single" and number_of_children == 0:
+        base_amount = rates.single_base_amount
+    else:
+        base_amount = rates.family_base_amount
+    children_amount = rates.child_amount * number_of_children if number_of_children > 0 else 0.0
+    return float(base_amount), float(children_amount), float(base_amount + children_amount)
 
 # calculates supplement given a valid input and returns a valid output
-def calculate_supplement(data: WinterSupplementInput) -> WinterSupplementOutput:
+def calculate_supplement(data: WinterSupplementInput, rates: Rates = DEFAULT_RATES) -> WinterSupplementOutput:
     try:
         # Extract input values
         client_id = data['id']
@@ -58,39 +121,23 @@ def calculate_supplement(data: WinterSupplementInput) -> WinterSupplementOutput:
         num_children = data['numberOfChildren']
         family_type = data['familyComposition']
 
-        # If not eligible, return zeros
-        if not is_eligible:
-            return {
-                "id": client_id,
-                "isEligible": False,
-                "baseAmount": 0.0,
-                "childrenAmount": 0.0,
-                "supplementAmount": 0.0
-            }
-
-        # Calculate base amount
-        base_amount = 60.0 if family_type == "single" and num_children == 0 else 120.0
-
-        # Calculate children amount
-        children_amount = 20.0 * num_children if num_children > 0 else 0.0
-
-        # Calculate total
-        total_amount = base_amount + children_amount
+        # Calculate amounts, zeros when not eligible
+        base_amount, children_amount, total_amount = supplement_amounts(is_eligible, family_type, num_children, rates)
 
         # Create and validate output
         output: WinterSupplementOutput = {
             "id": client_id,
-            "isEligible": True,
-            "baseAmount": float(base_amount),
-            "childrenAmount": float(children_amount),
-            "supplementAmount": float(total_amount)
+            "isEligible": bool(is_eligible),
+            "baseAmount": base_amount,
+            "childrenAmount": children_amount,
+            "supplementAmount": total_amount
         }
 
         return output
 
     except Exception as e:
         # If any calculation fails, return an error result
-        print(f"Calculation error: {str(e)}")
+        logger.error("Calculation error: %s", e)
         return {
             "id": data['id'],
             "isEligible": False,
@@ -100,25 +147,121 @@ def calculate_supplement(data: WinterSupplementInput) -> WinterSupplementOutput:
         }
 
 # process valid json string and return a json output
-def process_supplement_request(json_input: str) -> Optional[str]:
+# when a precomputed table is given the output is looked up instead of calculated
+# when a codec is given it parses the payload and the output is returned as bytes
+def process_supplement_request(
+    json_input: Union[str, bytes],
+    table: Optional["SupplementTable"] = None,
+    codec: Optional["JsonCodec"] = None
+) -> Optional[Union[str, bytes]]:
+    timer = metrics.stage_timer()
     try:
         # Parse JSON
-        data = json.loads(json_input)
+        try:
+            data = json.loads(json_input) if codec is None else codec.decode(json_input)
+        except ValueError:
+            metrics.FAILED_INVALID_JSON.inc()
+            message_log.info("Invalid JSON input")
+            return None
+        timer.mark("parse")
 
         # Validate input
         validated_input = validate_input(data)
         if validated_input is None:
+            metrics.FAILED_INVALID_INPUT.inc()
             return None
+        timer.mark("validate")
+
+        # Look up the precomputed output
+        if table is not None:
+            output = table.render(validated_input)
+            timer.mark("calculate")
+            if codec is not None:
+                output = output.encode()
+                timer.mark("serialize")
+            return output
 
         # Calculate supplement
         result = calculate_supplement(validated_input)
+        timer.mark("calculate")
 
         # Return JSON string
-        return json.dumps(result)
+        output = json.dumps(result) if codec is None else codec.encode(result)
+        timer.mark("serialize")
+        return output
 
-    except json.JSONDecodeError:
-        print("Invalid JSON input")
-        return None
     except Exception as e:
-        print(f"Processing error: {str(e)}")
-        return None
\ No newline at end of file
+        metrics.FAILED_ERROR.inc()
+        logger.exception("Processing error: %s", e)
+        return None
+
+# placeholder for batch items that couldn't be parsed
+_INVALID_JSON = object()
+
+# process many json strings at once and return their outputs in the same order
+# invalid items become BatchError records instead of aborting the batch
+def process_supplement_batch(
+    json_inputs: Iterable[Union[str, bytes]],
+    rates: Rates = DEFAULT_RATES
+) -> list[Union[str, BatchError]]:
+    return process_supplement_records((_parse_batch_item(json_input) for json_input in json_inputs), rates)
+
+def _parse_batch_item(json_input):
+    try:
+        return json.loads(json_input)
+    except (ValueError, TypeError):
+        return _INVALID_JSON
+
+# same as process_supplement_batch for records that are already parsed, e.g. CSV rows
+def process_supplement_records(records: Iterable[object], rates: Rates = DEFAULT_RATES) -> list[Union[str, BatchError]]:
+    results: list[Union[str, BatchError, None]] = []
+    # valid records are copied into columns so their dicts can be freed as the batch is read
+    columns = InputColumns()
+    rows = array("L")
+
+    for index, data in enumerate(records):
+        error = _batch_error(data)
+        if error is not None:
+            results.append(BatchError(index, error))
+        else:
+            results.append(None)
+            rows.append(index)
+            columns.append(data)
+
+    # outputs only depend on these three fields, so serialize each combination once
+    # and splice the id into the cached fragment
+    fragments: dict[tuple, str] = {}
+    ids, eligible, single, children = columns.ids, columns.eligible, columns.single, columns.children
+
+    for row, index in enumerate(rows):
+        key = (eligible[row], single[row], children[row])
+        fragment = fragments.get(key)
+        if fragment is None:
+            # the composition only matters as an exact "single" match
+            base_amount, children_amount, total_amount = supplement_amounts(
+                key[0], "single" if key[1] else "couple", key[2], rates
+            )
+            output = {
+                "isEligible": bool(key[0]),
+                "baseAmount": base_amount,
+                "childrenAmount": children_amount,
+                "supplementAmount": total_amount
+            }
+            fragment = fragments[key] = json.dumps(output)[1:]
+        results[index] = f'{{"id": {json.dumps(ids[row])}, {fragment}'
+
+    return results
+
+# returns why a batch item can't be processed, or None if it is valid
+# checks run in the same order as validate_input and the first failure is reported
+def _batch_error(data) -> Optional[str]:
+    if data is _INVALID_JSON:
+        return "Invalid JSON input"
+    if not isinstance(data, dict):
+        return "Input must be a JSON object"
+    if not REQUIRED_FIELDS <= data.keys():
+        return f"Missing required fields: {set(REQUIRED_FIELDS - data.keys())}"
+    for check in check_input.checks:
+        if not check.check(data[check.field]):
+            return check.message
+    return None
@@ -0,0 +1,116 @@
+import logging
+import mmap
+import os
+import struct
+import threading
+import zlib
+from pathlib import Path
+from typing import Iterator, Union
+
+logger = logging.getLogger(__name__)
+
+# payload length, crc32 of the rest of the record, topic length, content type length
+RECORD_HEADER = struct.Struct("<IIHH")
+
+SEGMENT_SUFFIX = ".seg"
+
+class Spool:
+    """Append-only log of results waiting to be published
+
+    Records are appended to numbered segment files in a directory, a new segment
+    is started once the current one reaches segment_size. Segments are read back
+    memory-mapped and removed once every record in them was published, so the
+    spool survives restarts and a crash only loses a partly written last record.
+    """
+
+    def __init__(self, directory, segment_size: int = 16 * 1024 * 1024, fsync: bool = False):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_size = segment_size
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._file = None
+        self._file_size = 0
+
+        existing = self._segment_paths()
+        self._next_segment = int(existing[-1].stem) + 1 if existing else 0
+        # records left by a previous run are counted so they're replayed too
+        self.pending = sum(1 for path in existing for _ in self.read(path))
+
+    def _segment_paths(self) -> list[Path]:
+        return sorted(self.directory.glob(f"*{SEGMENT_SUFFIX}"))
+
+    def append(self, topic: str, payload: Union[str, bytes], content_type: str = ""):
+        """Write a record to the current segment, content_type is kept for the replayed publish"""
+        topic_bytes = topic.encode()
+        content_type_bytes = content_type.encode()
+        if isinstance(payload, str):
+            payload = payload.encode()
+        body = topic_bytes + content_type_bytes + payload
+        record = RECORD_HEADER.pack(len(payload), zlib.crc32(body), len(topic_bytes), len(content_type_bytes)) + body
+
+        with self._lock:
+            if self._file is None or self._file_size >= self.segment_size:
+                self._roll()
+            self._file.write(record)
+            # flushed to the OS on every record so a crashed process loses nothing,
+            # fsync also covers the machine going down at the cost of a disk write
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._file_size += len(record)
+            self.pending += 1
+
+    def _roll(self):
+        if self._file is not None:
+            self._file.close()
+        path = self.directory / f"{self._next_segment:016d}{SEGMENT_SUFFIX}"
+        self._next_segment += 1
+        self._file = open(path, "ab")
+        self._file_size = 0
+
+    def segments(self) -> list[Path]:
+        """Close the current segment and return every segment in write order"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            return self._segment_paths()
+
+    def read(self, path) -> Iterator[tuple[str, bytes, str]]:
+        """Yield the (topic, payload, content type) records of a segment"""
+        with open(path, "rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                pos = 0
+                size = len(mm)
+                while pos + RECORD_HEADER.size <= size:
+                    payload_length, crc, topic_length, content_type_length = RECORD_HEADER.unpack_from(mm, pos)
+                    start = pos + RECORD_HEADER.size
+                    end = start + topic_length + content_type_length + payload_length
+                    if end > size:
+                        break
+                    body = mm[start:end]
+                    if zlib.crc32(body) != crc:
+                        break
+                    head = topic_length + content_type_length
+                    yield body[:topic_length].decode(), body[head:], body[topic_length:head].decode()
+                    pos = end
+                if pos < size:
+                    logger.warning("Ignoring %s bytes of a partly written record in %s", size - pos, path)
+
+    def remove(self, path, count: int):
+        """Delete a segment once its count records were published"""
+        os.unlink(path)
+        with self._lock:
+            self.pending -= count
+
+    def __len__(self):
+        return self.pending
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
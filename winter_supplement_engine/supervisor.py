@@ -0,0 +1,115 @@
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from winter_supplement_engine.config import EngineConfig, get_env_variable, load_dotenv
+from winter_supplement_engine.connections import DEFAULT_SHARED_GROUP
+from winter_supplement_engine.log import configure_logging
+
+logger = logging.getLogger(__name__)
+
+def run_worker():
+    """Run a single engine, used as the target of each worker process"""
+    # imported here so the supervisor itself never loads paho
+    from winter_supplement_engine.engine import WinterSupplementEngine
+
+    # the parent's log listener thread doesn't survive the fork
+    config = EngineConfig.from_env()
+    configure_logging(config=config)
+
+    # ctrl-c reaches the whole process group, let the supervisor decide when to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    engine = WinterSupplementEngine(config)
+    signal.signal(signal.SIGTERM, lambda signum, frame: engine.stop())
+    engine.start()
+
+class Supervisor:
+    """Runs engine worker processes that share one MQTT v5 shared subscription"""
+
+    def __init__(self, processes=None, target=run_worker, restart_delay=1.0, stop_timeout=10.0, poll_interval=0.5):
+        self.processes = processes or os.cpu_count() or 1
+        self.target = target
+        self.restart_delay = restart_delay
+        self.stop_timeout = stop_timeout
+        self.poll_interval = poll_interval
+
+        self.workers: dict[int, multiprocessing.Process] = {}
+        self.restarts = 0
+        self.stopping = False
+
+    def start_worker(self, slot):
+        process = multiprocessing.Process(target=self.target, name=f"engine-worker-{slot}")
+        process.start()
+        self.workers[slot] = process
+        logger.info("Started worker %s (pid %s)", slot, process.pid)
+
+    def check_workers(self):
+        """Restart any worker that exited while the supervisor is running"""
+        restarted = 0
+        for slot, process in list(self.workers.items()):
+            if process.is_alive() or self.stopping:
+                continue
+            logger.warning("Worker %s (pid %s) exited with code %s, restarting", slot, process.pid, process.exitcode)
+            process.close()
+            self.restarts += 1
+            restarted += 1
+            self.start_worker(slot)
+        return restarted
+
+    def run(self):
+        """Start the workers and supervise them until stopped"""
+        signal.signal(signal.SIGTERM, self.handle_signal)
+        signal.signal(signal.SIGINT, self.handle_signal)
+
+        for slot in range(self.processes):
+            self.start_worker(slot)
+
+        try:
+            while not self.stopping:
+                time.sleep(self.poll_interval)
+                # avoid a tight restart loop when workers crash on startup
+                if not self.stopping and self.check_workers():
+                    time.sleep(self.restart_delay)
+        finally:
+            self.shutdown()
+
+    def handle_signal(self, signum, frame):
+        logger.info("Received signal %s, stopping workers", signum)
+        self.stop()
+
+    def stop(self):
+        self.stopping = True
+
+    def shutdown(self):
+        """Ask every worker to exit and kill those that don't in time"""
+        self.stopping = True
+        for process in self.workers.values():
+            if process.is_alive():
+                process.terminate()
+
+        deadline = time.monotonic() + self.stop_timeout
+        for slot, process in self.workers.items():
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning("Worker %s (pid %s) did not stop in time, killing it", slot, process.pid)
+                process.kill()
+                process.join()
+        self.workers.clear()
+
+def main():
+    load_dotenv()
+
+    # every worker subscribes through the same shared subscription group
+    os.environ.setdefault("MQTT_SHARED_GROUP", DEFAULT_SHARED_GROUP)
+    # checked once here so bad settings stop the supervisor instead of crash looping its workers
+    configure_logging(config=EngineConfig.from_env())
+    processes = get_env_variable("ENGINE_PROCESSES", int, required=False)
+
+    supervisor = Supervisor(processes)
+    supervisor.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import json
+import logging
+import os
+import threading
+from typing import Optional, Union
+from winter_supplement_engine import metrics
+from winter_supplement_engine.rates import RateWatcher, load_rates
+from winter_supplement_engine.rules import (
+    calculate_supplement,
+    process_supplement_request,
+    Rates,
+    WinterSupplementInput,
+    DEFAULT_RATES,
+    FAMILY_COMPOSITIONS,
+    MAX_CHILDREN
+)
+
+logger = logging.getLogger(__name__)
+
+class SupplementTable:
+    """Precomputed JSON output for every combination of inputs the calculation depends on"""
+
+    def __init__(self, rates: Rates = DEFAULT_RATES):
+        self.rates = rates
+        self.hits = 0
+        self.misses = 0
+
+        # the output only depends on eligibility, composition and number of children
+        # so every possible result is serialized once, without the id
+        self._fragments: dict[tuple, str] = {}
+        for is_eligible in (True, False):
+            for family_composition in FAMILY_COMPOSITIONS:
+                for number_of_children in range(MAX_CHILDREN + 1):
+                    key = (is_eligible, family_composition, number_of_children)
+                    self._fragments[key] = self._build_fragment(is_eligible, family_composition, number_of_children)
+
+    def _build_fragment(self, is_eligible, family_composition, number_of_children) -> str:
+        output = calculate_supplement({
+            "id": "",
+            "numberOfChildren": number_of_children,
+            "familyComposition": family_composition,
+            "familyUnitInPayForDecember": is_eligible
+        }, self.rates)
+        del output["id"]
+        # drop the opening brace so the id can be spliced in front
+        return json.dumps(output)[1:]
+
+    def render(self, data: WinterSupplementInput) -> str:
+        """Return the serialized output for a validated input"""
+        key = (data['familyUnitInPayForDecember'], data['familyComposition'], data['numberOfChildren'])
+        fragment = self._fragments.get(key)
+        if fragment is None:
+            # inputs outside the table (e.g. "Single") are calculated on the fly
+            self.misses += 1
+            fragment = self._build_fragment(*key)
+        else:
+            self.hits += 1
+
+        # same output as json.dumps(calculate_supplement(data, self.rates))
+        return f'{{"id": {json.dumps(data["id"])}, {fragment}'
+
+    def stats(self) -> dict:
+        """Return the rates version, table size and lookup hit/miss counts"""
+        return {"version": self.rates.version, "size": len(self._fragments), "hits": self.hits, "misses": self.misses}
+
+# the table is built once per process, worker processes get their own copy
+_default_table: Optional[SupplementTable] = None
+_rate_watcher: Optional[RateWatcher] = None
+_default_table_lock = threading.Lock()
+
+# where the process-wide table loads its rates from, see configure_default_table()
+_rates_file: Optional[str] = None
+_reload_interval = 1.0
+
+def configure_default_table(rates_file: Optional[str] = None, reload_interval: float = 1.0):
+    """Set the RATES_FILE and RATES_RELOAD_INTERVAL of the process-wide table, rebuilding it if they changed"""
+    global _rates_file, _reload_interval, _default_table, _rate_watcher
+    with _default_table_lock:
+        if (rates_file, reload_interval) == (_rates_file, _reload_interval):
+            return
+        _rates_file, _reload_interval = rates_file, reload_interval
+        if _rate_watcher is not None:
+            _rate_watcher.stop()
+            _rate_watcher = None
+        _default_table = None
+
+def get_default_table() -> SupplementTable:
+    """Return the process-wide table, built from the rate file when one is configured"""
+    table = _default_table
+    if table is None:
+        with _default_table_lock:
+            if _default_table is None:
+                _load_default_table()
+            table = _default_table
+    return table
+
+def set_default_table(table: SupplementTable):
+    """Swap the process-wide table, messages already being processed keep the old one"""
+    global _default_table
+    previous = _default_table
+    _default_table = table
+    if previous is not None and previous.rates != table.rates:
+        logger.info("Rates changed from version %s to %s", previous.rates.version, table.rates.version)
+
+def _load_default_table():
+    global _rate_watcher
+    rates_file = _rates_file
+    if rates_file is None:
+        set_default_table(SupplementTable())
+        return
+
+    set_default_table(SupplementTable(load_rates(rates_file)))
+    logger.info("Loaded rates version %s from %s", _default_table.rates.version, rates_file)
+
+    # the new table is built on the watcher thread and swapped in with one assignment,
+    # so a reload never blocks or recompiles on the message path
+    interval = _reload_interval
+    if interval > 0:
+        _rate_watcher = RateWatcher(rates_file, _reload_rates, interval).start()
+
+def _reload_rates(rates: Rates):
+    set_default_table(SupplementTable(rates))
+    metrics.RATE_RELOADS.inc()
+
+def _reset_after_fork():
+    # threads don't survive a fork, so forked workers load the table and start their own watcher
+    global _default_table, _rate_watcher, _default_table_lock
+    _default_table = None
+    _rate_watcher = None
+    _default_table_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+# process a request using the process-wide table, used by the engine's worker pool
+def process_with_table(json_input: Union[str, bytes], codec=None) -> Optional[Union[str, bytes]]:
+    return process_supplement_request(json_input, table=get_default_table(), codec=codec)
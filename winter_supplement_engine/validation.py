@@ -0,0 +1,94 @@
+from dataclasses import dataclass
+from typing import Annotated, Any, Callable, Literal, get_args, get_origin, get_type_hints
+
+# metadata for Annotated int fields that must fall within an inclusive range
+@dataclass(frozen=True)
+class Range:
+    minimum: int
+    maximum: int
+
+# a single problem found while validating an input
+@dataclass(frozen=True)
+class ValidationError:
+    field: str
+    message: str
+
+    def __str__(self):
+        return self.message
+
+# check for a single field, compiled from its type annotation
+@dataclass(frozen=True)
+class FieldCheck:
+    field: str
+    check: Callable[[Any], bool]
+    message: str
+
+class Validator:
+    """Validator compiled once from a TypedDict, returns errors instead of raising"""
+
+    def __init__(self, checks: list[FieldCheck]):
+        self.checks = checks
+        self.required_fields = frozenset(check.field for check in checks)
+
+    def __call__(self, data: Any) -> list[ValidationError]:
+        if not isinstance(data, dict):
+            return [ValidationError("", "Input must be a JSON object")]
+
+        # make sure all fields are present before checking their values
+        if not self.required_fields <= data.keys():
+            return [
+                ValidationError(field, f"Missing required field: {field}")
+                for field in self.required_fields - data.keys()
+            ]
+
+        # single pass over the compiled checks
+        return [
+            ValidationError(check.field, check.message)
+            for check in self.checks
+            if not check.check(data[check.field])
+        ]
+
+def _compile_field(field: str, annotation: Any) -> FieldCheck:
+    # unwrap Annotated[...] and keep its metadata
+    metadata = ()
+    if get_origin(annotation) is Annotated:
+        annotation, *metadata = get_args(annotation)
+    ranges = [item for item in metadata if isinstance(item, Range)]
+
+    if get_origin(annotation) is Literal:
+        # string literals are matched case insensitively
+        choices = get_args(annotation)
+        allowed = frozenset(choice.lower() for choice in choices)
+        described = " or ".join(f"'{choice}'" for choice in choices)
+        return FieldCheck(
+            field,
+            lambda value: isinstance(value, str) and value.lower() in allowed,
+            f"{field} must be either {described}"
+        )
+
+    if annotation is bool:
+        return FieldCheck(field, lambda value: isinstance(value, bool), f"{field} must be a boolean")
+
+    if annotation is int:
+        if not ranges:
+            return FieldCheck(field, lambda value: isinstance(value, int), f"{field} must be an integer")
+        minimum, maximum = ranges[0].minimum, ranges[0].maximum
+        if minimum == 0:
+            message = f"{field} must be a non-negative integer not exceeding {maximum}"
+        else:
+            message = f"{field} must be an integer between {minimum} and {maximum}"
+        return FieldCheck(
+            field,
+            lambda value: isinstance(value, int) and minimum <= value <= maximum,
+            message
+        )
+
+    if annotation is str:
+        return FieldCheck(field, lambda value: isinstance(value, str), f"{field} must be a string")
+
+    raise TypeError(f"Unsupported annotation for {field}: {annotation!r}")
+
+def compile_validator(typed_dict: type) -> Validator:
+    """Build a validator from a TypedDict's annotations"""
+    hints = get_type_hints(typed_dict, include_extras=True)
+    return Validator([_compile_field(field, annotation) for field, annotation in hints.items()])
@@ -0,0 +1,43 @@
+from typing import Iterable
+
+try:
+    import numpy as np
+except ImportError as e:
+    raise ImportError(
+        "The vectorized kernel requires numpy, install it with `poetry install --extras vectorized`"
+    ) from e
+
+from winter_supplement_engine.rules import DEFAULT_RATES, Rates
+
+# integer codes used for the familyComposition column
+COMPOSITION_SINGLE = 0
+COMPOSITION_COUPLE = 1
+
+def encode_compositions(family_compositions: Iterable[str]) -> "np.ndarray":
+    """Convert familyComposition strings into composition codes"""
+    # calculate_supplement only gives the single rate on an exact "single" match,
+    # so anything else is encoded as a couple to keep results identical
+    values = np.asarray(list(family_compositions), dtype=object)
+    return np.where(values == "single", COMPOSITION_SINGLE, COMPOSITION_COUPLE).astype(np.int8)
+
+# calculates the supplement for whole columns of validated inputs in one pass
+# returns the baseAmount, childrenAmount and supplementAmount arrays
+def calculate_supplement_arrays(number_of_children, family_composition, family_unit_in_pay_for_december,
+                                rates: Rates = DEFAULT_RATES):
+    children = np.asarray(number_of_children, dtype=np.int64)
+    single = np.asarray(family_composition) == COMPOSITION_SINGLE
+    eligible = np.asarray(family_unit_in_pay_for_december, dtype=bool)
+
+    if not (children.shape == single.shape == eligible.shape):
+        raise ValueError("Input arrays must all have the same shape")
+
+    # same branches as calculate_supplement, evaluated for every record at once
+    base_amount = np.where(single & (children == 0), rates.single_base_amount, rates.family_base_amount)
+    children_amount = np.where(children > 0, rates.child_amount * children, 0.0)
+
+    # ineligible records get zeros
+    base_amount = np.where(eligible, base_amount, 0.0)
+    children_amount = np.where(eligible, children_amount, 0.0)
+    supplement_amount = base_amount + children_amount
+
+    return base_amount, children_amount, supplement_amount
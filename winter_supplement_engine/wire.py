@@ -0,0 +1,155 @@
+"""Compact binary encoding of WinterSupplementInput and WinterSupplementOutput records.
+
+A payload is a record count followed by that many fixed-layout records, so a
+single request and a whole batch share one format:
+
+    payload = count:uint32 record*
+    input   = id_length:uint16 eligible:uint8 composition:uint8 children:uint8 id
+    output  = id_length:uint16 status:uint8 eligible:uint8 base:float64 children:float64 supplement:float64 id
+
+Integers are little-endian, ids are UTF-8 and composition is 0 for single and 1
+for couple. Outputs are in input order, a record that fails validation gets
+status 1 and zero amounts so the others still line up with their inputs.
+"""
+import struct
+from functools import lru_cache
+from typing import Iterable, Optional, Union
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+from winter_supplement_engine import metrics
+from winter_supplement_engine.log import message_log
+from winter_supplement_engine.rules import (
+    DEFAULT_RATES,
+    FAMILY_COMPOSITIONS,
+    MAX_CHILDREN,
+    Rates,
+    WinterSupplementInput,
+    WinterSupplementOutput,
+    supplement_amounts
+)
+
+# MQTT v5 content type of binary requests and their replies
+CONTENT_TYPE = "application/vnd.winter-supplement.v1"
+
+# user property that also selects the binary format, for clients that can't set a content type
+FORMAT_PROPERTY = ("format", "binary")
+
+COUNT = struct.Struct("<I")
+INPUT = struct.Struct("<HBBB")
+OUTPUT = struct.Struct("<HBB3d")
+ID_LENGTH = struct.Struct("<H")
+
+STATUS_OK = 0
+STATUS_INVALID = 1
+
+# properties every binary reply is published with, built once and shared
+REPLY_PROPERTIES = Properties(PacketTypes.PUBLISH)
+REPLY_PROPERTIES.ContentType = CONTENT_TYPE
+
+# the output record tail for an invalid input, everything after the id length
+_INVALID_TAIL = OUTPUT.pack(0, STATUS_INVALID, 0, 0.0, 0.0, 0.0)[ID_LENGTH.size:]
+
+def is_binary(properties) -> bool:
+    """Return whether a message's properties ask for the binary format"""
+    # MQTT v3 messages have no properties
+    if not isinstance(properties, Properties):
+        return False
+    if getattr(properties, "ContentType", None) == CONTENT_TYPE:
+        return True
+    return FORMAT_PROPERTY in getattr(properties, "UserProperty", ())
+
+def encode_inputs(records: Iterable[WinterSupplementInput]) -> bytes:
+    """Pack input records into one payload"""
+    parts = []
+    for record in records:
+        id_bytes = record["id"].encode()
+        parts.append(INPUT.pack(
+            len(id_bytes),
+            record["familyUnitInPayForDecember"],
+            FAMILY_COMPOSITIONS.index(record["familyComposition"]),
+            record["numberOfChildren"]
+        ))
+        parts.append(id_bytes)
+    return COUNT.pack(len(parts) // 2) + b"".join(parts)
+
+def decode_outputs(payload: bytes) -> list[Optional[WinterSupplementOutput]]:
+    """Unpack a reply, with None for records that failed validation"""
+    view = memoryview(payload)
+    count, = COUNT.unpack_from(view)
+    pos = COUNT.size
+    outputs = []
+    for _ in range(count):
+        id_length, status, is_eligible, base_amount, children_amount, supplement_amount = OUTPUT.unpack_from(view, pos)
+        pos += OUTPUT.size
+        record_id = bytes(view[pos:pos + id_length]).decode()
+        pos += id_length
+        if status != STATUS_OK:
+            outputs.append(None)
+            continue
+        outputs.append({
+            "id": record_id,
+            "isEligible": bool(is_eligible),
+            "baseAmount": base_amount,
+            "childrenAmount": children_amount,
+            "supplementAmount": supplement_amount
+        })
+    return outputs
+
+@lru_cache(maxsize=4)
+def _output_tails(rates: Rates) -> dict[tuple[int, int, int], bytes]:
+    # every valid output record after its id length, keyed by the packed input fields
+    tails = {}
+    for is_eligible in (0, 1):
+        for composition, family_composition in enumerate(FAMILY_COMPOSITIONS):
+            for number_of_children in range(MAX_CHILDREN + 1):
+                amounts = supplement_amounts(is_eligible, family_composition, number_of_children, rates)
+                record = OUTPUT.pack(0, STATUS_OK, is_eligible, *amounts)
+                tails[is_eligible, composition, number_of_children] = record[ID_LENGTH.size:]
+    return tails
+
+def process_binary_request(payload: Union[bytes, bytearray], rates: Rates = DEFAULT_RATES) -> Optional[bytes]:
+    """Answer a binary payload of one or more inputs, None if it can't be decoded"""
+    timer = metrics.stage_timer()
+    tails = _output_tails(rates)
+    view = memoryview(payload)
+    try:
+        count, = COUNT.unpack_from(view)
+        pos = COUNT.size
+        parts = [COUNT.pack(count)]
+        invalid = 0
+        for _ in range(count):
+            id_length, is_eligible, composition, number_of_children = INPUT.unpack_from(view, pos)
+            pos += INPUT.size
+            id_bytes = bytes(view[pos:pos + id_length])
+            if len(id_bytes) != id_length:
+                raise ValueError("Truncated record")
+            pos += id_length
+
+            # the fixed layout already rules out missing fields and wrong types,
+            # what's left is out of range values and ids that aren't UTF-8
+            tail = tails.get((is_eligible, composition, number_of_children))
+            if tail is not None:
+                try:
+                    id_bytes.decode()
+                except UnicodeDecodeError:
+                    tail = None
+            if tail is None:
+                invalid += 1
+                tail = _INVALID_TAIL
+            parts.append(ID_LENGTH.pack(id_length))
+            parts.append(tail)
+            parts.append(id_bytes)
+        if pos != len(view):
+            raise ValueError("Trailing bytes after the last record")
+    except (struct.error, ValueError) as e:
+        metrics.FAILED_INVALID_BINARY.inc()
+        message_log.info("Invalid binary input: %s", e)
+        return None
+    timer.mark("parse")
+
+    if invalid:
+        metrics.FAILED_INVALID_INPUT.inc(invalid)
+        message_log.info("%s of %s binary records failed validation", invalid, count)
+    output = b"".join(parts)
+    timer.mark("serialize")
+    return output
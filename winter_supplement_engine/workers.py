@@ -0,0 +1,94 @@
+import logging
+import threading
+from concurrent.futures import BrokenExecutor, Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# the pool modes the engine can be configured with
+WORKER_MODES = ("thread", "process")
+
+class WorkerPool:
+    """Bounded pool that runs message processing off paho's network thread"""
+
+    def __init__(self, mode: str = "thread", workers: Optional[int] = None, queue_size: Optional[int] = None,
+                 initializer: Optional[Callable] = None, initargs: tuple = ()):
+        if mode not in WORKER_MODES:
+            raise ValueError(f"Invalid worker mode: {mode} (expected one of {', '.join(WORKER_MODES)})")
+        self.mode = mode
+        self._max_workers = workers
+        # run once in each worker process, e.g. to point it at the same rate file
+        self._initializer = initializer
+        self._initargs = initargs
+        self.executor = self._create_executor()
+        self.workers = self.executor._max_workers
+        self.restarts = 0
+        self._restart_lock = threading.Lock()
+
+        # number of payloads allowed to be queued or in progress at once
+        # defaults to two per worker so workers never sit idle between messages
+        self.queue_size = queue_size if queue_size is not None else self.workers * 2
+        if self.queue_size < 1:
+            raise ValueError(f"Invalid queue size: {self.queue_size}")
+        self._slots = threading.BoundedSemaphore(self.queue_size)
+
+    def _create_executor(self):
+        if self.mode == "thread":
+            return ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="supplement-worker")
+        # multiprocessing is only imported when a process pool is configured
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        from winter_supplement_engine.log import worker_logging
+        # forking would copy the locks held by the log listener and network threads,
+        # workers are started from a clean process instead
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        context = multiprocessing.get_context(method)
+        initializers = [worker_logging(context), (self._initializer, self._initargs)]
+        return ProcessPoolExecutor(
+            max_workers=self._max_workers, mp_context=context, initializer=run_initializers,
+            initargs=([(fn, args) for fn, args in initializers if fn is not None],)
+        )
+
+    def submit(self, fn: Callable[[Any], Any], payload: Any, callback: Callable[[Future], None]) -> None:
+        """Queue a payload for processing, blocking while the pool is full"""
+        # blocking here stalls the caller (paho's network loop), which stops reading
+        # from the socket and pushes backpressure to the broker instead of buffering
+        self._slots.acquire()
+        try:
+            executor = self.executor
+            try:
+                future = executor.submit(fn, payload)
+            except BrokenExecutor:
+                # a process pool refuses all work once a child died, e.g. killed for memory,
+                # the payloads it held fail with BrokenProcessPool and the rest go to a new pool
+                future = self._restart(executor).submit(fn, payload)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda done: self._complete(done, callback))
+
+    def _restart(self, broken):
+        """Replace a broken executor, once however many threads found it broken"""
+        with self._restart_lock:
+            if self.executor is broken:
+                logger.error("A worker process died, restarting the %s pool", self.mode)
+                broken.shutdown(wait=False)
+                self.executor = self._create_executor()
+                self.restarts += 1
+            return self.executor
+
+    def _complete(self, future: Future, callback: Callable[[Future], None]) -> None:
+        try:
+            callback(future)
+        finally:
+            # free the slot only once the result has been handed off
+            self._slots.release()
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop accepting work and optionally wait for queued payloads to finish"""
+        self.executor.shutdown(wait=wait)
+
+def run_initializers(initializers):
+    """Run in each new worker process, calling every (initializer, initargs) pair in order"""
+    for initializer, initargs in initializers:
+        initializer(*initargs)